@@ -2,6 +2,7 @@ from pathlib import Path
 import os
 from typing import List
 import environ
+from corsheaders.defaults import default_headers
 
 # Caminhos
 BASE_DIR = Path(__file__).resolve().parent.parent  # .../backend
@@ -55,7 +56,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    
+    "core.shards.ShardMiddleware",
 ]
 
 # CORS_ALLOWED_ORIGINS = [
@@ -64,6 +65,7 @@ MIDDLEWARE = [
 # ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
 
 
 
@@ -100,6 +102,36 @@ DATABASES = {
     }
 }
 
+# Sharding por usuário (core/shards.py). SHARD_DATABASES lista os bancos
+# dos shards, no mesmo servidor e com as mesmas credenciais do default,
+# que passa a ser só o diretório. Vazio: tudo fica no default.
+SHARD_DATABASES: List[str] = get_csv("SHARD_DATABASES")
+for _indice, _nome in enumerate(SHARD_DATABASES):
+    DATABASES[f"shard_{_indice}"] = {**DATABASES["default"], "NAME": _nome}
+SHARDS: List[str] = [f"shard_{i}" for i in range(len(SHARD_DATABASES))] or ["default"]
+DATABASE_ROUTERS = ["core.shards.ShardRouter"]
+# Segundos que o rebalanceamento espera as escritas em andamento de um
+# usuário terminarem antes de copiar os dados dele.
+SHARD_ESPERA_MIGRACAO_SEG: float = float(os.getenv("SHARD_ESPERA_MIGRACAO_SEG", "2"))
+
+# Cache (análises, volume semanal). As invalidações saem tanto da API
+# quanto do worker do outbox, então o cache precisa ser o mesmo para os
+# dois containers: por padrão, a tabela cache_api do banco default
+# (db/init/01_schema.sql). Dá para trocar por redis/memcached com
+# CACHE_BACKEND/CACHE_LOCATION.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.db.DatabaseCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", "cache_api"),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "200000")),
+            "CULL_FREQUENCY": 4,
+        },
+    }
+}
+
 # Localização / Tempo
 LANGUAGE_CODE = "pt-br"
 TIME_ZONE: str = os.getenv("DJANGO_TIME_ZONE", "America/Recife")
@@ -113,6 +145,9 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 # Padrões
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Aplica db/init/*.sql nos bancos de teste (os modelos são unmanaged).
+TEST_RUNNER = "core.tests.runner.SchemaSQLRunner"
+
 REST_FRAMEWORK = {
     "DEFAULT_RENDERER_CLASSES": [
         "rest_framework.renderers.JSONRenderer",
@@ -123,8 +158,44 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    # Proxies reversos confiáveis na frente da API: o IP do throttling é o
+    # que o último deles viu no X-Forwarded-For. 0 = REMOTE_ADDR (o
+    # cabeçalho, que o cliente controla, é ignorado).
+    "NUM_PROXIES": int(os.getenv("THROTTLE_NUM_PROXIES", "0")),
+    "DEFAULT_THROTTLE_RATES": {
+        "auth_ip": os.getenv("THROTTLE_AUTH_IP", "30/min"),
+        "auth_email": os.getenv("THROTTLE_AUTH_EMAIL", "10/min"),
+        "auth_conta": os.getenv("THROTTLE_AUTH_CONTA", "50/hour"),
+    },
 }
 
+# Throttling (buckets compartilhados entre workers do mesmo host)
+THROTTLE_SHM_PATH: str = os.getenv("THROTTLE_SHM_PATH", "")
+THROTTLE_SHM_SLOTS: int = int(os.getenv("THROTTLE_SHM_SLOTS", "8192"))
+
+# E-mails com acesso aos relatórios de ops/admin (/api/relatorios/...).
+RELATORIOS_EMAILS: set[str] = {
+    email.strip().lower()
+    for email in os.getenv("RELATORIOS_EMAILS", "").split(",")
+    if email.strip()
+}
+
+# Dias que as lápides da sincronização (GET /api/sync/) são mantidas;
+# cursores mais antigos precisam de uma sincronização completa.
+SYNC_RETENCAO_EXCLUSOES_DIAS: int = int(os.getenv("SYNC_RETENCAO_EXCLUSOES_DIAS", "30"))
+
+# Peso usado na estimativa de calorias (core/calorias.py) de quem não
+# cadastrou o seu.
+CALORIAS_PESO_PADRAO_KG: float = float(os.getenv("CALORIAS_PESO_PADRAO_KG", "70"))
+
+# FC máxima usada nas zonas dos sensores (core/sensores.py) de quem não
+# cadastrou a sua.
+SENSORES_FC_MAXIMA_PADRAO: int = int(os.getenv("SENSORES_FC_MAXIMA_PADRAO", "190"))
+
+# Horas que a resposta de um POST com Idempotency-Key fica guardada para
+# repetições do app (core/idempotencia.py).
+IDEMPOTENCIA_TTL_HORAS: int = int(os.getenv("IDEMPOTENCIA_TTL_HORAS", "24"))
+
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", SECRET_KEY)
 JWT_ALGORITHM = "HS256"
 JWT_ACCESS_TOKEN_LIFETIME_MINUTES = int(
@@ -0,0 +1,394 @@
+"""
+Análise de tendências de corrida e ciclismo.
+
+As métricas do usuário são carregadas em uma única query que devolve cada
+coluna já agregada como array (array_agg), e toda a agregação semanal,
+mensal, médias móveis e tendência é feita de forma vetorizada com NumPy.
+Os resultados ficam em cache por usuário e são invalidados nas escritas
+de sessões e métricas (veja `invalidar_analise`), depois do commit do
+shard: o cache fica no banco default e confirma sozinho, então uma leitura
+entre a invalidação e o commit regravaria os dados antigos.
+"""
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Any, Optional
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ModalidadeChoices
+from . import shards
+
+CACHE_TIMEOUT = 24 * 60 * 60
+JANELA_MEDIA_MOVEL = 4
+
+# Para o ritmo (seg/km) a média é ponderada pela distância; para a
+# velocidade (km/h) a média é distância total / tempo total.
+CONFIG_MODALIDADE = {
+    ModalidadeChoices.CORRIDA: {
+        "tabela": "metricas_corrida",
+        "coluna": "ritmo_medio_seg_km",
+    },
+    ModalidadeChoices.CICLISMO: {
+        "tabela": "metricas_ciclismo",
+        "coluna": "velocidade_media_kmh",
+    },
+}
+
+
+# ---------- CACHE ----------
+
+
+def _chave_versao(usuario_id: int) -> str:
+    return f"analise:{usuario_id}:versao"
+
+
+def _versao(usuario_id: int) -> int:
+    versao = cache.get(_chave_versao(usuario_id))
+    if versao is None:
+        versao = time.time_ns()
+        cache.set(_chave_versao(usuario_id), versao, None)
+    return versao
+
+
+def _depois_do_commit(funcao) -> None:
+    # Fora de uma transação do shard ativo, roda na hora.
+    transaction.on_commit(funcao, using=shards.alias_atual())
+
+
+def invalidar_analise(usuario_id: int) -> None:
+    """
+    Troca a versão das análises do usuário; as entradas antigas deixam de
+    ser lidas e expiram sozinhas.
+    """
+    _depois_do_commit(lambda: cache.set(_chave_versao(usuario_id), time.time_ns(), None))
+
+
+def em_cache(usuario_id: int, nome: str, calcular, *partes) -> Any:
+    chave = ":".join(
+        ["analise", str(usuario_id), str(_versao(usuario_id)), nome]
+        + [str(p) for p in partes]
+    )
+    resultado = cache.get(chave)
+    if resultado is None:
+        resultado = calcular()
+        cache.set(chave, resultado, CACHE_TIMEOUT)
+    return resultado
+
+
+# ---------- CARGA ----------
+
+
+def _inicio_do_dia(dia: date) -> datetime:
+    return timezone.make_aware(datetime.combine(dia, dtime.min))
+
+
+def _carregar_colunas(
+    usuario_id: int,
+    modalidade: str,
+    data_inicio: Optional[date],
+    data_fim: Optional[date],
+) -> dict[str, np.ndarray]:
+    config = CONFIG_MODALIDADE[modalidade]
+    filtros = ["s.usuario_id = %s"]
+    params: list[Any] = [settings.TIME_ZONE, usuario_id]
+
+    if data_inicio:
+        filtros.append("s.inicio_em >= %s")
+        params.append(_inicio_do_dia(data_inicio))
+    if data_fim:
+        filtros.append("s.inicio_em < %s")
+        params.append(_inicio_do_dia(data_fim + timedelta(days=1)))
+
+    sql = f"""
+        SELECT
+          array_agg(((s.inicio_em AT TIME ZONE %s)::date - DATE '1970-01-01')
+                    ORDER BY s.inicio_em),
+          array_agg(m.distancia_km::float8 ORDER BY s.inicio_em),
+          array_agg(m.{config["coluna"]}::float8 ORDER BY s.inicio_em),
+          array_agg(m.fc_media::float8 ORDER BY s.inicio_em)
+        FROM {config["tabela"]} m
+        JOIN sessoes_atividade s ON s.id = m.sessao_id
+        WHERE {" AND ".join(filtros)}
+    """
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(sql, params)
+        dias, distancia, valor, fc = cursor.fetchone()
+
+    return {
+        "dias": np.asarray(dias or [], dtype=np.int64),
+        "distancia": np.asarray(distancia or [], dtype=np.float64),
+        # None vira NaN
+        "valor": np.asarray(valor or [], dtype=np.float64),
+        "fc": np.asarray(fc or [], dtype=np.float64),
+    }
+
+
+# ---------- AGREGAÇÃO ----------
+
+
+def _razao(numerador: np.ndarray, denominador: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominador > 0, numerador / denominador, np.nan)
+
+
+def _somas_por_grupo(indices: np.ndarray, n: int, colunas: dict, modalidade: str) -> dict:
+    """Somas por grupo (bincount) que compõem cada média."""
+    distancia, valor, fc = colunas["distancia"], colunas["valor"], colunas["fc"]
+
+    valido = ~np.isnan(valor) & (valor > 0)
+    if modalidade == ModalidadeChoices.CORRIDA:
+        numerador = np.where(valido, distancia * np.nan_to_num(valor), 0.0)
+        denominador = np.where(valido, distancia, 0.0)
+    else:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            horas = np.where(valido, distancia / valor, 0.0)
+        numerador = np.where(valido, distancia, 0.0)
+        denominador = horas
+
+    tem_fc = ~np.isnan(fc)
+    return {
+        "sessoes": np.bincount(indices, minlength=n).astype(np.float64),
+        "distancia": np.bincount(indices, weights=distancia, minlength=n),
+        "numerador": np.bincount(indices, weights=numerador, minlength=n),
+        "denominador": np.bincount(indices, weights=denominador, minlength=n),
+        "fc_soma": np.bincount(indices[tem_fc], weights=fc[tem_fc], minlength=n),
+        "fc_n": np.bincount(indices[tem_fc], minlength=n).astype(np.float64),
+    }
+
+
+def _janela(valores: np.ndarray, tamanho: int) -> np.ndarray:
+    """Soma móvel (janela terminando em cada posição)."""
+    acumulado = np.concatenate(([0.0], np.cumsum(valores)))
+    fim = np.arange(1, len(valores) + 1)
+    inicio = np.maximum(fim - tamanho, 0)
+    return acumulado[fim] - acumulado[inicio]
+
+
+def _inclinacao(x: np.ndarray, y: np.ndarray) -> float:
+    """Coeficiente angular da reta de mínimos quadrados (NaN se < 2 pontos)."""
+    mascara = ~np.isnan(y)
+    if mascara.sum() < 2:
+        return np.nan
+    return float(np.polyfit(x[mascara], y[mascara], 1)[0])
+
+
+def _numero(valor) -> Optional[float]:
+    valor = float(valor)
+    # "+ 0.0" evita devolver -0.0
+    return None if np.isnan(valor) else round(valor, 2) + 0.0
+
+
+def _linhas(inicios, somas: dict, campo: str, extras: Optional[dict] = None) -> list[dict]:
+    media = _razao(somas["numerador"], somas["denominador"])
+    fc = _razao(somas["fc_soma"], somas["fc_n"])
+    extras = extras or {}
+
+    linhas = []
+    for i, inicio in enumerate(inicios):
+        linha = {
+            "inicio": str(inicio),
+            "sessoes": int(somas["sessoes"][i]),
+            "distancia_km": _numero(somas["distancia"][i]),
+            campo: _numero(media[i]),
+            "fc_media": _numero(fc[i]),
+        }
+        for nome, valores in extras.items():
+            linha[nome] = _numero(valores[i])
+        linhas.append(linha)
+    return linhas
+
+
+def calcular_tendencias(
+    usuario_id: int,
+    modalidade: str,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+) -> dict:
+    colunas = _carregar_colunas(usuario_id, modalidade, data_inicio, data_fim)
+    campo = CONFIG_MODALIDADE[modalidade]["coluna"]
+    resultado: dict[str, Any] = {
+        "modalidade": modalidade,
+        "semanal": [],
+        "mensal": [],
+        "tendencia": {"distancia_km_por_semana": None, f"{campo}_por_semana": None},
+    }
+
+    dias = colunas["dias"]
+    if dias.size == 0:
+        return resultado
+
+    # Semanas começando na segunda-feira (1970-01-01 foi uma quinta).
+    semanas = (dias + 3) // 7
+    primeira = semanas.min()
+    n_semanas = int(semanas.max() - primeira + 1)
+    por_semana = _somas_por_grupo(semanas - primeira, n_semanas, colunas, modalidade)
+    inicios_semana = (
+        np.arange(primeira, primeira + n_semanas) * 7 - 3
+    ).astype("datetime64[D]")
+
+    janela = {nome: _janela(v, JANELA_MEDIA_MOVEL) for nome, v in por_semana.items()}
+    resultado["semanal"] = _linhas(
+        inicios_semana,
+        por_semana,
+        campo,
+        extras={
+            "distancia_km_media_4s": janela["distancia"] / np.minimum(
+                np.arange(1, n_semanas + 1), JANELA_MEDIA_MOVEL
+            ),
+            f"{campo}_4s": _razao(janela["numerador"], janela["denominador"]),
+        },
+    )
+
+    meses = dias.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    primeiro_mes = meses.min()
+    n_meses = int(meses.max() - primeiro_mes + 1)
+    por_mes = _somas_por_grupo(meses - primeiro_mes, n_meses, colunas, modalidade)
+    inicios_mes = np.arange(primeiro_mes, primeiro_mes + n_meses).astype(
+        "datetime64[M]"
+    ).astype("datetime64[D]")
+    resultado["mensal"] = _linhas(inicios_mes, por_mes, campo)
+
+    x = np.arange(n_semanas, dtype=np.float64)
+    resultado["tendencia"] = {
+        "distancia_km_por_semana": _numero(_inclinacao(x, por_semana["distancia"])),
+        f"{campo}_por_semana": _numero(
+            _inclinacao(x, _razao(por_semana["numerador"], por_semana["denominador"]))
+        ),
+    }
+    return resultado
+
+
+def tendencias_em_cache(
+    usuario_id: int,
+    modalidade: str,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+) -> dict:
+    return em_cache(
+        usuario_id,
+        f"tendencias:{modalidade}",
+        lambda: calcular_tendencias(usuario_id, modalidade, data_inicio, data_fim),
+        data_inicio,
+        data_fim,
+    )
+
+
+# ---------- VOLUME POR GRUPO MUSCULAR ----------
+
+SEMANAS_PADRAO_VOLUME = 12
+# Cada semana pedida é uma chave de cache: o intervalo é limitado.
+SEMANAS_MAXIMO_VOLUME = 104
+
+_VOLUME_SQL = """
+    SELECT date_trunc('week', s.inicio_em AT TIME ZONE %s)::date AS semana,
+           e.grupo_muscular,
+           e.equipamento,
+           count(*),
+           COALESCE(sum(sm.repeticoes), 0),
+           COALESCE(sum(sm.carga_kg * sm.repeticoes), 0)
+    FROM series_musculacao sm
+    JOIN sessoes_atividade s ON s.id = sm.sessao_id
+    JOIN exercicios e ON e.id = sm.exercicio_id
+    WHERE s.usuario_id = %s AND s.inicio_em >= %s AND s.inicio_em < %s
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+"""
+
+
+def inicio_da_semana(dia: date) -> date:
+    return dia - timedelta(days=dia.weekday())
+
+
+def _chave_volume_versao(usuario_id: int) -> str:
+    return f"volume:{usuario_id}:versao"
+
+
+def _versao_volume(usuario_id: int) -> int:
+    # Sem a chave (cache recém-criado ou entrada descartada), uma versão
+    # nova: nunca volta a ler semanas gravadas antes de uma invalidação.
+    versao = cache.get(_chave_volume_versao(usuario_id))
+    if versao is None:
+        versao = time.time_ns()
+        cache.set(_chave_volume_versao(usuario_id), versao, None)
+    return versao
+
+
+def _chave_volume(usuario_id: int, versao: int, semana: date) -> str:
+    return f"volume:{usuario_id}:{versao}:{semana.isoformat()}"
+
+
+def invalidar_volume_semana(usuario_id: int, inicio_em: Optional[datetime]) -> None:
+    """Descarta só a semana (local) da sessão alterada."""
+    if inicio_em is None:
+        return
+    semana = inicio_da_semana(timezone.localtime(inicio_em).date())
+    _depois_do_commit(
+        lambda: cache.delete(_chave_volume(usuario_id, _versao_volume(usuario_id), semana))
+    )
+
+
+def invalidar_volume(usuario_id: int) -> None:
+    """Descarta todas as semanas do usuário (ex.: após uma importação)."""
+    _depois_do_commit(lambda: cache.set(_chave_volume_versao(usuario_id), time.time_ns(), None))
+
+
+def _calcular_volume(usuario_id: int, semanas: list[date]) -> dict[date, list[dict]]:
+    """Uma única query agrupada cobrindo o intervalo das semanas pedidas."""
+    resultado: dict[date, list[dict]] = {semana: [] for semana in semanas}
+    inicio = _inicio_do_dia(min(semanas))
+    fim = _inicio_do_dia(max(semanas) + timedelta(days=7))
+
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(_VOLUME_SQL, [settings.TIME_ZONE, usuario_id, inicio, fim])
+        for semana, grupo, equipamento, series, repeticoes, volume in cursor.fetchall():
+            if semana in resultado:
+                resultado[semana].append({
+                    "grupo_muscular": grupo,
+                    "equipamento": equipamento,
+                    "series": series,
+                    "repeticoes": repeticoes,
+                    "volume_kg": float(volume),
+                })
+    return resultado
+
+
+def volume_semanal(usuario_id: int, data_inicio: date, data_fim: date) -> list[dict]:
+    """
+    Volume por grupo muscular/equipamento em cada semana (segunda a
+    domingo) que toca o intervalo. Semanas já encerradas ficam em cache
+    sem expiração e só são descartadas quando uma sessão/série delas muda;
+    a semana corrente é sempre calculada.
+    """
+    semana_atual = inicio_da_semana(timezone.localdate())
+    semanas = []
+    semana = inicio_da_semana(data_inicio)
+    while semana <= data_fim:
+        semanas.append(semana)
+        semana += timedelta(days=7)
+
+    versao = _versao_volume(usuario_id)
+    chaves = {semana: _chave_volume(usuario_id, versao, semana) for semana in semanas}
+    guardados = cache.get_many([chaves[s] for s in semanas if s < semana_atual])
+    por_semana = {
+        semana: guardados[chaves[semana]]
+        for semana in semanas
+        if chaves[semana] in guardados
+    }
+
+    faltando = [semana for semana in semanas if semana not in por_semana]
+    if faltando:
+        calculado = _calcular_volume(usuario_id, faltando)
+        por_semana.update(calculado)
+        cache.set_many(
+            {chaves[s]: linhas for s, linhas in calculado.items() if s < semana_atual},
+            None,
+        )
+
+    return [
+        {"semana": semana.isoformat(), "grupos": por_semana[semana]}
+        for semana in semanas
+    ]
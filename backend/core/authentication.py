@@ -4,7 +4,9 @@ import jwt
 from django.conf import settings
 from rest_framework.authentication import BaseAuthentication
 from rest_framework import exceptions
+from rest_framework.permissions import SAFE_METHODS
 
+from . import shards
 from .models import Usuario
 
 
@@ -61,10 +63,14 @@ class JWTAuthentication(BaseAuthentication):
             raise exceptions.AuthenticationFailed("Token inválido (sem subject).")
         
         try:
-            user = Usuario.objects.get(id=user_id)
+            user = Usuario.objects.get(id=user_id, excluido_em__isnull=True)
         except Usuario.DoesNotExist:
             raise exceptions.AuthenticationFailed("Usuário não encontrado.")
 
+        if user.shard_migrando_desde is not None and request.method not in SAFE_METHODS:
+            raise shards.ContaEmMigracao()
+        shards.ativar(user)
+
         return (user, None)
 
     def authenticate_header(self, request):
@@ -0,0 +1,230 @@
+"""
+Estimativa de calorias das sessões pelo MET da atividade.
+
+    kcal = MET x peso (kg) x duração (h)
+
+O MET vem das tabelas do Compendium of Physical Activities (2011):
+corrida e ciclismo pela velocidade (ritmo ou velocidade média das
+métricas, ou distância / duração), musculação pela densidade de volume
+(kg levantados por minuto, entre esforço moderado e vigoroso). Sem
+duração, ela sai da distância e do ritmo/velocidade ou do número de
+séries. Sem peso cadastrado, usa CALORIAS_PESO_PADRAO_KG.
+
+Só as sessões sem calorias ou com `calorias_estimadas` são tocadas: o
+valor informado pelo app sempre prevalece. A criação da sessão já grava
+a estimativa com o que houver; métricas, séries e mudança de peso
+agendam o recálculo no outbox. O recálculo lê as colunas em lotes,
+avalia tudo com NumPy e grava com um UPDATE ... FROM (VALUES ...) por
+lote (`manage.py recalcular_calorias` para o histórico).
+"""
+from typing import Iterable, Optional
+
+import numpy as np
+from django.conf import settings
+
+from . import outbox, shards
+
+# Velocidade (km/h) -> MET.
+_MET_CORRIDA = (
+    np.array([6.4, 8.0, 9.7, 10.8, 11.3, 12.1, 12.9, 13.8, 14.5, 16.1, 17.7, 19.3, 20.9]),
+    np.array([6.0, 8.3, 9.8, 10.5, 11.0, 11.8, 12.3, 12.8, 14.5, 16.0, 19.0, 19.8, 23.0]),
+)
+_MET_CICLISMO = (
+    np.array([12.0, 17.7, 20.9, 24.1, 28.2, 32.2]),
+    np.array([4.0, 6.8, 8.0, 10.0, 12.0, 15.8]),
+)
+# kg levantados por minuto -> MET (3.5 moderado, 6.0 vigoroso).
+_MET_MUSCULACAO = (np.array([100.0, 600.0]), np.array([3.5, 6.0]))
+# Sem velocidade ou volume: "running/bicycling general", musculação moderada.
+MET_PADRAO = {"corrida": 7.0, "ciclismo": 7.5, "musculacao": 3.5}
+# Série + descanso, para musculação sem duração.
+SEGUNDOS_POR_SERIE = 120
+
+TAMANHO_LOTE = 20000
+# Linhas por UPDATE ... FROM (VALUES ...).
+_LINHAS_POR_UPDATE = 2000
+
+_DADOS_SQL = """
+    SELECT s.id, s.inicio_em, s.modalidade, s.duracao_seg, u.peso_kg,
+           coalesce(mc.distancia_km, mb.distancia_km), mc.ritmo_medio_seg_km,
+           mb.velocidade_media_kmh, sm.series, sm.volume
+    FROM sessoes_atividade s
+    JOIN usuarios u ON u.id = s.usuario_id
+    LEFT JOIN metricas_corrida mc ON mc.sessao_id = s.id
+    LEFT JOIN metricas_ciclismo mb ON mb.sessao_id = s.id
+    LEFT JOIN LATERAL (
+      SELECT count(*) AS series, sum(repeticoes * coalesce(carga_kg, 0)) AS volume
+      FROM series_musculacao
+      WHERE sessao_id = s.id AND s.modalidade = 'musculacao'
+    ) sm ON true
+    WHERE (s.calorias IS NULL OR s.calorias_estimadas) AND {filtro}
+    ORDER BY s.id
+    LIMIT %s
+"""
+
+
+def estimar(
+    modalidade: np.ndarray,
+    duracao_seg: np.ndarray,
+    peso_kg: np.ndarray,
+    distancia_km: np.ndarray,
+    ritmo_seg_km: np.ndarray,
+    velocidade_kmh: np.ndarray,
+    series: np.ndarray,
+    volume_kg: np.ndarray,
+) -> np.ndarray:
+    """
+    Calorias de cada sessão (arrays float, NaN = ausente). Devolve NaN
+    onde não há como estimar a duração.
+    """
+    corrida = modalidade == "corrida"
+    ciclismo = modalidade == "ciclismo"
+    musculacao = modalidade == "musculacao"
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ritmo_kmh = np.where(ritmo_seg_km > 0, 3600.0 / ritmo_seg_km, np.nan)
+        velocidade = np.where(
+            corrida, ritmo_kmh, np.where(velocidade_kmh > 0, velocidade_kmh, np.nan)
+        )
+
+        derivada = np.select(
+            [corrida | ciclismo, musculacao],
+            [distancia_km / velocidade * 3600.0, series * SEGUNDOS_POR_SERIE],
+            np.nan,
+        )
+        duracao = np.where(duracao_seg > 0, duracao_seg, derivada)
+        duracao = np.where(duracao > 0, duracao, np.nan)
+
+        # Sem ritmo/velocidade informados: distância / duração.
+        velocidade = np.where(
+            np.isnan(velocidade) & (distancia_km > 0), distancia_km / duracao * 3600.0, velocidade
+        )
+        kg_por_minuto = np.where(volume_kg > 0, volume_kg / duracao * 60.0, np.nan)
+
+    met = np.select(
+        [corrida, ciclismo, musculacao],
+        [
+            np.interp(velocidade, *_MET_CORRIDA),
+            np.interp(velocidade, *_MET_CICLISMO),
+            np.interp(kg_por_minuto, *_MET_MUSCULACAO),
+        ],
+        np.nan,
+    )
+    padrao = np.select(
+        [corrida, ciclismo, musculacao],
+        [MET_PADRAO["corrida"], MET_PADRAO["ciclismo"], MET_PADRAO["musculacao"]],
+        np.nan,
+    )
+    met = np.where(np.isnan(met), padrao, met)
+    peso = np.where(peso_kg > 0, peso_kg, float(settings.CALORIAS_PESO_PADRAO_KG))
+    return np.rint(met * peso * duracao / 3600.0)
+
+
+def _coluna(valores: Iterable) -> np.ndarray:
+    return np.array(list(valores), dtype=np.float64)
+
+
+def estimar_sessoes(sessoes: list, peso_kg: Optional[float]) -> None:
+    """
+    Preenche `calorias` das sessões ainda não gravadas que vieram sem elas
+    (só com os campos da própria sessão; as métricas chegam depois).
+    """
+    pendentes = [s for s in sessoes if s.calorias is None]
+    if not pendentes:
+        return
+    n = len(pendentes)
+    vazio = np.full(n, np.nan)
+    calorias = estimar(
+        np.array([s.modalidade for s in pendentes], dtype=object),
+        _coluna(s.duracao_seg for s in pendentes),
+        np.full(n, np.nan if peso_kg is None else float(peso_kg)),
+        vazio, vazio, vazio, vazio, vazio,
+    )
+    for sessao, valor in zip(pendentes, calorias):
+        if not np.isnan(valor):
+            sessao.calorias = int(valor)
+            sessao.calorias_estimadas = True
+
+
+def _gravar(cursor, linhas: list[tuple]) -> int:
+    atualizadas = 0
+    for i in range(0, len(linhas), _LINHAS_POR_UPDATE):
+        parte = linhas[i:i + _LINHAS_POR_UPDATE]
+        valores = ", ".join(["(%s::bigint, %s::timestamptz, %s::integer)"] * len(parte))
+        cursor.execute(
+            f"""
+            UPDATE sessoes_atividade s
+            SET calorias = v.calorias, calorias_estimadas = v.calorias IS NOT NULL
+            FROM (VALUES {valores}) AS v(id, inicio_em, calorias)
+            WHERE s.id = v.id AND s.inicio_em = v.inicio_em
+              -- Um valor informado pelo app no meio do caminho prevalece.
+              AND (s.calorias IS NULL OR s.calorias_estimadas)
+              AND s.calorias IS DISTINCT FROM v.calorias
+            """,
+            [valor for linha in parte for valor in linha],
+        )
+        atualizadas += cursor.rowcount
+    return atualizadas
+
+
+def _recalcular(cursor, filtro: str, params: list, limite: int) -> tuple[int, Optional[int], int]:
+    """Um lote: devolve (lidas, último id lido, atualizadas)."""
+    cursor.execute(_DADOS_SQL.format(filtro=filtro), [*params, limite])
+    linhas = cursor.fetchall()
+    if not linhas:
+        return 0, None, 0
+    ids, inicios, modalidades, *colunas = zip(*linhas)
+    calorias = estimar(np.array(modalidades, dtype=object), *(_coluna(c) for c in colunas))
+    valores = [
+        (id_, inicio, None if np.isnan(valor) else int(valor))
+        for id_, inicio, valor in zip(ids, inicios, calorias)
+    ]
+    return len(linhas), ids[-1], _gravar(cursor, valores)
+
+
+def recalcular_usuario(usuario_id: int, sessao_ids: Optional[list[int]] = None) -> int:
+    """Recalcula as estimativas do usuário (ou só de `sessao_ids`) no shard ativo."""
+    filtro = "s.usuario_id = %s AND s.id > %s"
+    extra: list = []
+    if sessao_ids is not None:
+        filtro += " AND s.id = ANY(%s)"
+        extra = [sessao_ids]
+    total, ultimo = 0, 0
+    while True:
+        with shards.transacao(), shards.conexao().cursor() as cursor:
+            lidas, ultimo, atualizadas = _recalcular(
+                cursor, filtro, [usuario_id, ultimo, *extra], TAMANHO_LOTE
+            )
+        total += atualizadas
+        if lidas < TAMANHO_LOTE:
+            return total
+
+
+def recalcular_lote(depois_de: int, tamanho: int = TAMANHO_LOTE) -> tuple[int, Optional[int], int]:
+    """
+    Um lote do histórico do shard ativo, em ordem de id (para o comando).
+    Devolve (lidas, último id lido, atualizadas).
+    """
+    with shards.transacao(), shards.conexao().cursor() as cursor:
+        return _recalcular(cursor, "s.id > %s", [depois_de], tamanho)
+
+
+def agendar(usuario_id: int, sessao_ids: Optional[list[int]] = None) -> None:
+    """
+    Enfileira no outbox o recálculo das sessões (todas do usuário se
+    `sessao_ids` for None). Chame na transação da escrita.
+    """
+    if sessao_ids is None:
+        outbox.registrar(usuario_id, "calorias")
+    else:
+        outbox.registrar(usuario_id, "calorias", sessoes=sorted(set(sessao_ids)))
+
+
+def processar_eventos(usuario_id: int, eventos: list[dict]) -> None:
+    """Tratador do outbox: um recálculo para todas as sessões do lote."""
+    if any("sessoes" not in evento for evento in eventos):
+        recalcular_usuario(usuario_id)
+    else:
+        recalcular_usuario(
+            usuario_id, sorted({i for evento in eventos for i in evento["sessoes"]})
+        )
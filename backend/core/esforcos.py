@@ -0,0 +1,151 @@
+"""
+Melhores esforços de corrida (5k, 10k, meia e maratona).
+
+Para cada distância padrão, a tabela melhores_esforcos_corrida guarda a
+sessão mais rápida (menor ritmo médio) com distância igual ou superior.
+Ela é mantida a cada escrita em metricas_corrida com um único upsert;
+o histórico só é relido (para um único usuário) quando a sessão que
+detém um melhor esforço é alterada ou removida.
+"""
+from decimal import Decimal
+
+from . import outbox, shards
+
+# (rótulo, distância mínima registrada, distância oficial em km)
+DISTANCIAS_PADRAO = (
+    ("5k", Decimal("5.00"), Decimal("5")),
+    ("10k", Decimal("10.00"), Decimal("10")),
+    ("21k", Decimal("21.09"), Decimal("21.0975")),
+    ("42k", Decimal("42.19"), Decimal("42.195")),
+)
+
+# Faixas de distância para a distribuição de ritmo.
+FAIXAS_DISTRIBUICAO = (
+    ("<5k", Decimal("0"), Decimal("5.00")),
+    ("5k-10k", Decimal("5.00"), Decimal("10.00")),
+    ("10k-21k", Decimal("10.00"), Decimal("21.09")),
+    ("21k-42k", Decimal("21.09"), Decimal("42.19")),
+    ("42k+", Decimal("42.19"), None),
+)
+PERCENTIS = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+_DISTANCIAS_SQL = "(VALUES {}) AS d(rotulo, minimo, oficial)".format(
+    ", ".join(f"('{r}', {m}::numeric, {o}::numeric)" for r, m, o in DISTANCIAS_PADRAO)
+)
+_FAIXAS_SQL = "(VALUES {}) AS f(ordem, rotulo, minimo, maximo)".format(
+    ", ".join(
+        f"({i}, '{r}', {mi}::numeric, {'NULL' if ma is None else ma}::numeric)"
+        for i, (r, mi, ma) in enumerate(FAIXAS_DISTRIBUICAO)
+    )
+)
+
+_UPSERT = f"""
+    INSERT INTO melhores_esforcos_corrida AS e
+      (usuario_id, distancia_alvo, sessao_id, sessao_inicio_em, distancia_km,
+       ritmo_medio_seg_km, tempo_estimado_seg, atualizado_em)
+    SELECT %(usuario_id)s, d.rotulo, %(sessao_id)s, %(sessao_inicio_em)s, %(distancia_km)s,
+           %(ritmo)s, round(%(ritmo)s * d.oficial), now()
+    FROM {_DISTANCIAS_SQL}
+    WHERE %(distancia_km)s >= d.minimo
+    ON CONFLICT (usuario_id, distancia_alvo) DO UPDATE SET
+      sessao_id = EXCLUDED.sessao_id,
+      sessao_inicio_em = EXCLUDED.sessao_inicio_em,
+      distancia_km = EXCLUDED.distancia_km,
+      ritmo_medio_seg_km = EXCLUDED.ritmo_medio_seg_km,
+      tempo_estimado_seg = EXCLUDED.tempo_estimado_seg,
+      atualizado_em = now()
+    WHERE EXCLUDED.ritmo_medio_seg_km < e.ritmo_medio_seg_km
+"""
+
+_RECALCULO = f"""
+    INSERT INTO melhores_esforcos_corrida
+      (usuario_id, distancia_alvo, sessao_id, sessao_inicio_em, distancia_km,
+       ritmo_medio_seg_km, tempo_estimado_seg, atualizado_em)
+    SELECT DISTINCT ON (s.usuario_id, d.rotulo)
+      s.usuario_id, d.rotulo, s.id, s.inicio_em, m.distancia_km, m.ritmo_medio_seg_km,
+      round(m.ritmo_medio_seg_km * d.oficial), now()
+    FROM metricas_corrida m
+    JOIN sessoes_atividade s ON s.id = m.sessao_id AND s.inicio_em = m.sessao_inicio_em
+    JOIN {_DISTANCIAS_SQL} ON m.distancia_km >= d.minimo
+    WHERE m.ritmo_medio_seg_km > 0 AND s.usuario_id BETWEEN %s AND %s
+    ORDER BY s.usuario_id, d.rotulo, m.ritmo_medio_seg_km, s.inicio_em
+"""
+
+
+def registrar_metricas(usuario_id: int, metricas) -> None:
+    """Aplica as métricas criadas/alteradas aos melhores esforços."""
+    if not metricas.ritmo_medio_seg_km or metricas.ritmo_medio_seg_km <= 0:
+        return
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(_UPSERT, {
+            "usuario_id": usuario_id,
+            "sessao_id": metricas.sessao_id,
+            "sessao_inicio_em": metricas.sessao_inicio_em,
+            "distancia_km": metricas.distancia_km,
+            "ritmo": metricas.ritmo_medio_seg_km,
+        })
+
+
+def detem_melhor_esforco(sessao_id: int) -> bool:
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM melhores_esforcos_corrida WHERE sessao_id = %s LIMIT 1",
+            [sessao_id],
+        )
+        return cursor.fetchone() is not None
+
+
+def recalcular_faixa(usuario_inicio: int, usuario_fim: int) -> int:
+    """Recalcula os melhores esforços dos usuários da faixa (inclusive)."""
+    with shards.transacao(), shards.conexao().cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM melhores_esforcos_corrida WHERE usuario_id BETWEEN %s AND %s",
+            [usuario_inicio, usuario_fim],
+        )
+        cursor.execute(_RECALCULO, [usuario_inicio, usuario_fim])
+        return cursor.rowcount
+
+
+def recalcular_usuario(usuario_id: int) -> None:
+    recalcular_faixa(usuario_id, usuario_id)
+
+
+def agendar_recalculo(usuario_id: int) -> None:
+    """Enfileira no outbox o recálculo do usuário (chame na transação da escrita)."""
+    outbox.registrar(usuario_id, "melhores_esforcos")
+
+
+def processar_eventos(usuario_id: int, eventos: list[dict]) -> None:
+    """Tratador do outbox: um recálculo basta para todos os eventos do lote."""
+    recalcular_usuario(usuario_id)
+
+
+def distribuicao_ritmo(usuario_id: int) -> list[dict]:
+    """Percentis de ritmo por faixa de distância, em uma única query agrupada."""
+    percentis = ", ".join(str(p) for p in PERCENTIS)
+    sql = f"""
+        SELECT f.rotulo, count(*),
+               percentile_cont(ARRAY[{percentis}])
+                 WITHIN GROUP (ORDER BY m.ritmo_medio_seg_km)
+        FROM metricas_corrida m
+        JOIN sessoes_atividade s ON s.id = m.sessao_id
+        JOIN {_FAIXAS_SQL}
+          ON m.distancia_km >= f.minimo AND (f.maximo IS NULL OR m.distancia_km < f.maximo)
+        WHERE s.usuario_id = %s AND m.ritmo_medio_seg_km > 0
+        GROUP BY f.ordem, f.rotulo
+        ORDER BY f.ordem
+    """
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(sql, [usuario_id])
+        linhas = cursor.fetchall()
+
+    return [
+        {
+            "faixa": rotulo,
+            "sessoes": total,
+            "percentis_ritmo_seg_km": {
+                f"p{int(p * 100)}": round(valor, 1) for p, valor in zip(PERCENTIS, valores)
+            },
+        }
+        for rotulo, total, valores in linhas
+    ]
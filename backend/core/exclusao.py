@@ -0,0 +1,117 @@
+"""
+Exclusão de conta em segundo plano.
+
+`solicitar` só marca a conta (`excluido_em`), libera o e-mail e tira o
+usuário dos rankings; a autenticação passa a recusar os tokens dele na
+hora. O resto roda no worker do outbox, um evento por transação (veja
+TIPOS_ISOLADOS em core/outbox.py):
+
+- cada evento apaga até TAMANHO_LOTE linhas de uma tabela grande e se
+  reenfileira enquanto houver linhas. Os dependentes das sessões
+  (sensores, rotas, séries, métricas e melhores esforços) saem em lotes
+  antes delas, então o ON DELETE CASCADE das sessões não tem o que apagar;
+- com as tabelas grandes vazias, o DELETE da linha em `usuarios` leva o
+  que sobrou (metas, recordes, heatmaps, outbox) pelo CASCADE do banco,
+  primeiro no shard e, depois do commit dele, no diretório.
+
+Tudo é idempotente: um lote repetido depois de uma queda só apaga menos.
+"""
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import outbox, rankings, shards
+from .models import Usuario
+
+TAMANHO_LOTE = 5000
+
+# Dependentes das sessões, com a chave primária. Todos têm índice que
+# começa por sessao_id.
+_DEPENDENTES_SESSAO = (
+    ("blocos_sensores", "sessao_id, canal, bloco"),
+    ("rotas_sessao", "sessao_id"),
+    ("series_musculacao", "id"),
+    ("metricas_corrida", "sessao_id"),
+    ("metricas_ciclismo", "sessao_id"),
+    ("melhores_esforcos_corrida", "id"),
+)
+
+
+def solicitar(usuario: Usuario) -> None:
+    """Marca a conta para exclusão e agenda a limpeza no shard do usuário."""
+    agora = timezone.now()
+    # A tarefa é confirmada no shard antes da marcação no diretório (sem
+    # sharding, é uma transação só): se a marcação falhar, a tarefa ainda
+    # apaga a conta inteira.
+    with transaction.atomic():
+        with shards.usando(shards.alias_do_usuario(usuario)), shards.transacao():
+            outbox.registrar(usuario.pk, "exclusao_conta")
+        usuario.excluido_em = agora
+        usuario.email = f"excluido-{usuario.pk}@excluido.invalid"
+        usuario.participa_ranking = False
+        # save() e não update(): o post_save leva o e-mail liberado também
+        # para a cópia do usuário no shard (UNIQUE (email) lá também).
+        usuario.save(update_fields=["excluido_em", "email", "participa_ranking"])
+        rankings.remover_usuario(usuario.pk)
+
+
+def _apagar(cursor, tabela: str, chave: str, filtro: str, params: list) -> int:
+    cursor.execute(
+        f"""
+        DELETE FROM {tabela} WHERE ({chave}) IN (
+          SELECT {chave} FROM {tabela} WHERE {filtro} LIMIT %s
+        )
+        """,
+        [*params, TAMANHO_LOTE],
+    )
+    return cursor.rowcount
+
+
+def _apagar_lote(cursor, usuario_id: int) -> int:
+    """Apaga até TAMANHO_LOTE linhas; 0 quando só resta a linha em usuarios."""
+    # Marcações antes das sessões: evita o SET NULL do vínculo com a sessão.
+    apagadas = _apagar(cursor, "marcacoes_habito", "id, data", "usuario_id = %s", [usuario_id])
+    if apagadas:
+        return apagadas
+
+    cursor.execute(
+        "SELECT id FROM sessoes_atividade WHERE usuario_id = %s LIMIT %s",
+        [usuario_id, TAMANHO_LOTE],
+    )
+    sessoes = [row[0] for row in cursor.fetchall()]
+    if not sessoes:
+        return 0
+    for tabela, chave in _DEPENDENTES_SESSAO:
+        apagadas = _apagar(cursor, tabela, chave, "sessao_id = ANY(%s)", [sessoes])
+        if apagadas:
+            return apagadas
+    return _apagar(
+        cursor, "sessoes_atividade", "id, inicio_em", "usuario_id = %s AND id = ANY(%s)",
+        [usuario_id, sessoes],
+    )
+
+
+def _excluir_do_diretorio(usuario_id: int) -> None:
+    with connections[shards.DIRETORIO].cursor() as cursor:
+        cursor.execute("DELETE FROM usuarios WHERE id = %s", [usuario_id])
+
+
+def processar_eventos(usuario_id: int, eventos: list[dict]) -> None:
+    """Tratador do outbox: apaga um lote e se reenfileira até terminar."""
+    with shards.conexao().cursor() as cursor:
+        # A conta some inteira: sem lápides para a sincronização. O evento
+        # roda na sua própria transação, então a configuração não chega a
+        # outros tratadores.
+        cursor.execute("SELECT set_config('app.sem_exclusoes_sync', 'on', true)")
+        apagadas = _apagar_lote(cursor, usuario_id)
+        if not apagadas:
+            cursor.execute("DELETE FROM usuarios WHERE id = %s", [usuario_id])
+
+    if apagadas:
+        outbox.registrar(usuario_id, "exclusao_conta")
+        return
+    alias = shards.alias_atual()
+    if alias != shards.DIRETORIO:
+        # Só depois do commit do shard: se ele falhar, o diretório ainda
+        # tem a conta para a próxima tentativa. Uma falha aqui só deixa a
+        # linha marcada (excluido_em) no diretório, que já recusa o login.
+        transaction.on_commit(lambda: _excluir_do_diretorio(usuario_id), using=alias, robust=True)
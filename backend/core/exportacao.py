@@ -0,0 +1,192 @@
+"""
+Exportação do histórico completo do usuário em streaming (NDJSON ou CSV,
+opcionalmente com gzip).
+
+Os registros são lidos com cursores do lado do servidor
+(`.iterator(chunk_size=...)`), convertidos em dicts simples e enviados em
+blocos, de modo que a memória fica constante e o primeiro byte sai logo
+após o primeiro chunk do banco. Cada registro tem um campo `tipo`
+(sessao, meta ou marcacao); as sessões usam o mesmo formato aceito pela
+importação (core/importacao.py).
+"""
+import csv
+import zlib
+from typing import Any, Iterable, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from .models import SessaoAtividade, SerieMusculacao, MetaHabito, MarcacaoHabito
+
+FORMATOS = {"ndjson", "csv"}
+# Chunks menores reduzem o tempo até o primeiro byte (o prefetch das
+# séries é feito por chunk).
+CHUNK_SIZE = 500
+TAMANHO_BLOCO = 64 * 1024
+
+COLUNAS_CSV = [
+    "tipo", "id",
+    # sessão
+    "modalidade", "inicio_em", "duracao_seg", "calorias", "observacoes", "criado_em",
+    "distancia_km", "ritmo_medio_seg_km", "velocidade_media_kmh", "fc_media", "series",
+    # meta
+    "titulo", "data_inicio", "data_fim", "frequencia_semana", "distancia_meta_km",
+    "duracao_meta_min", "sessoes_meta", "ativo",
+    # marcação
+    "meta", "data", "sessao", "concluido",
+]
+
+CAMPOS_META = [
+    "id", "titulo", "modalidade", "data_inicio", "data_fim", "frequencia_semana",
+    "distancia_meta_km", "duracao_meta_min", "sessoes_meta", "ativo", "criado_em",
+]
+
+
+def _metricas(sessao: SessaoAtividade):
+    corrida = getattr(sessao, "metricas_corrida", None)
+    if corrida is not None:
+        return {
+            "distancia_km": corrida.distancia_km,
+            "ritmo_medio_seg_km": corrida.ritmo_medio_seg_km,
+            "fc_media": corrida.fc_media,
+        }
+    ciclismo = getattr(sessao, "metricas_ciclismo", None)
+    if ciclismo is not None:
+        return {
+            "distancia_km": ciclismo.distancia_km,
+            "velocidade_media_kmh": ciclismo.velocidade_media_kmh,
+            "fc_media": ciclismo.fc_media,
+        }
+    return None
+
+
+def registros_exportacao(usuario_id: int) -> Iterator[dict[str, Any]]:
+    sessoes = (
+        SessaoAtividade.objects
+        .filter(usuario_id=usuario_id)
+        .select_related("metricas_corrida", "metricas_ciclismo")
+        .prefetch_related(
+            Prefetch(
+                "series_musculacao",
+                queryset=SerieMusculacao.objects.select_related("exercicio")
+                .order_by("ordem_serie", "id"),
+            )
+        )
+        .order_by("inicio_em", "id")
+    )
+    for sessao in sessoes.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            "tipo": "sessao",
+            "id": sessao.id,
+            "modalidade": sessao.modalidade,
+            "inicio_em": sessao.inicio_em,
+            "duracao_seg": sessao.duracao_seg,
+            "calorias": sessao.calorias,
+            "observacoes": sessao.observacoes,
+            "criado_em": sessao.criado_em,
+            "metricas": _metricas(sessao),
+            "series": [
+                {
+                    "id": serie.id,
+                    "exercicio": serie.exercicio_id,
+                    "exercicio_nome": serie.exercicio.nome,
+                    "ordem_serie": serie.ordem_serie,
+                    "repeticoes": serie.repeticoes,
+                    "carga_kg": serie.carga_kg,
+                }
+                for serie in sessao.series_musculacao.all()
+            ],
+        }
+
+    metas = MetaHabito.objects.filter(usuario_id=usuario_id).order_by("id").values(*CAMPOS_META)
+    for meta in metas.iterator(chunk_size=CHUNK_SIZE):
+        yield {"tipo": "meta", **meta}
+
+    marcacoes = (
+        MarcacaoHabito.objects
+        .filter(usuario_id=usuario_id)
+        .order_by("data", "id")
+        .values("id", "meta_id", "data", "sessao_id", "concluido", "criado_em")
+    )
+    for marcacao in marcacoes.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            "tipo": "marcacao",
+            "id": marcacao["id"],
+            "meta": marcacao["meta_id"],
+            "data": marcacao["data"],
+            "sessao": marcacao["sessao_id"],
+            "concluido": marcacao["concluido"],
+            "criado_em": marcacao["criado_em"],
+        }
+
+
+def _linhas_ndjson(registros: Iterable[dict]) -> Iterator[str]:
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for registro in registros:
+        yield encoder.encode(registro) + "\n"
+
+
+class _Eco:
+    """Pseudo-buffer para o csv.writer devolver a linha em vez de escrevê-la."""
+
+    def write(self, value):
+        return value
+
+
+def _linhas_csv(registros: Iterable[dict]) -> Iterator[str]:
+    writer = csv.DictWriter(_Eco(), fieldnames=COLUNAS_CSV, extrasaction="ignore")
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+    yield writer.writeheader()
+    for registro in registros:
+        linha = dict(registro)
+        metricas = linha.pop("metricas", None)
+        if metricas:
+            linha.update(metricas)
+        if linha.get("series"):
+            linha["series"] = encoder.encode(linha["series"])
+        else:
+            linha.pop("series", None)
+        yield writer.writerow(linha)
+
+
+def _em_blocos(linhas: Iterable[str]) -> Iterator[bytes]:
+    """
+    Agrupa as linhas em blocos de ~TAMANHO_BLOCO bytes. O primeiro bloco
+    é enviado imediatamente para reduzir o tempo até o primeiro byte.
+    """
+    buffer: list[bytes] = []
+    tamanho = 0
+    primeiro = True
+
+    for linha in linhas:
+        dados = linha.encode("utf-8")
+        buffer.append(dados)
+        tamanho += len(dados)
+        if primeiro or tamanho >= TAMANHO_BLOCO:
+            yield b"".join(buffer)
+            buffer, tamanho, primeiro = [], 0, False
+
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _gzip(blocos: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    primeiro = True
+    for bloco in blocos:
+        dados = compressor.compress(bloco)
+        if primeiro:
+            # Sem o flush o zlib seguraria o primeiro bloco no buffer interno.
+            dados += compressor.flush(zlib.Z_SYNC_FLUSH)
+            primeiro = False
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+
+def exportar_historico(usuario_id: int, formato: str, compactar: bool = False) -> Iterator[bytes]:
+    registros = registros_exportacao(usuario_id)
+    linhas = _linhas_csv(registros) if formato == "csv" else _linhas_ndjson(registros)
+    blocos = _em_blocos(linhas)
+    return _gzip(blocos) if compactar else blocos
@@ -0,0 +1,178 @@
+"""
+Mapa de calor anual (estilo GitHub) de sessões e hábitos concluídos.
+
+Os dias do ano vêm de `generate_series` e as contagens de sessões e de
+marcações concluídas são agrupadas por dia em uma única query. Anos já
+encerrados são gravados em heatmaps_anuais como dois arrays compactos
+(uma posição por dia) e lidos de lá nas próximas vezes; só o ano corrente
+é calculado ao vivo. Escritas retroativas (sessões, marcações ou
+importação com datas de anos anteriores) apagam a linha do ano afetado,
+que é refeita na próxima leitura. As marcações também enfileiram o mesmo
+descarte no outbox: uma leitura concorrente que regrave o ano com os dados
+de antes do commit é desfeita pelo worker.
+"""
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+import numpy as np
+from django.utils import timezone
+
+from . import outbox, shards
+
+NIVEIS = 4
+
+_CONTAGENS_SQL = """
+    WITH dias AS (
+      SELECT %(inicio)s::date + n AS dia
+      FROM generate_series(0, %(fim)s::date - %(inicio)s::date) AS n
+    ),
+    sessoes AS (
+      SELECT (inicio_em AT TIME ZONE %(tz)s)::date AS dia, count(*) AS total
+      FROM sessoes_atividade
+      WHERE usuario_id = %(usuario_id)s
+        AND inicio_em >= (%(inicio)s::date::timestamp AT TIME ZONE %(tz)s)
+        AND inicio_em < ((%(fim)s::date + 1)::timestamp AT TIME ZONE %(tz)s)
+      GROUP BY 1
+    ),
+    habitos AS (
+      SELECT data AS dia, count(*) AS total
+      FROM marcacoes_habito
+      WHERE usuario_id = %(usuario_id)s AND concluido
+        AND data BETWEEN %(inicio)s AND %(fim)s
+      GROUP BY 1
+    )
+    SELECT
+      array_agg(LEAST(coalesce(s.total, 0), 32767)::smallint ORDER BY d.dia),
+      array_agg(LEAST(coalesce(h.total, 0), 32767)::smallint ORDER BY d.dia)
+    FROM dias d
+    LEFT JOIN sessoes s USING (dia)
+    LEFT JOIN habitos h USING (dia)
+"""
+
+
+def _contar(usuario_id: int, ano: int) -> tuple[list[int], list[int]]:
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(_CONTAGENS_SQL, {
+            "usuario_id": usuario_id,
+            "inicio": date(ano, 1, 1),
+            "fim": date(ano, 12, 31),
+            "tz": timezone.get_current_timezone_name(),
+        })
+        sessoes, habitos = cursor.fetchone()
+    return sessoes, habitos
+
+
+def _carregar_ou_gravar(usuario_id: int, ano: int) -> tuple[list[int], list[int]]:
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            "SELECT sessoes, habitos FROM heatmaps_anuais WHERE usuario_id = %s AND ano = %s",
+            [usuario_id, ano],
+        )
+        row = cursor.fetchone()
+        if row is not None:
+            return row[0], row[1]
+
+        sessoes, habitos = _contar(usuario_id, ano)
+        cursor.execute(
+            """
+            INSERT INTO heatmaps_anuais (usuario_id, ano, sessoes, habitos, calculado_em)
+            VALUES (%s, %s, %s, %s, now())
+            ON CONFLICT (usuario_id, ano) DO NOTHING
+            """,
+            [usuario_id, ano, sessoes, habitos],
+        )
+    return sessoes, habitos
+
+
+def _niveis(totais: np.ndarray) -> np.ndarray:
+    """Nível 0–4 por dia: 0 sem atividade, 1–4 pelos quartis dos dias ativos."""
+    niveis = np.zeros(totais.shape, dtype=np.int64)
+    ativos = totais > 0
+    if ativos.any():
+        limites = np.percentile(totais[ativos], [25, 50, 75])
+        niveis[ativos] = 1 + np.searchsorted(limites, totais[ativos], side="left")
+    return np.minimum(niveis, NIVEIS)
+
+
+def heatmap_anual(usuario_id: int, ano: int) -> dict:
+    if ano < timezone.localdate().year:
+        sessoes, habitos = _carregar_ou_gravar(usuario_id, ano)
+    else:
+        sessoes, habitos = _contar(usuario_id, ano)
+
+    arr_sessoes = np.asarray(sessoes, dtype=np.int64)
+    arr_habitos = np.asarray(habitos, dtype=np.int64)
+    totais = arr_sessoes + arr_habitos
+    niveis = _niveis(totais)
+    inicio = date(ano, 1, 1).toordinal()
+
+    return {
+        "ano": ano,
+        "totais": {
+            "sessoes": int(arr_sessoes.sum()),
+            "habitos": int(arr_habitos.sum()),
+            "dias_ativos": int((totais > 0).sum()),
+        },
+        "dias": [
+            {
+                "data": date.fromordinal(inicio + i),
+                "sessoes": int(arr_sessoes[i]),
+                "habitos": int(arr_habitos[i]),
+                "nivel": int(niveis[i]),
+            }
+            for i in range(len(totais))
+        ],
+    }
+
+
+def _ano_local(valor) -> Optional[int]:
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).year
+    return valor.year
+
+
+def _anos_encerrados(datas: Iterable) -> list[int]:
+    atual = timezone.localdate().year
+    return sorted({a for a in map(_ano_local, datas) if a is not None and a < atual})
+
+
+def _descartar(usuario_id: int, anos: list[int]) -> None:
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM heatmaps_anuais WHERE usuario_id = %s AND ano = ANY(%s)",
+            [usuario_id, anos],
+        )
+
+
+def invalidar_heatmap(usuario_id: int, datas: Iterable) -> None:
+    """
+    Descarta os anos encerrados que contêm alguma das datas (datetimes de
+    sessões ou dates de marcações). Escritas no ano corrente não custam
+    nenhuma query.
+    """
+    anos = _anos_encerrados(datas)
+    if anos:
+        _descartar(usuario_id, anos)
+
+
+def agendar(usuario_id: int, datas: Iterable) -> None:
+    """
+    Como invalidar_heatmap, e enfileira no outbox o descarte dos mesmos
+    anos para depois do commit. Chame na transação da escrita.
+    """
+    anos = _anos_encerrados(datas)
+    if anos:
+        _descartar(usuario_id, anos)
+        outbox.registrar(usuario_id, "heatmap", anos=anos)
+
+
+def processar_eventos(usuario_id: int, eventos: list[dict]) -> None:
+    """Tratador do outbox: descarta cada ano afetado uma vez."""
+    _descartar(usuario_id, sorted({ano for evento in eventos for ano in evento["anos"]}))
+
+
+def invalidar_heatmap_usuario(usuario_id: int) -> None:
+    with shards.conexao().cursor() as cursor:
+        cursor.execute("DELETE FROM heatmaps_anuais WHERE usuario_id = %s", [usuario_id])
@@ -0,0 +1,134 @@
+"""
+Idempotency-Key nos POST de criação.
+
+Apps em rede instável repetem POSTs. Com o cabeçalho `Idempotency-Key`, a
+primeira requisição roda normalmente e a resposta de sucesso fica em
+`chaves_idempotencia`, no shard do usuário, por IDEMPOTENCIA_TTL_HORAS.
+As repetições com a mesma chave recebem a resposta guardada (com
+`Idempotent-Replayed: true`) sem rodar a view nem tocar as tabelas de
+domínio.
+
+A linha da chave é inserida na mesma transação da escrita: uma repetição
+concorrente espera no INSERT até a primeira terminar e então devolve a
+resposta dela (ou executa, se a primeira falhou). Respostas de erro não
+ficam guardadas, então a nova tentativa roda de novo. A mesma chave com
+outro corpo ou em outro endpoint recebe 422.
+"""
+import hashlib
+import json
+from typing import Callable
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import shards
+
+CABECALHO = "Idempotency-Key"
+TAMANHO_MAXIMO_CHAVE = 255
+
+
+class ChaveReutilizada(exceptions.APIException):
+    status_code = 422
+    default_detail = "Idempotency-Key já usada em outra requisição."
+    default_code = "idempotency_key_reutilizada"
+
+
+class ChaveEmUso(exceptions.APIException):
+    status_code = 409
+    default_detail = "Requisição com esta Idempotency-Key ainda em andamento."
+    default_code = "idempotency_key_em_uso"
+
+
+def _digest(*partes: bytes) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    for parte in partes:
+        h.update(len(parte).to_bytes(8, "little"))
+        h.update(parte)
+    return h.digest()
+
+
+def executar(request: Request, view: Callable[[], HttpResponse]) -> HttpResponse:
+    """Roda `view()` uma vez por Idempotency-Key; sem o cabeçalho, só roda."""
+    chave = request.headers.get(CABECALHO)
+    if chave is None:
+        return view()
+    if not chave or len(chave) > TAMANHO_MAXIMO_CHAVE:
+        raise exceptions.ValidationError(
+            {CABECALHO: f"Informe uma chave de 1 a {TAMANHO_MAXIMO_CHAVE} caracteres."}
+        )
+
+    digest_chave = _digest(chave.encode())
+    digest_requisicao = _digest(
+        request.method.encode(),
+        request.path.encode(),
+        json.dumps(request.data, cls=JSONEncoder, sort_keys=True).encode(),
+    )
+    usuario_id = request.user.pk
+
+    with shards.transacao(), shards.conexao().cursor() as cursor:
+        cursor.execute(
+            """
+            DELETE FROM chaves_idempotencia
+            WHERE usuario_id = %s AND chave = %s AND expira_em <= now()
+            """,
+            [usuario_id, digest_chave],
+        )
+        cursor.execute(
+            """
+            INSERT INTO chaves_idempotencia (usuario_id, chave, requisicao, expira_em)
+            VALUES (%s, %s, %s, now() + make_interval(hours => %s))
+            ON CONFLICT (usuario_id, chave) DO NOTHING
+            """,
+            [usuario_id, digest_chave, digest_requisicao, settings.IDEMPOTENCIA_TTL_HORAS],
+        )
+        if cursor.rowcount == 0:
+            cursor.execute(
+                """
+                SELECT requisicao, status, resposta FROM chaves_idempotencia
+                WHERE usuario_id = %s AND chave = %s
+                """,
+                [usuario_id, digest_chave],
+            )
+            linha = cursor.fetchone()
+            if linha is None or linha[1] is None:
+                raise ChaveEmUso()
+            if bytes(linha[0]) != digest_requisicao:
+                raise ChaveReutilizada()
+            resposta = HttpResponse(
+                bytes(linha[2]), status=linha[1], content_type="application/json"
+            )
+            resposta["Idempotent-Replayed"] = "true"
+            return resposta
+
+        # Exceções da view desfazem a escrita e a chave juntas.
+        resposta = view()
+        if 200 <= resposta.status_code < 300:
+            cursor.execute(
+                """
+                UPDATE chaves_idempotencia SET status = %s, resposta = %s
+                WHERE usuario_id = %s AND chave = %s
+                """,
+                [
+                    resposta.status_code,
+                    JSONRenderer().render(resposta.data),
+                    usuario_id,
+                    digest_chave,
+                ],
+            )
+        else:
+            cursor.execute(
+                "DELETE FROM chaves_idempotencia WHERE usuario_id = %s AND chave = %s",
+                [usuario_id, digest_chave],
+            )
+        return resposta
+
+
+def limpar_vencidas() -> int:
+    """Apaga as chaves vencidas do shard ativo."""
+    with shards.conexao().cursor() as cursor:
+        cursor.execute("DELETE FROM chaves_idempotencia WHERE expira_em <= now()")
+        return cursor.rowcount
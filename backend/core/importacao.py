@@ -0,0 +1,361 @@
+"""
+Importação em lote do histórico de atividades (NDJSON ou CSV).
+
+O arquivo é lido de forma incremental e processado em lotes: cada lote é
+validado com as regras dos serializers, carregado via COPY em tabelas
+temporárias e gravado nas tabelas definitivas com INSERT ... SELECT.
+A memória usada depende do tamanho do lote, não do tamanho do arquivo.
+
+Formato NDJSON (uma sessão por linha):
+    {"modalidade": "corrida", "inicio_em": "2024-05-01T07:00:00-03:00",
+     "duracao_seg": 1800, "metricas": {"distancia_km": "5.20",
+     "ritmo_medio_seg_km": 346, "fc_media": 152}}
+    {"modalidade": "musculacao", "inicio_em": "...",
+     "series": [{"exercicio": 1, "ordem_serie": 1, "repeticoes": 10, "carga_kg": "40"}]}
+
+Formato CSV: colunas da sessão (modalidade, inicio_em, duracao_seg,
+calorias, observacoes), colunas de métricas (distancia_km,
+ritmo_medio_seg_km, velocidade_media_kmh, fc_media) e, opcionalmente,
+uma coluna `series` com a lista de séries em JSON.
+
+Arquivos gerados pela exportação (core/exportacao.py) podem ser
+importados diretamente: registros com `tipo` diferente de "sessao" são
+ignorados.
+"""
+import codecs
+import csv
+import json
+from typing import Any, Iterable, Iterator, Optional
+
+from .models import Exercicio, ModalidadeChoices, Usuario
+from . import calorias, esforcos, marcacoes, rankings, recordes, shards
+from .analise import invalidar_analise, invalidar_volume
+from .heatmap import invalidar_heatmap_usuario
+from .serializers import (
+    SessaoAtividadeSerializer,
+    MetricasCorridaSerializer,
+    MetricasCiclismoSerializer,
+    SerieMusculacaoSerializer,
+)
+
+FORMATOS = {"ndjson", "csv"}
+TAMANHO_LOTE = 1000
+MAX_ERROS_REPORTADOS = 100
+
+CAMPOS_SESSAO = ("modalidade", "inicio_em", "duracao_seg", "calorias", "observacoes")
+CAMPOS_METRICAS = ("distancia_km", "ritmo_medio_seg_km", "velocidade_media_kmh", "fc_media")
+
+SERIALIZER_METRICAS = {
+    ModalidadeChoices.CORRIDA: MetricasCorridaSerializer,
+    ModalidadeChoices.CICLISMO: MetricasCiclismoSerializer,
+}
+
+# (linha, registro, erro) — registro é None quando a linha não pôde ser lida
+Entrada = tuple[int, Any, Optional[Any]]
+
+
+# ---------- LEITURA ----------
+
+
+def ler_ndjson(linhas: Iterable[bytes]) -> Iterator[Entrada]:
+    for numero, linha in enumerate(codecs.iterdecode(linhas, "utf-8-sig"), start=1):
+        if not linha.strip():
+            continue
+        try:
+            registro = json.loads(linha)
+        except ValueError:
+            yield numero, None, {"registro": "JSON inválido."}
+            continue
+        # Arquivos da exportação também trazem metas e marcações.
+        if isinstance(registro, dict) and registro.get("tipo", "sessao") != "sessao":
+            continue
+        yield numero, registro, None
+
+
+def ler_csv(linhas: Iterable[bytes]) -> Iterator[Entrada]:
+    reader = csv.DictReader(codecs.iterdecode(linhas, "utf-8-sig"))
+
+    for row in reader:
+        if row.get("tipo") not in (None, "", "sessao"):
+            continue
+
+        registro: dict[str, Any] = {
+            campo: row[campo] for campo in CAMPOS_SESSAO if row.get(campo)
+        }
+        metricas = {campo: row[campo] for campo in CAMPOS_METRICAS if row.get(campo)}
+        if metricas:
+            registro["metricas"] = metricas
+
+        if row.get("series"):
+            try:
+                registro["series"] = json.loads(row["series"])
+            except ValueError:
+                yield reader.line_num, None, {"series": "JSON inválido na coluna series."}
+                continue
+
+        yield reader.line_num, registro, None
+
+
+def ler_registros(linhas: Iterable[bytes], formato: str) -> Iterator[Entrada]:
+    if formato == "csv":
+        return ler_csv(linhas)
+    return ler_ndjson(linhas)
+
+
+# ---------- VALIDAÇÃO ----------
+
+
+def _sem_campos(serializer, *campos):
+    """
+    Remove campos relacionais que só são resolvidos no lote
+    (a sessão ainda não existe; exercícios são validados de uma vez).
+    """
+    for campo in campos:
+        serializer.fields.pop(campo, None)
+    return serializer
+
+
+def validar_registro(registro: Any) -> tuple[Optional[dict], Optional[Any]]:
+    """Aplica as regras dos serializers a um registro. Retorna (validado, erros)."""
+    if not isinstance(registro, dict):
+        return None, {"registro": "Cada registro deve ser um objeto."}
+
+    sessao = SessaoAtividadeSerializer(data=registro)
+    if not sessao.is_valid():
+        return None, sessao.errors
+
+    dados_sessao = dict(sessao.validated_data)
+    modalidade = dados_sessao["modalidade"]
+    validado: dict[str, Any] = {"sessao": dados_sessao, "metricas": None, "series": []}
+
+    metricas = registro.get("metricas")
+    if metricas is not None:
+        serializer_class = SERIALIZER_METRICAS.get(modalidade)
+        if serializer_class is None:
+            return None, {"metricas": "Sessões de musculação não possuem métricas."}
+
+        serializer = _sem_campos(serializer_class(data=metricas), "sessao")
+        if not serializer.is_valid():
+            return None, {"metricas": serializer.errors}
+        validado["metricas"] = dict(serializer.validated_data)
+
+    series = registro.get("series") or []
+    if not isinstance(series, list):
+        return None, {"series": "Informe uma lista de séries."}
+    if series and modalidade != ModalidadeChoices.MUSCULACAO:
+        return None, {"series": "A sessão associada deve ser de modalidade musculação."}
+
+    ordens = set()
+    for posicao, serie in enumerate(series, start=1):
+        if not isinstance(serie, dict):
+            return None, {"series": {posicao: "Cada série deve ser um objeto."}}
+
+        serializer = _sem_campos(SerieMusculacaoSerializer(data=serie), "sessao", "exercicio")
+        if not serializer.is_valid():
+            return None, {"series": {posicao: serializer.errors}}
+
+        dados_serie = dict(serializer.validated_data)
+        try:
+            dados_serie["exercicio_id"] = int(serie.get("exercicio"))
+        except (TypeError, ValueError):
+            return None, {"series": {posicao: {"exercicio": "Informe o id do exercício."}}}
+
+        ordem = dados_serie["ordem_serie"]
+        if ordem < 1:
+            return None, {"series": {posicao: {
+                "ordem_serie": "A ordem da série deve ser um número inteiro maior ou igual a 1."
+            }}}
+        if ordem in ordens:
+            return None, {"series": {posicao: {
+                "ordem_serie": "Já existe uma série com essa ordem nessa sessão."
+            }}}
+        ordens.add(ordem)
+        validado["series"].append(dados_serie)
+
+    return validado, None
+
+
+# ---------- CARGA ----------
+
+
+_STAGING = (
+    """
+    CREATE TEMP TABLE IF NOT EXISTS _imp_sessoes (
+      ref INTEGER PRIMARY KEY,
+      id BIGINT,
+      modalidade VARCHAR(20),
+      inicio_em TIMESTAMPTZ,
+      duracao_seg INTEGER,
+      calorias INTEGER,
+      observacoes TEXT
+    ) ON COMMIT DELETE ROWS
+    """,
+    """
+    CREATE TEMP TABLE IF NOT EXISTS _imp_metricas (
+      ref INTEGER PRIMARY KEY,
+      distancia_km NUMERIC(7,2),
+      ritmo_medio_seg_km INTEGER,
+      velocidade_media_kmh NUMERIC(5,2),
+      fc_media SMALLINT
+    ) ON COMMIT DELETE ROWS
+    """,
+    """
+    CREATE TEMP TABLE IF NOT EXISTS _imp_series (
+      ref INTEGER,
+      exercicio_id BIGINT,
+      ordem_serie INTEGER,
+      repeticoes INTEGER,
+      carga_kg NUMERIC(6,2)
+    ) ON COMMIT DELETE ROWS
+    """,
+)
+
+_INSERTS = (
+    "UPDATE _imp_sessoes SET id = nextval(pg_get_serial_sequence('sessoes_atividade', 'id'))",
+    """
+    INSERT INTO sessoes_atividade
+      (id, usuario_id, modalidade, inicio_em, duracao_seg, calorias, observacoes)
+    SELECT id, %s, modalidade, inicio_em, duracao_seg, calorias, observacoes
+    FROM _imp_sessoes
+    """,
+    """
+    INSERT INTO metricas_corrida
+      (sessao_id, sessao_inicio_em, usuario_id, distancia_km, ritmo_medio_seg_km, fc_media)
+    SELECT s.id, s.inicio_em, %s, m.distancia_km, m.ritmo_medio_seg_km, m.fc_media
+    FROM _imp_metricas m JOIN _imp_sessoes s USING (ref)
+    WHERE s.modalidade = 'corrida'
+    """,
+    """
+    INSERT INTO metricas_ciclismo
+      (sessao_id, sessao_inicio_em, usuario_id, distancia_km, velocidade_media_kmh, fc_media)
+    SELECT s.id, s.inicio_em, %s, m.distancia_km, m.velocidade_media_kmh, m.fc_media
+    FROM _imp_metricas m JOIN _imp_sessoes s USING (ref)
+    WHERE s.modalidade = 'ciclismo'
+    """,
+    """
+    INSERT INTO series_musculacao
+      (sessao_id, usuario_id, inicio_em, exercicio_id, ordem_serie, repeticoes, carga_kg)
+    SELECT s.id, %s, s.inicio_em, x.exercicio_id, x.ordem_serie, x.repeticoes, x.carga_kg
+    FROM _imp_series x JOIN _imp_sessoes s USING (ref)
+    """,
+)
+
+
+def _carregar_lote(usuario_id: int, lote: list[tuple[int, dict]]) -> None:
+    with shards.transacao(), shards.conexao().cursor() as cursor:
+        for sql in _STAGING:
+            cursor.execute(sql)
+
+        with cursor.cursor.copy(
+            "COPY _imp_sessoes (ref, modalidade, inicio_em, duracao_seg, calorias, observacoes)"
+            " FROM STDIN"
+        ) as copy:
+            for ref, registro in lote:
+                s = registro["sessao"]
+                copy.write_row((
+                    ref, s["modalidade"], s["inicio_em"], s.get("duracao_seg"),
+                    s.get("calorias"), s.get("observacoes"),
+                ))
+
+        with cursor.cursor.copy(
+            "COPY _imp_metricas (ref, distancia_km, ritmo_medio_seg_km,"
+            " velocidade_media_kmh, fc_media) FROM STDIN"
+        ) as copy:
+            for ref, registro in lote:
+                m = registro["metricas"]
+                if m is not None:
+                    copy.write_row((
+                        ref, m["distancia_km"], m.get("ritmo_medio_seg_km"),
+                        m.get("velocidade_media_kmh"), m.get("fc_media"),
+                    ))
+
+        with cursor.cursor.copy(
+            "COPY _imp_series (ref, exercicio_id, ordem_serie, repeticoes, carga_kg)"
+            " FROM STDIN"
+        ) as copy:
+            for ref, registro in lote:
+                for x in registro["series"]:
+                    copy.write_row((
+                        ref, x["exercicio_id"], x["ordem_serie"],
+                        x.get("repeticoes"), x.get("carga_kg"),
+                    ))
+
+        for sql in _INSERTS:
+            cursor.execute(sql, [usuario_id] if "%s" in sql else None)
+
+
+# ---------- ORQUESTRAÇÃO ----------
+
+
+def _registrar_erro(resumo: dict, linha: int, erro: Any) -> None:
+    resumo["total_erros"] += 1
+    if len(resumo["erros"]) < MAX_ERROS_REPORTADOS:
+        resumo["erros"].append({"linha": linha, "erros": erro})
+
+
+def _processar_lote(usuario_id: int, lote: list[tuple[int, dict]], resumo: dict) -> None:
+    exercicio_ids = {x["exercicio_id"] for _, r in lote for x in r["series"]}
+    existentes = set(
+        Exercicio.objects.filter(id__in=exercicio_ids).values_list("id", flat=True)
+    ) if exercicio_ids else set()
+
+    validos = []
+    for linha, registro in lote:
+        faltando = {x["exercicio_id"] for x in registro["series"]} - existentes
+        if faltando:
+            _registrar_erro(resumo, linha, {
+                "series": f"Exercício(s) não encontrado(s): {sorted(faltando)}."
+            })
+        else:
+            validos.append((linha, registro))
+
+    if validos:
+        _carregar_lote(usuario_id, validos)
+        resumo["importadas"] += len(validos)
+
+
+def importar_historico(
+    usuario_id: int,
+    entradas: Iterable[Entrada],
+    tamanho_lote: int = TAMANHO_LOTE,
+) -> dict:
+    """
+    Valida e grava as entradas em lotes. Registros inválidos são
+    ignorados e reportados; cada lote válido é gravado em sua própria
+    transação.
+    """
+    resumo: dict[str, Any] = {"importadas": 0, "total_erros": 0, "erros": []}
+    lote: list[tuple[int, dict]] = []
+
+    try:
+        for linha, registro, erro in entradas:
+            validado = None
+            if erro is None:
+                validado, erro = validar_registro(registro)
+            if erro is not None:
+                _registrar_erro(resumo, linha, erro)
+                continue
+
+            lote.append((linha, validado))
+            if len(lote) >= tamanho_lote:
+                _processar_lote(usuario_id, lote, resumo)
+                lote = []
+
+        if lote:
+            _processar_lote(usuario_id, lote, resumo)
+    finally:
+        # Lotes já gravados continuam valendo mesmo se a leitura falhar.
+        # Um único recálculo set-based dos dados derivados ao final, em
+        # vez de um upsert por registro importado.
+        if resumo["importadas"]:
+            recordes.recalcular_faixa(usuario_id, usuario_id)
+            marcacoes.reconciliar_faixa(usuario_id, usuario_id)
+            calorias.recalcular_usuario(usuario_id)
+            esforcos.recalcular_usuario(usuario_id)
+            invalidar_analise(usuario_id)
+            invalidar_volume(usuario_id)
+            invalidar_heatmap_usuario(usuario_id)
+            if Usuario.objects.filter(pk=usuario_id, participa_ranking=True).exists():
+                rankings.reconstruir_usuario(usuario_id)
+
+    return resumo
@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.relatorios import VISOES, atualizar_visoes
+
+
+class Command(BaseCommand):
+    help = (
+        "Atualiza as visões materializadas dos relatórios mensais com "
+        "REFRESH MATERIALIZED VIEW CONCURRENTLY (sem bloquear escritas)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "visoes", nargs="*",
+            help=f"Visões a atualizar ({', '.join(VISOES)}). Padrão: todas.",
+        )
+        parser.add_argument(
+            "--intervalo", type=int, default=0,
+            help="Se informado, repete o refresh a cada N segundos (modo agendador).",
+        )
+
+    def handle(self, *args, **options):
+        nomes = options["visoes"] or None
+        invalidas = set(nomes or []) - set(VISOES)
+        if invalidas:
+            raise CommandError(f"Visões desconhecidas: {', '.join(sorted(invalidas))}.")
+
+        while True:
+            for alias in settings.SHARDS:
+                prefixo = f"[{alias}] " if len(settings.SHARDS) > 1 else ""
+                duracoes = atualizar_visoes(nomes, alias)
+                if duracoes is None:
+                    self.stdout.write(self.style.WARNING(
+                        f"{prefixo}Outro refresh já está em andamento."
+                    ))
+                else:
+                    for nome, ms in duracoes.items():
+                        self.stdout.write(f"{prefixo}{nome}: {ms} ms")
+
+            if not options["intervalo"]:
+                break
+            time.sleep(options["intervalo"])
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from core import shards
+from core.esforcos import recalcular_faixa
+from core.models import Usuario
+
+
+class Command(BaseCommand):
+    help = "Recalcula a tabela melhores_esforcos_corrida por faixas de id de usuário."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tamanho-faixa", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        limites = Usuario.objects.aggregate(inicio=Min("id"), fim=Max("id"))
+        if limites["inicio"] is None:
+            self.stdout.write("Nenhum usuário encontrado.")
+            return
+
+        passo = options["tamanho_faixa"]
+        total = 0
+        for alias in settings.SHARDS:
+            with shards.usando(alias):
+                for inicio in range(limites["inicio"], limites["fim"] + 1, passo):
+                    total += recalcular_faixa(inicio, inicio + passo - 1)
+
+        self.stdout.write(self.style.SUCCESS(f"{total} melhores esforços recalculados."))
@@ -0,0 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max, Min
+
+from core import shards
+from core.models import Usuario
+from core.recordes import recalcular_faixa
+
+
+def _processar(alias: str, inicio: int, fim: int) -> int:
+    # Cada thread usa sua própria conexão; fecha ao terminar a faixa.
+    try:
+        with shards.usando(alias):
+            return recalcular_faixa(inicio, fim)
+    finally:
+        connections[alias].close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula a tabela recordes_pessoais a partir das séries, "
+        "em paralelo por faixas de id de usuário."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--tamanho-faixa",
+            type=int,
+            default=500,
+            help="Quantidade de ids de usuário por faixa.",
+        )
+
+    def handle(self, *args, **options):
+        limites = Usuario.objects.aggregate(inicio=Min("id"), fim=Max("id"))
+        if limites["inicio"] is None:
+            self.stdout.write("Nenhum usuário encontrado.")
+            return
+
+        passo = options["tamanho_faixa"]
+        faixas = [
+            (alias, inicio, min(inicio + passo - 1, limites["fim"]))
+            for alias in settings.SHARDS
+            for inicio in range(limites["inicio"], limites["fim"] + 1, passo)
+        ]
+
+        total = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            futuros = {executor.submit(_processar, *faixa): faixa for faixa in faixas}
+            for futuro in as_completed(futuros):
+                alias, inicio, fim = futuros[futuro]
+                gravados = futuro.result()
+                total += gravados
+                self.stdout.write(f"{alias}, usuários {inicio}-{fim}: {gravados} recordes")
+
+        self.stdout.write(self.style.SUCCESS(f"{total} recordes recalculados."))
@@ -0,0 +1,183 @@
+import json
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core import heatmap, particoes
+
+# Filtros de data usados pela API, com os nomes das tabelas trocáveis
+# pela cópia sem particionamento.
+CONSULTAS = {
+    "sessões do usuário no mês (listagem)": (
+        """
+        SELECT * FROM sessoes_atividade
+        WHERE usuario_id = %(usuario_id)s
+          AND inicio_em >= %(inicio)s AND inicio_em < %(inicio)s + interval '1 month'
+        ORDER BY inicio_em DESC
+        """
+    ),
+    "marcações do usuário no mês (listagem)": (
+        """
+        SELECT * FROM marcacoes_habito
+        WHERE usuario_id = %(usuario_id)s
+          AND data >= %(inicio)s AND data < %(inicio)s + interval '1 month'
+        ORDER BY data, id
+        """
+    ),
+    "heatmap do ano": heatmap._CONTAGENS_SQL,
+    "sessões de todos no mês (ops)": (
+        """
+        SELECT modalidade, count(*) FROM sessoes_atividade
+        WHERE inicio_em >= %(inicio)s AND inicio_em < %(inicio)s + interval '1 month'
+        GROUP BY 1
+        """
+    ),
+}
+
+_COPIAS = {"sessoes_atividade": "_bench_sessoes", "marcacoes_habito": "_bench_marcacoes"}
+
+
+def _relacoes(plano: dict) -> set[str]:
+    nomes = set()
+    if "Relation Name" in plano:
+        nomes.add(plano["Relation Name"])
+    for filho in plano.get("Plans", []):
+        nomes |= _relacoes(filho)
+    return nomes
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o particionamento (partition pruning) nas consultas por data da "
+        "API, comparando com cópias não particionadas dos mesmos dados. "
+        "Usa dados sintéticos em uma transação desfeita ao final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuarios", type=int, default=2000)
+        parser.add_argument("--anos", type=int, default=3)
+        parser.add_argument("--sessoes", type=int, default=500_000)
+        parser.add_argument("--marcacoes", type=int, default=500_000)
+        parser.add_argument("--consultas", type=int, default=50)
+
+    def _gerar(self, cursor, opcoes, inicio: date) -> list[int]:
+        dias = (timezone.localdate() - inicio).days
+        cursor.execute(
+            """
+            INSERT INTO usuarios (nome, email, hash_senha)
+            SELECT 'bench ' || g, 'bench-part-' || g || '@benchmark.invalid', '!'
+            FROM generate_series(1, %s) g
+            RETURNING id
+            """,
+            [opcoes["usuarios"]],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            """
+            INSERT INTO sessoes_atividade (usuario_id, modalidade, inicio_em, duracao_seg)
+            SELECT (%(ids)s::bigint[])[1 + floor(random() * cardinality(%(ids)s::bigint[]))::int],
+                   (ARRAY['corrida','ciclismo','musculacao'])[1 + floor(random() * 3)::int],
+                   %(inicio)s::timestamptz + random() * (%(dias)s * interval '1 day'),
+                   1800 + floor(random() * 3600)::int
+            FROM generate_series(1, %(n)s)
+            """,
+            {"ids": ids, "inicio": inicio, "dias": dias, "n": opcoes["sessoes"]},
+        )
+        cursor.execute(
+            """
+            WITH metas AS (
+              INSERT INTO metas_habito (usuario_id, titulo, modalidade, data_inicio, frequencia_semana)
+              SELECT id, 'bench', 'corrida', %(inicio)s, 3 FROM unnest(%(ids)s::bigint[]) AS id
+              RETURNING id, usuario_id
+            )
+            INSERT INTO marcacoes_habito (meta_id, usuario_id, data)
+            SELECT m.id, m.usuario_id, %(inicio)s::date + d
+            FROM metas m CROSS JOIN generate_series(0, %(dias)s) d
+            WHERE random() < %(p)s
+            """,
+            {
+                "ids": ids, "inicio": inicio, "dias": dias,
+                "p": min(1.0, opcoes["marcacoes"] / (len(ids) * (dias + 1))),
+            },
+        )
+        return ids
+
+    def _medir(self, cursor, sql: str, parametros, repeticoes: int):
+        """Mediana do tempo e, por tabela, das partições lidas por execução."""
+        tempos, lidas = [], {tabela: [] for tabela in particoes.TABELAS}
+        for _ in range(repeticoes):
+            cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", parametros())
+            resultado = cursor.fetchone()[0]
+            if isinstance(resultado, str):
+                resultado = json.loads(resultado)
+            relacoes = _relacoes(resultado[0]["Plan"])
+            for tabela, contagens in lidas.items():
+                contagens.append(sum(r.startswith(f"{tabela}_") for r in relacoes))
+            tempos.append(resultado[0]["Execution Time"])
+        medianas = {t: statistics.median(c) for t, c in lidas.items() if any(c)}
+        return statistics.median(tempos), medianas
+
+    def handle(self, *args, **options):
+        hoje = timezone.localdate()
+        inicio = date(hoje.year - options["anos"], 1, 1)
+        tz = timezone.get_current_timezone_name()
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            trimestres = (hoje.year - inicio.year + 1) * 4 + 4
+            particoes.criar_particoes(inicio, trimestres)
+
+            t0 = time.perf_counter()
+            ids = self._gerar(cursor, options, inicio)
+            for tabela, copia in _COPIAS.items():
+                cursor.execute(
+                    f"CREATE TEMP TABLE {copia} (LIKE {tabela} INCLUDING INDEXES) ON COMMIT DROP"
+                )
+                cursor.execute(f"INSERT INTO {copia} SELECT * FROM {tabela}")
+                cursor.execute(f"ANALYZE {tabela}")
+                cursor.execute(f"ANALYZE {copia}")
+            self.stdout.write(
+                f"{options['sessoes']} sessões e ~{options['marcacoes']} marcações "
+                f"geradas em {time.perf_counter() - t0:.1f} s.\n"
+            )
+
+            totais = {t: len(particoes.listar_particoes(t)) + 1 for t in particoes.TABELAS}
+
+            def parametros():
+                mes = hoje - timedelta(days=random.randint(0, (hoje - inicio).days))
+                ano = mes.year
+                return {
+                    "usuario_id": random.choice(ids),
+                    "inicio": mes.replace(day=1),
+                    "fim": date(ano, 12, 31),
+                    "tz": tz,
+                }
+
+            def parametros_heatmap():
+                params = parametros()
+                params["inicio"] = params["inicio"].replace(month=1)
+                return params
+
+            for nome, sql in CONSULTAS.items():
+                gerar = parametros_heatmap if nome == "heatmap do ano" else parametros
+                mediana, lidas = self._medir(cursor, sql, gerar, options["consultas"])
+                sem_particao = sql
+                for tabela, copia in _COPIAS.items():
+                    sem_particao = sem_particao.replace(tabela, copia)
+                mediana_sem, _ = self._medir(cursor, sem_particao, gerar, options["consultas"])
+
+                resumo = ", ".join(
+                    f"{tabela}: {n:g} de {totais[tabela]} partições"
+                    for tabela, n in lidas.items()
+                )
+                self.stdout.write(
+                    f"{nome:<40} particionada {mediana:8.3f} ms   "
+                    f"sem partição {mediana_sem:8.3f} ms   ({resumo})"
+                )
+
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Dados sintéticos descartados."))
@@ -0,0 +1,180 @@
+import random
+import statistics
+import time
+from datetime import datetime, time as dtime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core import rankings
+from core.models import Usuario
+
+_RANKING_AO_VIVO_SQL = """
+    SELECT posicao, total FROM (
+      SELECT s.usuario_id,
+             rank() OVER (ORDER BY sum(m.distancia_km) DESC) AS posicao,
+             sum(m.distancia_km) AS total
+      FROM sessoes_atividade s
+      JOIN metricas_corrida m ON m.sessao_id = s.id
+      JOIN usuarios u ON u.id = s.usuario_id AND u.participa_ranking
+      WHERE s.inicio_em >= %s AND s.inicio_em < %s
+      GROUP BY s.usuario_id
+    ) t
+    WHERE usuario_id = %s
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o ranking semanal pré-calculado com o GROUP BY ao vivo sobre "
+        "sessoes_atividade, usando usuários sintéticos. Tudo roda em uma "
+        "transação desfeita ao final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuarios", type=int, default=1_000_000)
+        parser.add_argument("--consultas", type=int, default=200)
+        parser.add_argument(
+            "--consultas-ao-vivo", type=int, default=5,
+            help="O GROUP BY ao vivo é lento; poucas repetições bastam.",
+        )
+
+    def _medir(self, nome, funcao, repeticoes):
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        tempos.sort()
+        p95 = tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))]
+        self.stdout.write(
+            f"{nome:<36} mediana {statistics.median(tempos):9.3f} ms   p95 {p95:9.3f} ms"
+        )
+
+    def handle(self, *args, **options):
+        n = options["usuarios"]
+        semana = rankings.semana_atual()
+        inicio_semana = timezone.make_aware(datetime.combine(semana, dtime.min))
+        fim_semana = inicio_semana + timedelta(days=7)
+
+        with transaction.atomic():
+            self.stdout.write(f"Gerando {n} usuários com uma corrida na semana {semana}...")
+            t0 = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO usuarios (nome, email, hash_senha, participa_ranking)
+                    SELECT 'bench ' || g, 'bench-' || g || '@benchmark.invalid', '!', true
+                    FROM generate_series(1, %s) g
+                    """,
+                    [n],
+                )
+                cursor.execute(
+                    """
+                    WITH s AS (
+                      INSERT INTO sessoes_atividade (usuario_id, modalidade, inicio_em)
+                      SELECT u.id, 'corrida', %s + random() * interval '6 days'
+                      FROM usuarios u WHERE u.email LIKE 'bench-%%@benchmark.invalid'
+                      RETURNING id, inicio_em, usuario_id
+                    )
+                    INSERT INTO metricas_corrida
+                      (sessao_id, sessao_inicio_em, usuario_id, distancia_km, ritmo_medio_seg_km)
+                    SELECT id, inicio_em, usuario_id, round((1 + random() * 41)::numeric, 2), 300 FROM s
+                    """,
+                    [inicio_semana],
+                )
+                # Carga inicial em massa equivalente às atualizações incrementais.
+                cursor.execute(
+                    """
+                    INSERT INTO rankings_semanais (semana, categoria, usuario_id, valor)
+                    SELECT %s, 'distancia_corrida', s.usuario_id, sum(m.distancia_km)
+                    FROM sessoes_atividade s
+                    JOIN metricas_corrida m ON m.sessao_id = s.id
+                    JOIN usuarios u ON u.id = s.usuario_id
+                    WHERE u.email LIKE 'bench-%%@benchmark.invalid'
+                    GROUP BY s.usuario_id
+                    """,
+                    [semana],
+                )
+                cursor.execute(
+                    """
+                    INSERT INTO rankings_contagens AS h (semana, categoria, valor, qtd)
+                    SELECT semana, categoria, valor, count(*)
+                    FROM rankings_semanais
+                    WHERE semana = %s AND categoria = 'distancia_corrida'
+                    GROUP BY 1, 2, 3
+                    ON CONFLICT (semana, categoria, valor) DO UPDATE SET qtd = h.qtd + EXCLUDED.qtd
+                    """,
+                    [semana],
+                )
+                cursor.execute(
+                    "ANALYZE usuarios, sessoes_atividade, metricas_corrida, "
+                    "rankings_semanais, rankings_contagens"
+                )
+                cursor.execute(
+                    "SELECT id FROM usuarios WHERE email LIKE 'bench-%%@benchmark.invalid'"
+                )
+                ids = [row[0] for row in cursor.fetchall()]
+            self.stdout.write(f"Dados gerados em {time.perf_counter() - t0:.1f} s.\n")
+
+            amostra = lambda: random.choice(ids)  # noqa: E731
+            repeticoes = options["consultas"]
+
+            def ao_vivo():
+                with connection.cursor() as cursor:
+                    cursor.execute(_RANKING_AO_VIVO_SQL, [inicio_semana, fim_semana, amostra()])
+                    cursor.fetchall()
+
+            self._medir(
+                "posição (GROUP BY ao vivo)", ao_vivo, options["consultas_ao_vivo"]
+            )
+            self._medir(
+                "posição (pré-calculado)",
+                lambda: rankings.posicao(amostra(), semana, "distancia_corrida"),
+                repeticoes,
+            )
+            self._medir(
+                "top 50 (pré-calculado)",
+                lambda: rankings.pagina(semana, "distancia_corrida"),
+                repeticoes,
+            )
+            # Cursor de uma página do meio: custa o mesmo que o topo na
+            # leitura das linhas; a posição soma os valores acima dela.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT valor, usuario_id FROM rankings_semanais
+                    WHERE semana = %s AND categoria = 'distancia_corrida'
+                    ORDER BY valor DESC, usuario_id
+                    OFFSET %s LIMIT 1
+                    """,
+                    [semana, n // 2],
+                )
+                meio = cursor.fetchone()
+            self._medir(
+                "página do meio (pré-calculado)",
+                lambda: rankings.pagina(semana, "distancia_corrida", meio),
+                repeticoes,
+            )
+            self._medir(
+                "total de participantes",
+                lambda: rankings.total_participantes(semana, "distancia_corrida"),
+                repeticoes,
+            )
+
+            def escrita():
+                usuario = Usuario(id=amostra(), participa_ranking=True)
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "UPDATE metricas_corrida m SET distancia_km = distancia_km + 1 "
+                        "FROM sessoes_atividade s "
+                        "WHERE s.id = m.sessao_id AND s.usuario_id = %s",
+                        [usuario.id],
+                    )
+                rankings.atualizar_usuario(usuario, [inicio_semana])
+
+            self._medir("atualização incremental", escrita, repeticoes)
+
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Dados sintéticos descartados."))
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core import shards
+from core.particoes import TABELAS, arquivar_particoes, criar_particoes, listar_particoes
+
+
+class Command(BaseCommand):
+    help = (
+        "Pré-cria as partições trimestrais futuras de sessoes_atividade e "
+        "marcacoes_habito e, opcionalmente, arquiva as antigas no schema arquivo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--trimestres", type=int, default=4,
+            help="Quantos trimestres garantir a partir do atual (padrão: 4).",
+        )
+        parser.add_argument(
+            "--arquivar-antes", metavar="AAAA-MM-DD",
+            help="Arquiva as partições que terminam até esta data.",
+        )
+        parser.add_argument("--listar", action="store_true", help="Só lista as partições.")
+
+    def handle(self, *args, **options):
+        antes_de = None
+        if options["arquivar_antes"]:
+            antes_de = parse_date(options["arquivar_antes"])
+            if antes_de is None:
+                raise CommandError("Data inválida em --arquivar-antes. Use AAAA-MM-DD.")
+
+        for alias in settings.SHARDS:
+            if len(settings.SHARDS) > 1:
+                self.stdout.write(self.style.MIGRATE_HEADING(alias))
+            with shards.usando(alias):
+                self._gerenciar(options, antes_de)
+
+    def _gerenciar(self, options, antes_de):
+        if options["listar"]:
+            for tabela in TABELAS:
+                self.stdout.write(tabela)
+                for particao in listar_particoes(tabela):
+                    self.stdout.write(f"  {particao.nome}: {particao.inicio} a {particao.fim}")
+            return
+
+        criadas, erros = criar_particoes(timezone.localdate(), options["trimestres"])
+        for nome in criadas:
+            self.stdout.write(f"Criada: {nome}")
+        for erro in erros:
+            self.stderr.write(self.style.ERROR(f"Não criada: {erro}"))
+        if not criadas and not erros:
+            self.stdout.write("Partições futuras já existem.")
+
+        if antes_de:
+            for nome in arquivar_particoes(antes_de):
+                self.stdout.write(f"Arquivada: {nome}")
+
+        self.stdout.write(self.style.SUCCESS("Partições verificadas."))
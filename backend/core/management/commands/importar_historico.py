@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import shards
+from core.importacao import FORMATOS, TAMANHO_LOTE, ler_registros, importar_historico
+from core.models import Usuario
+
+
+class Command(BaseCommand):
+    help = "Importa o histórico de atividades de um usuário a partir de um arquivo NDJSON ou CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("usuario", help="id ou e-mail do usuário")
+        parser.add_argument("arquivo")
+        parser.add_argument("--formato", choices=sorted(FORMATOS))
+        parser.add_argument("--lote", type=int, default=TAMANHO_LOTE)
+
+    def handle(self, *args, **options):
+        usuario_ref = options["usuario"]
+        filtro = {"id": usuario_ref} if usuario_ref.isdigit() else {"email__iexact": usuario_ref}
+        try:
+            usuario = Usuario.objects.get(**filtro)
+        except Usuario.DoesNotExist:
+            raise CommandError(f"Usuário {usuario_ref} não encontrado.")
+
+        arquivo = options["arquivo"]
+        formato = options["formato"] or ("csv" if arquivo.endswith(".csv") else "ndjson")
+
+        with open(arquivo, "rb") as f, shards.usando(shards.alias_do_usuario(usuario)):
+            resumo = importar_historico(
+                usuario.id, ler_registros(f, formato), tamanho_lote=options["lote"]
+            )
+
+        for erro in resumo["erros"]:
+            self.stderr.write(f"linha {erro['linha']}: {erro['erros']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumo['importadas']} sessões importadas, {resumo['total_erros']} com erro."
+        ))
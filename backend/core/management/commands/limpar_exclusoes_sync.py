@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import shards, sync
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga as lápides da sincronização (exclusoes_sync) mais antigas que "
+        "SYNC_RETENCAO_EXCLUSOES_DIAS, em cada shard. Rode diariamente."
+    )
+
+    def handle(self, *args, **options):
+        for alias in settings.SHARDS:
+            with shards.usando(alias):
+                apagadas = sync.limpar_exclusoes()
+            self.stdout.write(f"{alias}: {apagadas} lápides apagadas")
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import idempotencia, shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga as chaves de idempotência vencidas (IDEMPOTENCIA_TTL_HORAS) "
+        "em cada shard. Rode de hora em hora."
+    )
+
+    def handle(self, *args, **options):
+        for alias in settings.SHARDS:
+            with shards.usando(alias):
+                apagadas = idempotencia.limpar_vencidas()
+            self.stdout.write(f"{alias}: {apagadas} chaves apagadas")
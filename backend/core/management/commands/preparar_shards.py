@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Prepara os shards de SHARD_DATABASES: põe as sequências de cada um na "
+        "sua faixa de ids e replica o catálogo de exercícios do banco default."
+    )
+
+    def handle(self, *args, **options):
+        if not shards.sharding_ativo():
+            raise CommandError("Sharding não configurado (SHARD_DATABASES vazio).")
+
+        for alias in settings.SHARDS:
+            shards.preparar_shard(alias)
+            self.stdout.write(f"{alias} ({settings.DATABASES[alias]['NAME']}): pronto")
+        self.stdout.write(self.style.SUCCESS("Shards preparados."))
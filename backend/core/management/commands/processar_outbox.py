@@ -0,0 +1,84 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+
+from core import outbox, shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker do outbox: drena eventos_outbox de cada shard em lotes "
+        "(FOR UPDATE SKIP LOCKED; vários workers podem rodar juntos) e "
+        "executa os tratadores de dados derivados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=outbox.TAMANHO_LOTE)
+        parser.add_argument(
+            "--intervalo", type=float, default=1.0,
+            help="Segundos de espera quando a fila está vazia (padrão: 1).",
+        )
+        parser.add_argument(
+            "--intervalo-metricas", type=float, default=60.0,
+            help="A cada quantos segundos registrar as métricas de atraso (padrão: 60).",
+        )
+        parser.add_argument(
+            "--ate-esvaziar", action="store_true",
+            help="Processa até a fila ficar vazia e termina.",
+        )
+        parser.add_argument(
+            "--metricas", action="store_true", help="Só mostra as métricas da fila."
+        )
+        parser.add_argument(
+            "--reenfileirar-falhos", action="store_true",
+            help="Devolve à fila as tarefas que esgotaram as tentativas.",
+        )
+
+    def _metricas(self):
+        for alias in settings.SHARDS:
+            with shards.usando(alias):
+                m = outbox.metricas()
+            self.stdout.write(
+                f"{alias}: {m['pendentes']} pendentes ({m['prontos']} prontos), "
+                f"atraso {m['atraso_seg']} s, {m['falhos']} falhos"
+            )
+
+    def handle(self, *args, **options):
+        if options["metricas"]:
+            self._metricas()
+            return
+        if options["reenfileirar_falhos"]:
+            for alias in settings.SHARDS:
+                with shards.usando(alias):
+                    self.stdout.write(f"{alias}: {outbox.reenfileirar_falhos()} reenfileirados")
+            return
+
+        processados_total = 0
+        proximas_metricas = time.monotonic() + options["intervalo_metricas"]
+        while True:
+            processados = 0
+            try:
+                for alias in settings.SHARDS:
+                    with shards.usando(alias):
+                        processados += outbox.processar_lote(options["lote"])
+            except OperationalError as exc:
+                # Banco fora do ar: reconecta na próxima volta.
+                self.stderr.write(self.style.ERROR(f"Erro de conexão: {exc}"))
+                connections.close_all()
+                time.sleep(options["intervalo"])
+                continue
+            processados_total += processados
+
+            if time.monotonic() >= proximas_metricas:
+                self.stdout.write(f"{processados_total} tarefas processadas")
+                self._metricas()
+                proximas_metricas = time.monotonic() + options["intervalo_metricas"]
+
+            if processados == 0:
+                if options["ate_esvaziar"]:
+                    break
+                time.sleep(options["intervalo"])
+
+        self.stdout.write(self.style.SUCCESS(f"{processados_total} tarefas processadas."))
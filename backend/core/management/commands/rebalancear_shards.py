@@ -0,0 +1,73 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import shards
+from core.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Move usuários entre shards sem parar a API. Sem --usuario, move os "
+        "usuários cujo shard difere do indicado pelo hashing consistente "
+        "(ex.: depois de adicionar um shard ou ao ativar o sharding)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuario", help="id ou e-mail de um usuário a mover")
+        parser.add_argument("--para", help="shard de destino (com --usuario)")
+        parser.add_argument(
+            "--limite", type=int, default=100,
+            help="Máximo de usuários movidos nesta execução (padrão: 100).",
+        )
+        parser.add_argument(
+            "--espera", type=float, default=settings.SHARD_ESPERA_MIGRACAO_SEG,
+            help="Segundos de espera pelas escritas em andamento de cada usuário.",
+        )
+        parser.add_argument(
+            "--simular", action="store_true", help="Só lista o que seria movido."
+        )
+
+    def handle(self, *args, **options):
+        if not shards.sharding_ativo():
+            raise CommandError("Sharding não configurado (SHARD_DATABASES vazio).")
+
+        if options["usuario"]:
+            if options["para"] not in settings.SHARDS:
+                raise CommandError(f"Use --para com um de: {', '.join(settings.SHARDS)}.")
+            usuario = self._usuario(options["usuario"])
+            movimentos = [(usuario.pk, shards.alias_do_usuario(usuario), options["para"])]
+        else:
+            movimentos = []
+            for movimento in shards.plano_rebalanceamento():
+                movimentos.append(movimento)
+                if len(movimentos) >= options["limite"]:
+                    break
+
+        if not movimentos:
+            self.stdout.write("Nenhum usuário a mover.")
+            return
+
+        for usuario_id, origem, destino in movimentos:
+            if options["simular"]:
+                self.stdout.write(f"usuário {usuario_id}: {origem} -> {destino}")
+                continue
+            inicio = time.perf_counter()
+            linhas = shards.mover_usuario(
+                Usuario.objects.get(pk=usuario_id), destino, options["espera"]
+            )
+            self.stdout.write(
+                f"usuário {usuario_id}: {origem} -> {destino}, {linhas} linhas "
+                f"em {(time.perf_counter() - inicio) * 1000:.0f} ms"
+            )
+
+        if not options["simular"]:
+            self.stdout.write(self.style.SUCCESS(f"{len(movimentos)} usuários movidos."))
+
+    def _usuario(self, ref: str) -> Usuario:
+        filtro = {"id": ref} if ref.isdigit() else {"email__iexact": ref}
+        try:
+            return Usuario.objects.get(**filtro)
+        except Usuario.DoesNotExist:
+            raise CommandError(f"Usuário {ref} não encontrado.")
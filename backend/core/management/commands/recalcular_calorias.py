@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import calorias, shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula as calorias estimadas (e preenche as vazias) de todas as "
+        "sessões, em lotes por id em cada shard. Calorias informadas pelo app "
+        "não são alteradas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tamanho-lote",
+            type=int,
+            default=calorias.TAMANHO_LOTE,
+            help="Sessões lidas e avaliadas por lote.",
+        )
+
+    def handle(self, *args, **options):
+        tamanho = options["tamanho_lote"]
+        total_lidas = total_atualizadas = 0
+        for alias in settings.SHARDS:
+            ultimo = 0
+            with shards.usando(alias):
+                while True:
+                    lidas, ultimo, atualizadas = calorias.recalcular_lote(ultimo, tamanho)
+                    total_lidas += lidas
+                    total_atualizadas += atualizadas
+                    if lidas:
+                        self.stdout.write(
+                            f"{alias}: até a sessão {ultimo}, {atualizadas} atualizadas"
+                        )
+                    if lidas < tamanho:
+                        break
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total_lidas} sessões avaliadas, {total_atualizadas} atualizadas."
+        ))
@@ -0,0 +1,42 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from core.throttling import get_store
+
+
+class Command(BaseCommand):
+    help = "Mostra os contadores dos buckets de throttling da autenticação."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=20,
+            help="Quantidade de buckets com mais rejeições a listar.",
+        )
+
+    def handle(self, *args, **options):
+        buckets = list(get_store().buckets())
+
+        totais = defaultdict(lambda: {"buckets": 0, "aceitas": 0, "rejeitadas": 0})
+        for bucket in buckets:
+            total = totais[bucket["escopo"]]
+            total["buckets"] += 1
+            total["aceitas"] += bucket["aceitas"]
+            total["rejeitadas"] += bucket["rejeitadas"]
+
+        self.stdout.write("Escopo            buckets    aceitas  rejeitadas")
+        for escopo, total in sorted(totais.items()):
+            self.stdout.write(
+                f"{escopo:<16} {total['buckets']:>8} {total['aceitas']:>10} {total['rejeitadas']:>11}"
+            )
+
+        buckets.sort(key=lambda b: b["rejeitadas"], reverse=True)
+        self.stdout.write("")
+        self.stdout.write("Bucket                            escopo        tokens  aceitas  rejeitadas")
+        for bucket in buckets[: options["top"]]:
+            self.stdout.write(
+                f"{bucket['bucket']} {bucket['escopo']:<12} {bucket['tokens']:>7.2f}"
+                f" {bucket['aceitas']:>8} {bucket['rejeitadas']:>11}"
+            )
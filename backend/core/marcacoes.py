@@ -0,0 +1,96 @@
+"""
+Marcação automática de hábitos a partir das sessões.
+
+Metas com `marcar_automaticamente` ganham a marcação do dia (no fuso
+TIME_ZONE) quando o usuário registra uma sessão da mesma modalidade
+dentro do período da meta ativa. Um único INSERT ... ON CONFLICT cobre
+todas as metas e sessões da escrita: cria as marcações que faltam e
+vincula a sessão às marcações manuais do dia que ainda não têm sessão.
+Marcações já vinculadas ficam como estão. O UNIQUE (meta_id, data) do
+banco resolve a concorrência, sem consultas linha a linha.
+
+`manage.py reconciliar_marcacoes` aplica a mesma regra ao histórico, em
+faixas de usuários (metas recém-configuradas, sessões importadas ou
+editadas).
+"""
+from collections import defaultdict
+
+from django.conf import settings
+
+from . import shards
+from .heatmap import invalidar_heatmap
+
+_UPSERT = """
+    INSERT INTO marcacoes_habito (meta_id, usuario_id, data, sessao_id, sessao_inicio_em, concluido)
+    SELECT DISTINCT ON (m.id, s.dia) m.id, m.usuario_id, s.dia, s.id, s.inicio_em, true
+    FROM metas_habito m
+    JOIN LATERAL (
+      SELECT id, inicio_em, (inicio_em AT TIME ZONE %(tz)s)::date AS dia
+      FROM sessoes_atividade
+      WHERE usuario_id = m.usuario_id
+        AND modalidade = m.modalidade
+        AND inicio_em >= (m.data_inicio::timestamp AT TIME ZONE %(tz)s)
+        AND (m.data_fim IS NULL
+             OR inicio_em < ((m.data_fim + 1)::timestamp AT TIME ZONE %(tz)s))
+        AND {filtro_sessoes}
+    ) s ON true
+    WHERE m.ativo AND m.marcar_automaticamente AND {filtro_metas}
+    -- Duas sessões no mesmo dia: vincula a primeira.
+    ORDER BY m.id, s.dia, s.inicio_em
+    ON CONFLICT (meta_id, data) DO UPDATE
+      SET sessao_id = EXCLUDED.sessao_id,
+          sessao_inicio_em = EXCLUDED.sessao_inicio_em,
+          concluido = true
+      WHERE marcacoes_habito.sessao_id IS NULL
+    RETURNING usuario_id, data
+"""
+
+
+def marcar_sessoes(usuario_id: int, sessoes: list) -> int:
+    """
+    Marca as metas automáticas do usuário para as sessões recém-criadas
+    (chame na transação da escrita). Retorna as marcações criadas ou
+    vinculadas.
+    """
+    if not sessoes:
+        return 0
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            _UPSERT.format(
+                filtro_metas="m.usuario_id = %(usuario_id)s",
+                # inicio_em restringe as partições lidas.
+                filtro_sessoes="id = ANY(%(ids)s) AND inicio_em = ANY(%(inicios)s)",
+            ),
+            {
+                "tz": settings.TIME_ZONE,
+                "usuario_id": usuario_id,
+                "ids": [sessao.id for sessao in sessoes],
+                "inicios": [sessao.inicio_em for sessao in sessoes],
+            },
+        )
+        return cursor.rowcount
+
+
+def reconciliar_faixa(usuario_inicio: int, usuario_fim: int) -> int:
+    """
+    Cria ou vincula as marcações automáticas que faltam para os usuários
+    com id entre usuario_inicio e usuario_fim (inclusive), de forma
+    set-based. Retorna quantas marcações foram gravadas.
+    """
+    with shards.transacao(), shards.conexao().cursor() as cursor:
+        cursor.execute(
+            _UPSERT.format(
+                filtro_metas="m.usuario_id BETWEEN %(inicio)s AND %(fim)s",
+                filtro_sessoes="true",
+            ),
+            {"tz": settings.TIME_ZONE, "inicio": usuario_inicio, "fim": usuario_fim},
+        )
+        gravadas = cursor.fetchall()
+
+        # Marcações em anos encerrados mudam os heatmaps já persistidos.
+        datas = defaultdict(list)
+        for usuario_id, data in gravadas:
+            datas[usuario_id].append(data)
+        for usuario_id, datas_usuario in datas.items():
+            invalidar_heatmap(usuario_id, datas_usuario)
+    return len(gravadas)
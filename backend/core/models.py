@@ -13,7 +13,19 @@ class Usuario(models.Model):
     nome = models.CharField(max_length=120)
     email = models.EmailField(max_length=254, unique=True)
     hash_senha = models.TextField()
+    # Opt-in nos rankings semanais (core/rankings.py).
+    participa_ranking = models.BooleanField(default=False)
+    # Usado na estimativa de calorias (core/calorias.py).
+    peso_kg = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
+    # Limites das zonas de FC dos sensores (core/sensores.py).
+    fc_maxima = models.PositiveSmallIntegerField(blank=True, null=True)
     criado_em = models.DateTimeField(auto_now_add=True)
+    # Shard dos dados do usuário (core/shards.py); vazio = banco default.
+    shard = models.CharField(max_length=63, blank=True, null=True)
+    # Preenchido enquanto os dados são movidos de shard (escritas bloqueadas).
+    shard_migrando_desde = models.DateTimeField(blank=True, null=True)
+    # Exclusão pedida (core/exclusao.py): tokens recusados, dados sendo apagados.
+    excluido_em = models.DateTimeField(blank=True, null=True)
 
     @property
     def is_authenticated(self):
@@ -90,6 +102,7 @@ class SessaoAtividade(models.Model):
     inicio_em = models.DateTimeField()
     duracao_seg = models.IntegerField(blank=True, null=True)
     calorias = models.IntegerField(blank=True, null=True)
+    calorias_estimadas = models.BooleanField(default=False)
     observacoes = models.TextField(blank=True, null=True)
     criado_em = models.DateTimeField(auto_now_add=True)
 
@@ -123,6 +136,15 @@ class MetricasCorrida(models.Model):
         db_column="sessao_id",
         related_name="metricas_corrida",
     )
+    # Parte da FK composta para a tabela particionada de sessões.
+    sessao_inicio_em = models.DateTimeField()
+    # Denormalizado da sessão para a sincronização (core/sync.py) sem join.
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        db_column="usuario_id",
+        related_name="metricas_corrida",
+    )
     distancia_km = models.DecimalField(max_digits=7, decimal_places=2)
     ritmo_medio_seg_km = models.IntegerField()
     fc_media = models.SmallIntegerField(blank=True, null=True)
@@ -147,6 +169,15 @@ class MetricasCiclismo(models.Model):
         db_column="sessao_id",
         related_name="metricas_ciclismo",
     )
+    # Parte da FK composta para a tabela particionada de sessões.
+    sessao_inicio_em = models.DateTimeField()
+    # Denormalizado da sessão para a sincronização (core/sync.py) sem join.
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        db_column="usuario_id",
+        related_name="metricas_ciclismo",
+    )
     distancia_km = models.DecimalField(max_digits=7, decimal_places=2)
     velocidade_media_kmh = models.DecimalField(max_digits=5, decimal_places=2)
     fc_media = models.SmallIntegerField(blank=True, null=True)
@@ -171,6 +202,15 @@ class SerieMusculacao(models.Model):
         db_column="sessao_id",
         related_name="series_musculacao",
     )
+    # Denormalizados da sessão para o histórico por exercício sem join;
+    # inicio_em também compõe a FK para a tabela particionada de sessões.
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        db_column="usuario_id",
+        related_name="series_musculacao",
+    )
+    inicio_em = models.DateTimeField()
     exercicio = models.ForeignKey(
         Exercicio,
         on_delete=models.PROTECT,
@@ -198,6 +238,10 @@ class SerieMusculacao(models.Model):
                 fields=["exercicio"],
                 name="idx_series_exercicio",
             ),
+            models.Index(
+                fields=["usuario", "exercicio", "-inicio_em"],
+                name="idx_series_usuario_exercicio",
+            ),
         ]
 
     def __str__(self) -> str:
@@ -233,6 +277,7 @@ class MetaHabito(models.Model):
     duracao_meta_min = models.IntegerField(blank=True, null=True)
     sessoes_meta = models.IntegerField(blank=True, null=True)
     ativo = models.BooleanField(default=True)
+    marcar_automaticamente = models.BooleanField(default=False)
     criado_em = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -270,6 +315,7 @@ class MarcacaoHabito(models.Model):
         blank=True,
         null=True,
     )
+    sessao_inicio_em = models.DateTimeField(blank=True, null=True)
     concluido = models.BooleanField(default=True)
     criado_em = models.DateTimeField(auto_now_add=True)
 
@@ -280,3 +326,80 @@ class MarcacaoHabito(models.Model):
 
     def __str__(self) -> str:
         return f"{self.meta} em {self.data}"
+
+
+class RecordePessoal(models.Model):
+    """
+    Melhor série (1RM estimado) e carga máxima por usuário e exercício.
+    Mantida a cada escrita de série (core/recordes.py).
+    Tabela: recordes_pessoais
+    """
+    id = models.BigAutoField(primary_key=True)
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        db_column="usuario_id",
+        related_name="recordes",
+    )
+    exercicio = models.ForeignKey(
+        Exercicio,
+        on_delete=models.CASCADE,
+        db_column="exercicio_id",
+        related_name="recordes",
+    )
+    melhor_serie = models.ForeignKey(
+        SerieMusculacao,
+        on_delete=models.SET_NULL,
+        db_column="melhor_serie_id",
+        related_name="+",
+        blank=True,
+        null=True,
+    )
+    carga_kg = models.DecimalField(max_digits=6, decimal_places=2)
+    repeticoes = models.IntegerField()
+    rm_estimado_kg = models.DecimalField(max_digits=7, decimal_places=2)
+    carga_maxima_kg = models.DecimalField(max_digits=6, decimal_places=2)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        managed = False
+        db_table = "recordes_pessoais"
+        unique_together = ("usuario", "exercicio")
+
+    def __str__(self) -> str:
+        return f"{self.exercicio} - {self.rm_estimado_kg} kg ({self.usuario})"
+
+
+class MelhorEsforcoCorrida(models.Model):
+    """
+    Sessão de corrida mais rápida por distância padrão (5k, 10k, 21k, 42k).
+    Mantida a cada escrita de métricas de corrida (core/esforcos.py).
+    Tabela: melhores_esforcos_corrida
+    """
+    id = models.BigAutoField(primary_key=True)
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        db_column="usuario_id",
+        related_name="melhores_esforcos",
+    )
+    distancia_alvo = models.CharField(max_length=10)
+    sessao = models.ForeignKey(
+        SessaoAtividade,
+        on_delete=models.CASCADE,
+        db_column="sessao_id",
+        related_name="+",
+    )
+    sessao_inicio_em = models.DateTimeField()
+    distancia_km = models.DecimalField(max_digits=7, decimal_places=2)
+    ritmo_medio_seg_km = models.IntegerField()
+    tempo_estimado_seg = models.IntegerField()
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        managed = False
+        db_table = "melhores_esforcos_corrida"
+        unique_together = ("usuario", "distancia_alvo")
+
+    def __str__(self) -> str:
+        return f"{self.distancia_alvo} - {self.tempo_estimado_seg}s ({self.usuario})"
@@ -0,0 +1,153 @@
+"""
+Outbox transacional para dados derivados (rankings, melhores esforços,
+recordes pessoais).
+
+As views gravam a tarefa com `registrar` na mesma transação da escrita
+(`with shards.transacao()`), então a tarefa existe se e somente se a
+escrita foi confirmada. O worker (`manage.py processar_outbox`) drena a
+tabela de cada shard em lotes com SELECT ... FOR UPDATE SKIP LOCKED, de
+modo que vários workers dividem o trabalho sem se bloquear.
+
+- Cada tipo tem um tratador `(usuario_id, lista de dados)`. No lote, as
+  tarefas do mesmo tipo e usuário são entregues juntas, em uma chamada
+  (ex.: várias sessões da mesma semana viram um único recálculo).
+- Tratadores devem ser idempotentes: uma tarefa pode rodar de novo se o
+  worker cair depois do tratador e antes do commit.
+- Falhas voltam para a fila com backoff exponencial; depois de
+  MAX_TENTATIVAS a tarefa fica marcada em `falhou_em`.
+- Tipos em TIPOS_ISOLADOS (trabalho pesado, como a exclusão de conta)
+  rodam fora do lote: uma tarefa por vez, na sua própria transação.
+
+Invalidações de cache continuam síncronas nas views, para que o próprio
+usuário leia o que acabou de gravar.
+"""
+import json
+import logging
+from itertools import groupby
+from operator import itemgetter
+from typing import Any
+
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from . import shards
+
+logger = logging.getLogger(__name__)
+
+TRATADORES = {
+    "rankings": "core.rankings.processar_eventos",
+    "melhores_esforcos": "core.esforcos.processar_eventos",
+    "recorde_pessoal": "core.recordes.processar_eventos",
+    "exclusao_conta": "core.exclusao.processar_eventos",
+    "calorias": "core.calorias.processar_eventos",
+    "heatmap": "core.heatmap.processar_eventos",
+}
+
+TIPOS_ISOLADOS = ("exclusao_conta",)
+
+TAMANHO_LOTE = 100
+MAX_TENTATIVAS = 10
+BACKOFF_BASE_SEG = 2
+BACKOFF_MAXIMO_SEG = 3600
+
+
+def registrar(usuario_id: int, tipo: str, **dados: Any) -> None:
+    """Enfileira uma tarefa no shard ativo (use dentro da transação da escrita)."""
+    if tipo not in TRATADORES:
+        raise ValueError(f"Tipo de evento sem tratador: {tipo}")
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO eventos_outbox (usuario_id, tipo, dados) VALUES (%s, %s, %s)",
+            [usuario_id, tipo, json.dumps(dados, default=str)],
+        )
+
+
+def processar_lote(tamanho: int = TAMANHO_LOTE) -> int:
+    """
+    Processa até `tamanho` tarefas prontas do shard ativo e, numa transação
+    à parte, uma dos TIPOS_ISOLADOS. Devolve quantas foram lidas (0 = fila
+    vazia).
+    """
+    return _processar(tamanho, isoladas=False) + _processar(1, isoladas=True)
+
+
+def _processar(tamanho: int, isoladas: bool) -> int:
+    alias = shards.alias_atual()
+    with shards.transacao(), shards.conexao().cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT id, usuario_id, tipo, dados FROM eventos_outbox
+            WHERE falhou_em IS NULL AND disponivel_em <= now()
+              AND (tipo = ANY(%s)) = %s
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            [list(TIPOS_ISOLADOS), isoladas, tamanho],
+        )
+        eventos = cursor.fetchall()
+
+        concluidos, falhas = [], []
+        chave = itemgetter(2, 1)  # (tipo, usuario_id)
+        for (tipo, usuario_id), grupo in groupby(sorted(eventos, key=chave), key=chave):
+            grupo = list(grupo)
+            ids = [evento[0] for evento in grupo]
+            try:
+                # Savepoint: uma falha desfaz só as escritas deste grupo.
+                with transaction.atomic(using=alias):
+                    dados = [json.loads(e[3]) if isinstance(e[3], str) else e[3] for e in grupo]
+                    import_string(TRATADORES[tipo])(usuario_id, dados)
+            except Exception as exc:
+                logger.exception("Falha no evento %s do usuário %s", tipo, usuario_id)
+                falhas.append((ids, f"{type(exc).__name__}: {exc}"))
+            else:
+                concluidos.extend(ids)
+
+        if concluidos:
+            cursor.execute("DELETE FROM eventos_outbox WHERE id = ANY(%s)", [concluidos])
+        for ids, erro in falhas:
+            cursor.execute(
+                """
+                UPDATE eventos_outbox
+                SET tentativas = tentativas + 1,
+                    ultimo_erro = %s,
+                    disponivel_em = now() + make_interval(
+                      secs => least(%s * power(2, tentativas), %s)),
+                    falhou_em = CASE WHEN tentativas + 1 >= %s THEN now() END
+                WHERE id = ANY(%s)
+                """,
+                [erro, BACKOFF_BASE_SEG, BACKOFF_MAXIMO_SEG, MAX_TENTATIVAS, ids],
+            )
+    return len(eventos)
+
+
+def metricas() -> dict[str, Any]:
+    """Tamanho da fila, atraso da tarefa pendente mais antiga e falhas do shard ativo."""
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT count(*) FILTER (WHERE falhou_em IS NULL),
+                   count(*) FILTER (WHERE falhou_em IS NULL AND disponivel_em <= now()),
+                   COALESCE(extract(epoch FROM now() - min(criado_em)
+                                    FILTER (WHERE falhou_em IS NULL)), 0),
+                   count(*) FILTER (WHERE falhou_em IS NOT NULL)
+            FROM eventos_outbox
+            """
+        )
+        pendentes, prontos, atraso, falhos = cursor.fetchone()
+    return {
+        "pendentes": pendentes,
+        "prontos": prontos,
+        "atraso_seg": round(float(atraso), 1),
+        "falhos": falhos,
+    }
+
+
+def reenfileirar_falhos() -> int:
+    """Devolve as tarefas esgotadas do shard ativo para a fila."""
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            "UPDATE eventos_outbox SET falhou_em = NULL, tentativas = 0, disponivel_em = now() "
+            "WHERE falhou_em IS NOT NULL"
+        )
+        return cursor.rowcount
@@ -0,0 +1,144 @@
+"""
+Manutenção das partições trimestrais de sessoes_atividade e
+marcacoes_habito (veja criar_particao_trimestral em db/init/01_schema.sql).
+
+- `criar_particoes` pré-cria os próximos trimestres. Cada partição é
+  criada solta e anexada (ATTACH), sem travar leituras e escritas.
+- `arquivar_particoes` desanexa os trimestres antigos e os move para o
+  schema `arquivo`. As linhas que referenciam sessões arquivadas
+  (métricas, séries, rotas e sensores) vão junto para tabelas no mesmo
+  schema; marcações
+  perdem o vínculo com a sessão e os melhores esforços dos usuários
+  afetados são recalculados pelo worker do outbox com o que continua na
+  base, depois do commit (o DETACH trava a tabela-mãe até lá).
+
+O DETACH não usa CONCURRENTLY: ele não roda em bloco de transação (e o
+arquivamento precisa mover os dependentes atomicamente) nem em tabelas
+com partição padrão, que as duas tabelas têm.
+"""
+from dataclasses import dataclass
+from datetime import date
+
+from django.db import DatabaseError
+
+from . import esforcos
+from . import shards
+
+TABELAS = ("sessoes_atividade", "marcacoes_habito")
+SCHEMA_ARQUIVO = "arquivo"
+
+# Tabelas que apontam para sessões, com a coluna de inicio_em da FK.
+_DEPENDENTES_SESSAO = (
+    ("metricas_corrida", "sessao_inicio_em"),
+    ("metricas_ciclismo", "sessao_inicio_em"),
+    ("series_musculacao", "inicio_em"),
+    ("rotas_sessao", "sessao_inicio_em"),
+    ("blocos_sensores", "sessao_inicio_em"),
+)
+
+
+@dataclass
+class Particao:
+    nome: str
+    inicio: date
+    fim: date
+
+
+def _proximo_trimestre(dia: date) -> date:
+    mes = (dia.month - 1) // 3 * 3 + 1
+    ano, mes = (dia.year + 1, 1) if mes == 10 else (dia.year, mes + 3)
+    return date(ano, mes, 1)
+
+
+def listar_particoes(tabela: str) -> list[Particao]:
+    """Partições de intervalo da tabela (sem a partição padrão), em ordem."""
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname,
+                   (regexp_match(pg_get_expr(c.relpartbound, c.oid),
+                                 'FROM \\(''([0-9-]+)'))[1]::date,
+                   (regexp_match(pg_get_expr(c.relpartbound, c.oid),
+                                 'TO \\(''([0-9-]+)'))[1]::date
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+              AND pg_get_expr(c.relpartbound, c.oid) <> 'DEFAULT'
+            ORDER BY 2
+            """,
+            [tabela],
+        )
+        return [Particao(*row) for row in cursor.fetchall()]
+
+
+def criar_particoes(a_partir_de: date, trimestres: int) -> tuple[list[str], list[str]]:
+    """
+    Garante as partições de `trimestres` trimestres a partir do que contém
+    `a_partir_de`. Devolve (criadas, erros); um trimestre que colida com
+    linhas da partição padrão é reportado e os demais seguem.
+    """
+    criadas, erros = [], []
+    for tabela in TABELAS:
+        dia = a_partir_de
+        for _ in range(trimestres):
+            try:
+                with shards.transacao(), shards.conexao().cursor() as cursor:
+                    cursor.execute("SELECT criar_particao_trimestral(%s, %s)", [tabela, dia])
+                    nome = cursor.fetchone()[0]
+                if nome:
+                    criadas.append(nome)
+            except DatabaseError as exc:
+                erros.append(f"{tabela} {dia:%Y-%m}: {exc}".strip())
+            dia = _proximo_trimestre(dia)
+    return criadas, erros
+
+
+def _arquivar_sessoes(cursor, particao: Particao) -> set[int]:
+    """Move os dependentes da partição; devolve os usuários a recalcular."""
+    filtro = "(sessao_id, {coluna}) IN (SELECT id, inicio_em FROM {particao})"
+    sufixo = particao.nome.removeprefix("sessoes_atividade_")
+
+    for tabela, coluna in _DEPENDENTES_SESSAO:
+        condicao = filtro.format(coluna=coluna, particao=particao.nome)
+        cursor.execute(
+            f"CREATE TABLE {SCHEMA_ARQUIVO}.{tabela}_{sufixo} AS "
+            f"SELECT * FROM {tabela} WHERE {condicao}"
+        )
+        cursor.execute(f"DELETE FROM {tabela} WHERE {condicao}")
+
+    cursor.execute(
+        "UPDATE marcacoes_habito SET sessao_id = NULL, sessao_inicio_em = NULL "
+        "WHERE sessao_inicio_em >= %s AND sessao_inicio_em < %s",
+        [particao.inicio, particao.fim],
+    )
+    cursor.execute(
+        f"DELETE FROM melhores_esforcos_corrida "
+        f"WHERE {filtro.format(coluna='sessao_inicio_em', particao=particao.nome)} "
+        f"RETURNING usuario_id"
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def arquivar_particoes(antes_de: date) -> list[str]:
+    """
+    Arquiva as partições que terminam até `antes_de`. Cada partição é
+    arquivada na sua própria transação.
+    """
+    arquivadas = []
+    for tabela in ("marcacoes_habito", "sessoes_atividade"):
+        for particao in listar_particoes(tabela):
+            if particao.fim > antes_de:
+                continue
+            with shards.transacao(), shards.conexao().cursor() as cursor:
+                # Arquivar não é excluir: os apps podem manter a cópia local.
+                cursor.execute("SET LOCAL app.sem_exclusoes_sync = on")
+                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_ARQUIVO}")
+                usuarios = set()
+                if tabela == "sessoes_atividade":
+                    usuarios = _arquivar_sessoes(cursor, particao)
+                cursor.execute(f"ALTER TABLE {tabela} DETACH PARTITION {particao.nome}")
+                cursor.execute(f"ALTER TABLE {particao.nome} SET SCHEMA {SCHEMA_ARQUIVO}")
+                for usuario_id in sorted(usuarios):
+                    esforcos.agendar_recalculo(usuario_id)
+            arquivadas.append(f"{SCHEMA_ARQUIVO}.{particao.nome}")
+    return arquivadas
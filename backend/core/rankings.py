@@ -0,0 +1,323 @@
+"""
+Rankings semanais (opt-in) de distância de corrida, distância de ciclismo
+e número de sessões.
+
+rankings_semanais guarda o valor de cada participante por (semana,
+categoria) e rankings_contagens o histograma de valores (quantos
+participantes têm cada valor). Assim:
+
+- a posição de um usuário é 1 + soma das contagens com valor maior, uma
+  varredura de índice que depende do número de valores distintos acima
+  dele e não do número de participantes (valores com qtd 0 são apagados);
+- as páginas são lidas na ordem do índice (semana, categoria, valor DESC,
+  usuario_id), a partir do último par (valor, usuario_id) da página
+  anterior, sem OFFSET.
+
+As tabelas são mantidas a cada escrita de sessões e métricas: só a
+semana afetada do próprio usuário é recalculada, e o histograma recebe
+-1 no valor antigo e +1 no novo. Usuários que não participam não geram
+nenhuma query extra.
+
+Com sharding (core/shards.py), as tabelas de ranking ficam no banco
+diretório (default) e os valores da semana são lidos do shard do usuário.
+"""
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import outbox, shards
+from .analise import inicio_da_semana
+from .models import Usuario
+
+CATEGORIAS = ("distancia_corrida", "distancia_ciclismo", "sessoes")
+TAMANHO_PAGINA = 50
+
+# Totais do usuário por semana (lidos do shard dele).
+_VALORES_SQL = """
+    SELECT date_trunc('week', s.inicio_em AT TIME ZONE %(tz)s)::date AS semana,
+           COALESCE(sum(mc.distancia_km), 0) AS distancia_corrida,
+           COALESCE(sum(mci.distancia_km), 0) AS distancia_ciclismo,
+           count(*)::numeric AS sessoes
+    FROM sessoes_atividade s
+    LEFT JOIN metricas_corrida mc ON mc.sessao_id = s.id
+    LEFT JOIN metricas_ciclismo mci ON mci.sessao_id = s.id
+    WHERE s.usuario_id = %(usuario_id)s {periodo}
+    GROUP BY 1
+"""
+
+_PERIODO_SEMANA = """
+      AND s.inicio_em >= (%(semana)s::date::timestamp AT TIME ZONE %(tz)s)
+      AND s.inicio_em < ((%(semana)s::date + 7)::timestamp AT TIME ZONE %(tz)s)
+"""
+
+# Reconstrução set-based de todas as semanas de um usuário, a partir dos
+# totais lidos do shard.
+_RECONSTRUCAO_SQL = """
+    WITH v AS (
+      SELECT * FROM unnest(%(semanas)s::date[], %(corrida)s::numeric[],
+                           %(ciclismo)s::numeric[], %(sessoes)s::numeric[])
+        AS v(semana, corrida, ciclismo, sessoes)
+    ),
+    linhas AS (
+      INSERT INTO rankings_semanais (semana, categoria, usuario_id, valor, atualizado_em)
+      SELECT v.semana, c.categoria, %(usuario_id)s, c.valor, now()
+      FROM v
+      CROSS JOIN LATERAL (VALUES
+        ('distancia_corrida', v.corrida),
+        ('distancia_ciclismo', v.ciclismo),
+        ('sessoes', v.sessoes)
+      ) AS c(categoria, valor)
+      WHERE c.valor > 0
+      RETURNING semana, categoria, valor
+    )
+    INSERT INTO rankings_contagens AS h (semana, categoria, valor, qtd)
+    SELECT semana, categoria, valor, 1 FROM linhas
+    ORDER BY semana, categoria, valor
+    ON CONFLICT (semana, categoria, valor) DO UPDATE SET qtd = h.qtd + 1
+"""
+
+_AJUSTE_HISTOGRAMA_SQL = """
+    INSERT INTO rankings_contagens AS h (semana, categoria, valor, qtd)
+    VALUES {valores}
+    ON CONFLICT (semana, categoria, valor) DO UPDATE SET qtd = h.qtd + EXCLUDED.qtd
+"""
+
+_POSICAO_SQL = """
+    1 + COALESCE((
+      SELECT sum(h.qtd) FROM rankings_contagens h
+      WHERE h.semana = r.semana AND h.categoria = r.categoria AND h.valor > r.valor
+    ), 0)
+"""
+
+_LIMPAR_ZERADAS_SQL = """
+    DELETE FROM rankings_contagens
+    WHERE semana = %s AND categoria = %s AND valor = ANY(%s) AND qtd <= 0
+"""
+
+# Página seguinte ao par (valor, usuario_id) da anterior, com a posição de
+# cada valor distinto pelo histograma (uma varredura até o menor valor).
+_PAGINA_SQL = """
+    WITH r AS (
+      SELECT usuario_id, valor FROM rankings_semanais
+      WHERE semana = %(semana)s AND categoria = %(categoria)s {apos}
+      ORDER BY valor DESC, usuario_id
+      LIMIT %(tamanho)s
+    ),
+    posicoes AS (
+      SELECT valor, 1 + COALESCE(sum(qtd) OVER (
+               ORDER BY valor DESC ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+             ), 0) AS posicao
+      FROM rankings_contagens
+      WHERE semana = %(semana)s AND categoria = %(categoria)s
+        AND valor >= (SELECT min(valor) FROM r)
+    )
+    SELECT r.usuario_id, u.nome, r.valor, p.posicao
+    FROM r
+    JOIN posicoes p USING (valor)
+    JOIN usuarios u ON u.id = r.usuario_id
+    ORDER BY r.valor DESC, r.usuario_id
+"""
+
+_APOS_SQL = """
+      AND valor <= %(valor)s AND (valor < %(valor)s OR usuario_id > %(usuario_id)s)
+"""
+
+
+def _valores(usuario_id: int, semana: Optional[date] = None) -> dict[date, dict]:
+    """Totais por semana e categoria do usuário (só `semana`, se informada)."""
+    sql = _VALORES_SQL.format(periodo=_PERIODO_SEMANA if semana else "")
+    params = {"usuario_id": usuario_id, "semana": semana, "tz": timezone.get_current_timezone_name()}
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(sql, params)
+        return {
+            linha[0]: dict(zip(CATEGORIAS, linha[1:])) for linha in cursor.fetchall()
+        }
+
+
+def _bloquear(cursor, usuario_id: int) -> None:
+    """Serializa as atualizações de ranking de um mesmo usuário."""
+    cursor.execute(
+        "SELECT pg_advisory_xact_lock(hashtextextended('rankings:' || %s, 0))",
+        [usuario_id],
+    )
+
+
+def _aplicar(cursor, usuario_id: int, semana: date, categoria: str, anterior, novo) -> None:
+    if novo > 0:
+        cursor.execute(
+            """
+            INSERT INTO rankings_semanais AS r (semana, categoria, usuario_id, valor, atualizado_em)
+            VALUES (%s, %s, %s, %s, now())
+            ON CONFLICT (semana, categoria, usuario_id)
+            DO UPDATE SET valor = EXCLUDED.valor, atualizado_em = now()
+            """,
+            [semana, categoria, usuario_id, novo],
+        )
+    else:
+        cursor.execute(
+            "DELETE FROM rankings_semanais "
+            "WHERE semana = %s AND categoria = %s AND usuario_id = %s",
+            [semana, categoria, usuario_id],
+        )
+
+    ajustes = []
+    if anterior is not None:
+        ajustes.append((anterior, -1))
+    if novo > 0:
+        ajustes.append((novo, 1))
+    # Ordem fixa de valores para evitar deadlock entre escritas concorrentes.
+    ajustes.sort()
+    cursor.execute(
+        _AJUSTE_HISTOGRAMA_SQL.format(valores=", ".join(["(%s, %s, %s, %s)"] * len(ajustes))),
+        [p for valor, delta in ajustes for p in (semana, categoria, valor, delta)],
+    )
+    if anterior is not None:
+        cursor.execute(_LIMPAR_ZERADAS_SQL, [semana, categoria, [anterior]])
+
+
+def atualizar_usuario(usuario, inicios: Iterable[Optional[datetime]]) -> None:
+    """
+    Recalcula as semanas (locais) das sessões informadas para o usuário,
+    se ele participa dos rankings.
+    """
+    if not getattr(usuario, "participa_ranking", False):
+        return
+    semanas = sorted({
+        inicio_da_semana(timezone.localtime(inicio).date())
+        for inicio in inicios if inicio is not None
+    })
+    if not semanas:
+        return
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        _bloquear(cursor, usuario.id)
+        for semana in semanas:
+            novos = _valores(usuario.id, semana).get(semana, {})
+            cursor.execute(
+                "SELECT categoria, valor FROM rankings_semanais "
+                "WHERE semana = %s AND usuario_id = %s",
+                [semana, usuario.id],
+            )
+            anteriores = dict(cursor.fetchall())
+            for categoria in CATEGORIAS:
+                novo, anterior = novos.get(categoria, 0), anteriores.get(categoria)
+                if novo == (anterior or 0):
+                    continue
+                _aplicar(cursor, usuario.id, semana, categoria, anterior, novo)
+
+
+def agendar(usuario, inicios: Iterable[Optional[datetime]]) -> None:
+    """
+    Enfileira no outbox o recálculo das semanas das sessões informadas
+    (só para quem participa). Chame na transação da escrita.
+    """
+    if getattr(usuario, "participa_ranking", False):
+        outbox.registrar(usuario.id, "rankings", inicios=[i for i in inicios if i is not None])
+
+
+def processar_eventos(usuario_id: int, eventos: list[dict]) -> None:
+    """Tratador do outbox: recalcula de uma vez as semanas de todos os eventos."""
+    usuario = Usuario.objects.filter(pk=usuario_id, excluido_em__isnull=True).first()
+    if usuario is None:
+        return
+    atualizar_usuario(usuario, [
+        datetime.fromisoformat(inicio) for evento in eventos for inicio in evento["inicios"]
+    ])
+
+
+def remover_usuario(usuario_id: int) -> None:
+    """Tira o usuário de todos os rankings (opt-out ou exclusão da conta)."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        _bloquear(cursor, usuario_id)
+        cursor.execute(
+            """
+            WITH apagadas AS (
+              DELETE FROM rankings_semanais WHERE usuario_id = %s
+              RETURNING semana, categoria, valor
+            )
+            UPDATE rankings_contagens h SET qtd = h.qtd - 1
+            FROM apagadas a
+            WHERE h.semana = a.semana AND h.categoria = a.categoria AND h.valor = a.valor
+            RETURNING h.semana, h.categoria, h.valor, h.qtd
+            """,
+            [usuario_id],
+        )
+        # O DELETE vem num comando à parte: o mesmo comando não enxerga o
+        # UPDATE, e o `qtd <= 0` é reavaliado se outra escrita mudou a linha.
+        for semana, categoria, valor, qtd in cursor.fetchall():
+            if qtd <= 0:
+                cursor.execute(_LIMPAR_ZERADAS_SQL, [semana, categoria, [valor]])
+
+
+def reconstruir_usuario(usuario_id: int) -> None:
+    """Refaz todas as semanas do usuário (opt-in ou importação)."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Lê os valores já com o lock: uma atualização concorrente termina
+        # antes e a leitura a enxerga.
+        _bloquear(cursor, usuario_id)
+        valores = _valores(usuario_id)
+        semanas = sorted(valores)
+        remover_usuario(usuario_id)
+        cursor.execute(
+            _RECONSTRUCAO_SQL,
+            {
+                "usuario_id": usuario_id,
+                "semanas": semanas,
+                **{
+                    coluna: [valores[semana][categoria] for semana in semanas]
+                    for coluna, categoria in zip(("corrida", "ciclismo", "sessoes"), CATEGORIAS)
+                },
+            },
+        )
+
+
+def posicao(usuario_id: int, semana: date, categoria: str) -> Optional[dict]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT r.valor, {_POSICAO_SQL}
+            FROM rankings_semanais r
+            WHERE r.semana = %s AND r.categoria = %s AND r.usuario_id = %s
+            """,
+            [semana, categoria, usuario_id],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return {"posicao": int(row[1]), "valor": row[0]}
+
+
+def total_participantes(semana: date, categoria: str) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COALESCE(sum(qtd), 0) FROM rankings_contagens "
+            "WHERE semana = %s AND categoria = %s",
+            [semana, categoria],
+        )
+        return int(cursor.fetchone()[0])
+
+
+def pagina(
+    semana: date, categoria: str, apos: Optional[tuple] = None, tamanho: int = TAMANHO_PAGINA
+) -> list[dict]:
+    """
+    Página do ranking depois do par (valor, usuario_id) `apos` (o último da
+    página anterior; None para o topo), com empates na mesma posição.
+    """
+    params = {"semana": semana, "categoria": categoria, "tamanho": tamanho}
+    if apos is not None:
+        params["valor"], params["usuario_id"] = apos
+    with connection.cursor() as cursor:
+        cursor.execute(_PAGINA_SQL.format(apos=_APOS_SQL if apos else ""), params)
+        linhas = cursor.fetchall()
+    return [
+        {"posicao": int(pos), "usuario": usuario_id, "nome": nome, "valor": valor}
+        for usuario_id, nome, valor, pos in linhas
+    ]
+
+
+def semana_atual() -> date:
+    return inicio_da_semana(timezone.localdate())
+
@@ -0,0 +1,139 @@
+"""
+Recordes pessoais de musculação (melhor série e 1RM estimado).
+
+A tabela recordes_pessoais guarda, por (usuário, exercício), a série com
+maior 1RM estimado (fórmula de Epley) e a maior carga já usada. Ela é
+mantida de forma incremental: criar uma série faz um único upsert, e só
+alterações/exclusões da série que detém o recorde disparam um recálculo,
+limitado ao exercício afetado.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional
+
+from . import outbox, shards
+
+# Mesma fórmula do Python (estimar_1rm) em SQL, para recálculos e backfill.
+RM_SQL = (
+    "CASE WHEN sm.repeticoes = 1 THEN sm.carga_kg "
+    "ELSE round(sm.carga_kg * (1 + sm.repeticoes / 30.0), 2) END"
+)
+
+_UPSERT = """
+    INSERT INTO recordes_pessoais AS r
+      (usuario_id, exercicio_id, melhor_serie_id, carga_kg, repeticoes,
+       rm_estimado_kg, carga_maxima_kg, atualizado_em)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, now())
+    ON CONFLICT (usuario_id, exercicio_id) DO UPDATE SET
+      melhor_serie_id = CASE WHEN EXCLUDED.rm_estimado_kg > r.rm_estimado_kg
+                             THEN EXCLUDED.melhor_serie_id ELSE r.melhor_serie_id END,
+      carga_kg = CASE WHEN EXCLUDED.rm_estimado_kg > r.rm_estimado_kg
+                      THEN EXCLUDED.carga_kg ELSE r.carga_kg END,
+      repeticoes = CASE WHEN EXCLUDED.rm_estimado_kg > r.rm_estimado_kg
+                        THEN EXCLUDED.repeticoes ELSE r.repeticoes END,
+      rm_estimado_kg = GREATEST(r.rm_estimado_kg, EXCLUDED.rm_estimado_kg),
+      carga_maxima_kg = GREATEST(r.carga_maxima_kg, EXCLUDED.carga_maxima_kg),
+      atualizado_em = now()
+    WHERE EXCLUDED.rm_estimado_kg > r.rm_estimado_kg
+       OR EXCLUDED.carga_maxima_kg > r.carga_maxima_kg
+    RETURNING melhor_serie_id
+"""
+
+# Recalcula a partir das séries; {filtro} restringe usuário/exercício.
+_RECALCULO = f"""
+    INSERT INTO recordes_pessoais
+      (usuario_id, exercicio_id, melhor_serie_id, carga_kg, repeticoes,
+       rm_estimado_kg, carga_maxima_kg, atualizado_em)
+    SELECT DISTINCT ON (sm.usuario_id, sm.exercicio_id)
+      sm.usuario_id, sm.exercicio_id, sm.id, sm.carga_kg, sm.repeticoes,
+      {RM_SQL},
+      max(sm.carga_kg) OVER (PARTITION BY sm.usuario_id, sm.exercicio_id),
+      now()
+    FROM series_musculacao sm
+    WHERE sm.carga_kg > 0 AND sm.repeticoes > 0 AND {{filtro}}
+    ORDER BY sm.usuario_id, sm.exercicio_id, {RM_SQL} DESC, sm.id
+"""
+
+
+def estimar_1rm(carga_kg, repeticoes) -> Optional[Decimal]:
+    """1RM estimado (Epley). None se a série não tiver carga e repetições."""
+    if not carga_kg or not repeticoes or carga_kg <= 0 or repeticoes <= 0:
+        return None
+    carga = Decimal(carga_kg)
+    if repeticoes == 1:
+        return carga
+    rm = carga * (1 + Decimal(repeticoes) / 30)
+    return rm.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def registrar_serie(usuario_id: int, serie) -> bool:
+    """
+    Atualiza o recorde com a série criada/alterada.
+    Retorna True se a série passou a ser a melhor do exercício.
+    """
+    rm = estimar_1rm(serie.carga_kg, serie.repeticoes)
+    if rm is None:
+        return False
+
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(_UPSERT, [
+            usuario_id, serie.exercicio_id, serie.id, serie.carga_kg,
+            serie.repeticoes, rm, serie.carga_kg,
+        ])
+        row = cursor.fetchone()
+    return row is not None and row[0] == serie.id
+
+
+def detem_recorde(usuario_id: int, exercicio_id: int, serie_id: int, carga_kg) -> bool:
+    """Indica se a série é a melhor série ou a dona da carga máxima."""
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT 1 FROM recordes_pessoais
+            WHERE usuario_id = %s AND exercicio_id = %s
+              AND (melhor_serie_id = %s OR carga_maxima_kg = %s)
+            """,
+            [usuario_id, exercicio_id, serie_id, carga_kg],
+        )
+        return cursor.fetchone() is not None
+
+
+def recalcular_recorde(usuario_id: int, exercicio_id: int) -> None:
+    """Recalcula o recorde de um único (usuário, exercício)."""
+    with shards.transacao(), shards.conexao().cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM recordes_pessoais WHERE usuario_id = %s AND exercicio_id = %s",
+            [usuario_id, exercicio_id],
+        )
+        cursor.execute(
+            _RECALCULO.format(filtro="sm.usuario_id = %s AND sm.exercicio_id = %s"),
+            [usuario_id, exercicio_id],
+        )
+
+
+def agendar_recalculo(usuario_id: int, exercicio_id: int) -> None:
+    """Enfileira no outbox o recálculo do recorde (chame na transação da escrita)."""
+    outbox.registrar(usuario_id, "recorde_pessoal", exercicio_id=exercicio_id)
+
+
+def processar_eventos(usuario_id: int, eventos: list[dict]) -> None:
+    """Tratador do outbox: recalcula cada exercício afetado uma vez."""
+    for exercicio_id in sorted({evento["exercicio_id"] for evento in eventos}):
+        recalcular_recorde(usuario_id, exercicio_id)
+
+
+def recalcular_faixa(usuario_inicio: int, usuario_fim: int) -> int:
+    """
+    Recalcula todos os recordes dos usuários com id entre usuario_inicio e
+    usuario_fim (inclusive), de forma set-based. Retorna quantos recordes
+    foram gravados.
+    """
+    with shards.transacao(), shards.conexao().cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM recordes_pessoais WHERE usuario_id BETWEEN %s AND %s",
+            [usuario_inicio, usuario_fim],
+        )
+        cursor.execute(
+            _RECALCULO.format(filtro="sm.usuario_id BETWEEN %s AND %s"),
+            [usuario_inicio, usuario_fim],
+        )
+        return cursor.rowcount
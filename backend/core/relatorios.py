@@ -0,0 +1,148 @@
+"""
+Relatórios mensais para ops/admin, servidos a partir das visões
+materializadas de db/init/03_relatorios.sql.
+
+As consultas da API leem só as visões (nunca as tabelas base). O refresh
+é feito por `atualizar_visoes` (comando `atualizar_relatorios`) com
+REFRESH MATERIALIZED VIEW CONCURRENTLY, que troca as linhas sem bloquear
+leituras nem as escritas da API nas tabelas base.
+
+Com sharding (core/shards.py), cada shard tem as suas visões: a consulta
+soma as linhas de todos os shards (os usuários de shards diferentes são
+disjuntos) e recompõe a taxa de conclusão ponderada pelas marcações
+esperadas.
+"""
+import time
+from datetime import date
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections
+
+# nome público -> (visão, colunas devolvidas)
+VISOES = {
+    "modalidades": (
+        "mv_resumo_mensal_modalidade",
+        ["mes", "modalidade", "usuarios_ativos", "sessoes",
+         "duracao_total_seg", "distancia_total_km"],
+    ),
+    "habitos": (
+        "mv_habitos_mensal",
+        ["mes", "modalidade", "metas_ativas", "marcacoes_concluidas",
+         "marcacoes_esperadas", "taxa_conclusao_pct"],
+    ),
+}
+
+# Colunas de taxa, com a coluna que as pondera ao somar os shards.
+_TAXAS = {"taxa_conclusao_pct": "marcacoes_esperadas"}
+
+# Chave do advisory lock que impede dois refreshes simultâneos.
+_LOCK_REFRESH = 38_001
+
+
+def _consultar_shard(alias: str, visao: str, colunas: list[str], where: str, params: list):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            f"SELECT {', '.join(colunas)} FROM {visao} {where} ORDER BY mes, modalidade",
+            params,
+        )
+        linhas = [dict(zip(colunas, row)) for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT atualizado_em FROM relatorios_atualizacoes WHERE visao = %s", [visao]
+        )
+        row = cursor.fetchone()
+    return linhas, row[0] if row else None
+
+
+def _somar(linhas: list[dict], colunas: list[str]) -> list[dict]:
+    """Junta as linhas de vários shards por (mes, modalidade)."""
+    somas: dict[tuple, dict] = {}
+    for linha in linhas:
+        chave = (linha["mes"], linha["modalidade"])
+        total = somas.setdefault(chave, {"mes": chave[0], "modalidade": chave[1]})
+        for coluna in colunas[2:]:
+            peso = _TAXAS.get(coluna)
+            valor = (linha[coluna] or 0) * (linha[peso] if peso else 1)
+            total[coluna] = total.get(coluna, 0) + valor
+
+    for total in somas.values():
+        for coluna, peso in _TAXAS.items():
+            if coluna in total:
+                total[coluna] = round(total[coluna] / total[peso], 1) if total[peso] else None
+    return [somas[chave] for chave in sorted(somas)]
+
+
+def consultar(
+    nome: str,
+    mes_inicio: Optional[date] = None,
+    mes_fim: Optional[date] = None,
+    modalidade: Optional[str] = None,
+) -> dict:
+    visao, colunas = VISOES[nome]
+    filtros, params = [], []
+    if mes_inicio:
+        filtros.append("mes >= %s")
+        params.append(mes_inicio)
+    if mes_fim:
+        filtros.append("mes <= %s")
+        params.append(mes_fim)
+    if modalidade:
+        filtros.append("modalidade = %s")
+        params.append(modalidade)
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+
+    resultados = [
+        _consultar_shard(alias, visao, colunas, where, params) for alias in settings.SHARDS
+    ]
+    if len(resultados) == 1:
+        linhas, atualizado_em = resultados[0]
+        return {"atualizado_em": atualizado_em, "linhas": linhas}
+
+    # Com vários shards, o relatório é tão recente quanto o shard mais atrasado.
+    datas = [atualizado_em for _, atualizado_em in resultados]
+    return {
+        "atualizado_em": None if None in datas else min(datas),
+        "linhas": _somar([linha for linhas, _ in resultados for linha in linhas], colunas),
+    }
+
+
+def atualizar_visoes(
+    nomes: Optional[list[str]] = None, alias: str = "default"
+) -> Optional[dict[str, int]]:
+    """
+    Atualiza as visões pedidas (todas por padrão) no banco `alias` e
+    devolve a duração de cada uma em ms. Devolve None se outro refresh já
+    estiver em andamento nesse banco. Deve rodar fora de transação
+    (autocommit), uma visão por vez.
+    """
+    duracoes: dict[str, int] = {}
+    with connections[alias].cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [_LOCK_REFRESH])
+        if not cursor.fetchone()[0]:
+            return None
+        try:
+            for nome in nomes or list(VISOES):
+                visao = VISOES[nome][0]
+                cursor.execute(
+                    "SELECT ispopulated FROM pg_matviews WHERE matviewname = %s", [visao]
+                )
+                # CONCURRENTLY exige que a visão já tenha sido populada uma vez.
+                concorrente = cursor.fetchone()[0]
+                inicio = time.perf_counter()
+                cursor.execute(
+                    f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if concorrente else ''}{visao}"
+                )
+                duracao = int((time.perf_counter() - inicio) * 1000)
+                cursor.execute(
+                    """
+                    INSERT INTO relatorios_atualizacoes (visao, atualizado_em, duracao_ms)
+                    VALUES (%s, now(), %s)
+                    ON CONFLICT (visao) DO UPDATE
+                      SET atualizado_em = EXCLUDED.atualizado_em, duracao_ms = EXCLUDED.duracao_ms
+                    """,
+                    [visao, duracao],
+                )
+                duracoes[nome] = duracao
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [_LOCK_REFRESH])
+    return duracoes
@@ -0,0 +1,336 @@
+"""
+Rotas GPS das sessões de corrida e ciclismo.
+
+Os pontos não viram linhas: cada rota é um blob em `rotas_sessao.dados`
+com um cabeçalho (versão, colunas, número de pontos) e as colunas em
+int32 codificadas por delta, comprimidas com zlib:
+
+- latitude e longitude em micrograus (1e-6°, ~0,1 m);
+- altitude em decímetros e tempo em segundos desde o início (opcionais).
+
+Entre pontos vizinhos os deltas são pequenos e repetitivos, então uma
+rota de 10 mil pontos cabe em dezenas de kB. Na gravação a distância
+(haversine) e as parciais por km saem de operações vetorizadas com
+NumPy; o ganho/perda de elevação usa a altitude suavizada, com um
+limiar contra o ruído do GPS. As polilinhas
+simplificadas por Douglas–Peucker são pré-calculadas para NIVEIS_ZOOM
+(tolerância de ~1 pixel no zoom do mapa) e guardadas no formato
+"encoded polyline" do Google: o app baixa só a resolução que vai
+desenhar.
+"""
+import json
+import struct
+import zlib
+from typing import Any, Optional
+
+import numpy as np
+
+from . import shards
+
+VERSAO = 1
+_CABECALHO = struct.Struct("<BBI")  # versão, colunas opcionais, pontos
+_COM_ALTITUDE = 1
+_COM_TEMPO = 2
+
+MODALIDADES = ("corrida", "ciclismo")
+MIN_PONTOS = 2
+# ~14 h a um ponto por segundo, dentro do DATA_UPLOAD_MAX_MEMORY_SIZE.
+MAX_PONTOS = 50_000
+RAIO_TERRA_M = 6_371_008.8
+# Limites físicos de uma sessão: também mantêm o resumo dentro das colunas
+# (distancia_m NUMERIC(9,1), ganho/perda NUMERIC(7,1)) e as parciais em no
+# máximo MAX_DISTANCIA_M / 1000 itens. A velocidade vale por trecho, com
+# pelo menos 1 s entre pontos (GPS repete o segundo).
+MAX_DISTANCIA_M = 1_000_000
+MAX_VELOCIDADE_MS = 100.0
+MAX_VARIACAO_ALTITUDE_M = 500_000
+# Zooms (Web Mercator) com polilinha pré-calculada; pedidos de outros
+# zooms recebem o nível mais detalhado que não passe do pedido + 1.
+NIVEIS_ZOOM = (8, 11, 14, 17)
+ZOOM_PADRAO = 14
+# Metros por pixel no equador no zoom 0.
+_METROS_POR_PIXEL_Z0 = 156_543.03
+# Janela da média móvel da altitude e variação mínima contada no ganho
+# e na perda: sem isso o ruído do GPS soma centenas de metros.
+_JANELA_ALTITUDE = 5
+LIMIAR_ELEVACAO_M = 2.0
+
+
+class RotaInvalida(ValueError):
+    pass
+
+
+# ---------- codificação ----------
+
+def codificar(lat: np.ndarray, lon: np.ndarray, altitude: Optional[np.ndarray],
+              tempo: Optional[np.ndarray]) -> bytes:
+    colunas = [np.rint(lat * 1e6), np.rint(lon * 1e6)]
+    flags = 0
+    if altitude is not None:
+        colunas.append(np.rint(altitude * 10))
+        flags |= _COM_ALTITUDE
+    if tempo is not None:
+        colunas.append(np.rint(tempo))
+        flags |= _COM_TEMPO
+    inteiros = np.vstack(colunas).astype(np.int64)
+    deltas = np.diff(inteiros, axis=1, prepend=0).astype("<i4")
+    return _CABECALHO.pack(VERSAO, flags, len(lat)) + zlib.compress(deltas.tobytes(), 9)
+
+
+def decodificar(dados: bytes) -> dict[str, Optional[np.ndarray]]:
+    versao, flags, n = _CABECALHO.unpack_from(dados)
+    if versao != VERSAO:
+        raise RotaInvalida(f"Versão de rota desconhecida: {versao}")
+    deltas = np.frombuffer(zlib.decompress(dados[_CABECALHO.size:]), dtype="<i4")
+    colunas = iter(np.cumsum(deltas.reshape(-1, n), axis=1, dtype=np.int64))
+    pontos: dict[str, Optional[np.ndarray]] = {
+        "lat": next(colunas) / 1e6,
+        "lon": next(colunas) / 1e6,
+        "altitude": None,
+        "tempo": None,
+    }
+    if flags & _COM_ALTITUDE:
+        pontos["altitude"] = next(colunas) / 10
+    if flags & _COM_TEMPO:
+        pontos["tempo"] = next(colunas).astype(np.float64)
+    return pontos
+
+
+def codificar_polilinha(lat: np.ndarray, lon: np.ndarray) -> str:
+    """Encoded polyline do Google (precisão 1e-5)."""
+    valores = np.diff(
+        np.rint(np.column_stack([lat, lon]) * 1e5).astype(np.int64), axis=0, prepend=0
+    ).ravel()
+    valores = np.where(valores < 0, ~(valores << 1), valores << 1)
+    saida = []
+    for valor in valores.tolist():
+        while valor >= 0x20:
+            saida.append(chr((0x20 | (valor & 0x1F)) + 63))
+            valor >>= 5
+        saida.append(chr(valor + 63))
+    return "".join(saida)
+
+
+# ---------- cálculos ----------
+
+def _segmentos_m(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    phi, lam = np.radians(lat), np.radians(lon)
+    a = (
+        np.sin(np.diff(phi) / 2) ** 2
+        + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(np.diff(lam) / 2) ** 2
+    )
+    return 2 * RAIO_TERRA_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _elevacao(altitude: np.ndarray) -> tuple[float, float]:
+    if len(altitude) >= _JANELA_ALTITUDE:
+        janela = np.ones(_JANELA_ALTITUDE) / _JANELA_ALTITUDE
+        altitude = np.convolve(altitude, janela, mode="valid")
+    # Histerese: a referência só anda quando a altitude se afasta dela mais
+    # que o limiar. Depende do passo anterior, então fica num laço (só
+    # sobre os pontos em que a altitude muda).
+    ganho = perda = 0.0
+    referencia = float(altitude[0])
+    for valor in altitude[np.flatnonzero(np.diff(altitude)) + 1].tolist():
+        if valor - referencia >= LIMIAR_ELEVACAO_M:
+            ganho += valor - referencia
+            referencia = valor
+        elif referencia - valor >= LIMIAR_ELEVACAO_M:
+            perda += referencia - valor
+            referencia = valor
+    return ganho, perda
+
+
+def _parciais(acumulada_m: np.ndarray, tempo: np.ndarray) -> list[int]:
+    """Segundos de cada km completo (tempo interpolado na marca do km)."""
+    completos = min(int((acumulada_m[-1] + 1e-9) // 1000), MAX_DISTANCIA_M // 1000)
+    if not completos:
+        return []
+    kms = 1000.0 * np.arange(1, completos + 1)
+    instantes = np.interp(kms, acumulada_m, tempo)
+    return np.rint(np.diff(instantes, prepend=tempo[0])).astype(int).tolist()
+
+
+def douglas_peucker(x: np.ndarray, y: np.ndarray, tolerancia: float) -> np.ndarray:
+    """Índices mantidos; a distância de cada trecho é calculada de uma vez."""
+    manter = np.zeros(len(x), dtype=bool)
+    manter[[0, -1]] = True
+    pilha = [(0, len(x) - 1)]
+    while pilha:
+        inicio, fim = pilha.pop()
+        if fim - inicio < 2:
+            continue
+        dx, dy = x[fim] - x[inicio], y[fim] - y[inicio]
+        px, py = x[inicio + 1:fim] - x[inicio], y[inicio + 1:fim] - y[inicio]
+        comprimento = np.hypot(dx, dy)
+        if comprimento > 0:
+            distancias = np.abs(dx * py - dy * px) / comprimento
+        else:
+            distancias = np.hypot(px, py)
+        maior = int(np.argmax(distancias))
+        if distancias[maior] > tolerancia:
+            meio = inicio + 1 + maior
+            manter[meio] = True
+            pilha.append((inicio, meio))
+            pilha.append((meio, fim))
+    return np.flatnonzero(manter)
+
+
+def _polilinhas(lat: np.ndarray, lon: np.ndarray) -> dict[str, str]:
+    # Projeção equiretangular local: basta para distâncias de poucos pixels.
+    lat0 = np.radians(lat.mean())
+    x = RAIO_TERRA_M * np.radians(lon - lon[0]) * np.cos(lat0)
+    y = RAIO_TERRA_M * np.radians(lat - lat[0])
+    metros_por_pixel = _METROS_POR_PIXEL_Z0 * np.cos(lat0)
+
+    polilinhas = {}
+    indices = np.arange(len(lat))
+    # Do nível mais detalhado ao menos: cada um simplifica o anterior.
+    for zoom in sorted(NIVEIS_ZOOM, reverse=True):
+        mantidos = douglas_peucker(x[indices], y[indices], metros_por_pixel / 2 ** zoom)
+        indices = indices[mantidos]
+        polilinhas[str(zoom)] = codificar_polilinha(lat[indices], lon[indices])
+    return polilinhas
+
+
+def ler_pontos(pontos: Any) -> dict[str, Optional[np.ndarray]]:
+    """
+    Valida [[lat, lon], ...], [[lat, lon, altitude_m], ...] ou
+    [[lat, lon, altitude_m, segundos], ...] (todos os pontos no mesmo
+    formato; altitude pode ser null quando só há tempo).
+    """
+    if not isinstance(pontos, list) or not MIN_PONTOS <= len(pontos) <= MAX_PONTOS:
+        raise RotaInvalida(f"Informe de {MIN_PONTOS} a {MAX_PONTOS} pontos.")
+    try:
+        matriz = np.asarray(pontos, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise RotaInvalida("Todos os pontos devem ter o mesmo formato, com números.")
+    if matriz.ndim != 2 or not 2 <= matriz.shape[1] <= 4:
+        raise RotaInvalida("Cada ponto deve ser [lat, lon, altitude_m?, segundos?].")
+
+    lat, lon = matriz[:, 0], matriz[:, 1]
+    if np.isnan(matriz[:, :2]).any() or (np.abs(lat) > 90).any() or (np.abs(lon) > 180).any():
+        raise RotaInvalida("Coordenadas inválidas.")
+    segmentos = _segmentos_m(lat, lon)
+    if segmentos.sum() > MAX_DISTANCIA_M:
+        raise RotaInvalida(f"A rota passa de {MAX_DISTANCIA_M // 1000} km.")
+
+    altitude = tempo = None
+    if matriz.shape[1] >= 3 and not np.isnan(matriz[:, 2]).all():
+        altitude = matriz[:, 2]
+        if np.isnan(altitude).any() or (np.abs(altitude) > 10_000).any():
+            raise RotaInvalida("Altitude inválida (metros, em todos os pontos).")
+        if np.abs(np.diff(altitude)).sum() > MAX_VARIACAO_ALTITUDE_M:
+            raise RotaInvalida("Variação de altitude impossível para uma sessão.")
+    if matriz.shape[1] == 4:
+        tempo = matriz[:, 3]
+        if np.isnan(tempo).any() or (np.diff(tempo) < 0).any() or tempo[0] < 0:
+            raise RotaInvalida("O tempo (segundos desde o início) deve ser crescente.")
+        if tempo[-1] >= 2 ** 31:
+            raise RotaInvalida("Tempo fora do limite.")
+        if (segmentos > MAX_VELOCIDADE_MS * np.maximum(np.diff(tempo), 1)).any():
+            raise RotaInvalida("Há trechos percorridos em velocidade impossível.")
+    return {"lat": lat, "lon": lon, "altitude": altitude, "tempo": tempo}
+
+
+def resumir(pontos: dict[str, Optional[np.ndarray]]) -> dict[str, Any]:
+    lat, lon, altitude, tempo = pontos["lat"], pontos["lon"], pontos["altitude"], pontos["tempo"]
+    acumulada = np.concatenate([[0.0], np.cumsum(_segmentos_m(lat, lon))])
+    resumo: dict[str, Any] = {
+        "pontos": len(lat),
+        "distancia_m": round(float(acumulada[-1]), 1),
+        "ganho_elevacao_m": None,
+        "perda_elevacao_m": None,
+        "duracao_seg": None,
+        "parciais_seg_km": None,
+    }
+    if altitude is not None:
+        ganho, perda = _elevacao(altitude)
+        resumo["ganho_elevacao_m"] = round(ganho, 1)
+        resumo["perda_elevacao_m"] = round(perda, 1)
+    if tempo is not None:
+        resumo["duracao_seg"] = int(tempo[-1] - tempo[0])
+        resumo["parciais_seg_km"] = _parciais(acumulada, tempo)
+    return resumo
+
+
+# ---------- armazenamento ----------
+
+_COLUNAS_RESUMO = (
+    "pontos", "distancia_m", "ganho_elevacao_m", "perda_elevacao_m",
+    "duracao_seg", "parciais_seg_km",
+)
+
+
+def gravar(sessao, pontos: dict[str, Optional[np.ndarray]]) -> dict[str, Any]:
+    """Grava (ou substitui) a rota da sessão e devolve o resumo."""
+    resumo = resumir(pontos)
+    dados = codificar(pontos["lat"], pontos["lon"], pontos["altitude"], pontos["tempo"])
+    polilinhas = _polilinhas(pontos["lat"], pontos["lon"])
+    parciais = resumo["parciais_seg_km"]
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO rotas_sessao (
+              sessao_id, sessao_inicio_em, usuario_id, dados, polilinhas,
+              pontos, distancia_m, ganho_elevacao_m, perda_elevacao_m,
+              duracao_seg, parciais_seg_km
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (sessao_id) DO UPDATE SET
+              dados = EXCLUDED.dados, polilinhas = EXCLUDED.polilinhas,
+              pontos = EXCLUDED.pontos, distancia_m = EXCLUDED.distancia_m,
+              ganho_elevacao_m = EXCLUDED.ganho_elevacao_m,
+              perda_elevacao_m = EXCLUDED.perda_elevacao_m,
+              duracao_seg = EXCLUDED.duracao_seg,
+              parciais_seg_km = EXCLUDED.parciais_seg_km,
+              atualizado_em = clock_timestamp()
+            """,
+            [
+                sessao.id, sessao.inicio_em, sessao.usuario_id, dados, json.dumps(polilinhas),
+                resumo["pontos"], resumo["distancia_m"], resumo["ganho_elevacao_m"],
+                resumo["perda_elevacao_m"], resumo["duracao_seg"],
+                None if parciais is None else json.dumps(parciais),
+            ],
+        )
+    return {**resumo, "tamanho_bytes": len(dados)}
+
+
+def nivel_para_zoom(zoom: int) -> int:
+    for nivel in NIVEIS_ZOOM:
+        if nivel >= zoom - 1:
+            return nivel
+    return NIVEIS_ZOOM[-1]
+
+
+def ler(sessao_id: int, zoom: int = ZOOM_PADRAO) -> Optional[dict[str, Any]]:
+    """Resumo e polilinha do nível de `zoom` (sem ler o blob dos pontos)."""
+    nivel = nivel_para_zoom(zoom)
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT {', '.join(_COLUNAS_RESUMO)}, octet_length(dados), polilinhas ->> %s
+            FROM rotas_sessao WHERE sessao_id = %s
+            """,
+            [str(nivel), sessao_id],
+        )
+        linha = cursor.fetchone()
+    if linha is None:
+        return None
+    resumo = dict(zip(_COLUNAS_RESUMO, linha))
+    if isinstance(resumo["parciais_seg_km"], str):
+        resumo["parciais_seg_km"] = json.loads(resumo["parciais_seg_km"])
+    return {**resumo, "tamanho_bytes": linha[-2], "zoom": nivel, "polilinha": linha[-1]}
+
+
+def pontos_da_sessao(sessao_id: int) -> Optional[dict[str, Optional[np.ndarray]]]:
+    """Pontos completos da rota, decodificados do blob."""
+    with shards.conexao().cursor() as cursor:
+        cursor.execute("SELECT dados FROM rotas_sessao WHERE sessao_id = %s", [sessao_id])
+        linha = cursor.fetchone()
+    return None if linha is None else decodificar(bytes(linha[0]))
+
+
+def excluir(sessao_id: int) -> bool:
+    with shards.conexao().cursor() as cursor:
+        cursor.execute("DELETE FROM rotas_sessao WHERE sessao_id = %s", [sessao_id])
+        return cursor.rowcount > 0
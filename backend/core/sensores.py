@@ -0,0 +1,338 @@
+"""
+Séries de sensores a 1 Hz das sessões: frequência cardíaca (fc),
+cadência e potência.
+
+Armazenamento: cada canal é dividido em blocos de BLOCO_SEG segundos
+(`blocos_sensores`). O bloco é um array int16 indexado pelo segundo
+(SEM_AMOSTRA onde não houve leitura), codificado por delta e comprimido
+com zlib; uma hora de FC ocupa poucos kB. Cada bloco guarda também as
+somas das suas amostras (quantidade, soma, máximo e segundos em cada
+zona de FC), então o resumo da sessão soma algumas linhas em vez de
+reler as séries.
+
+Envio (POST .../sensores/): o corpo é lido em streaming, em ordem de
+tempo, e só o bloco atual de cada canal fica em memória; cada bloco é
+gravado na sua própria transação (um envio longo não segura a
+sincronização). Reenviar trechos é idempotente: amostras novas se
+sobrepõem às gravadas no mesmo segundo. Ao final, a média da FC vai
+para `fc_media` das métricas da sessão.
+
+CSV:    segundo,fc,cadencia,potencia   (colunas de canal opcionais)
+NDJSON: {"segundo": 0, "fc": 128, "potencia": 210}
+
+Leitura: a série de um canal sai reduzida por LTTB (Largest-Triangle-
+Three-Buckets) ao número de pontos pedido. Os blocos são descomprimidos
+um a um e o LTTB roda em fluxo, com no máximo dois baldes em memória.
+"""
+import codecs
+import csv
+import json
+import zlib
+from typing import Any, Iterable, Iterator, Optional
+
+import numpy as np
+from django.conf import settings
+
+from . import shards
+
+# Faixa aceita de cada canal.
+CANAIS = {"fc": (20, 255), "cadencia": (0, 255), "potencia": (0, 3000)}
+FORMATOS = {"csv", "ndjson"}
+BLOCO_SEG = 3600
+MAX_SEGUNDOS = 48 * 3600
+SEM_AMOSTRA = -1
+# Início das zonas 1 a 5 de FC, em fração da FC máxima.
+ZONAS_FC = (0.5, 0.6, 0.7, 0.8, 0.9)
+PONTOS_PADRAO = 500
+MIN_PONTOS = 3
+MAX_PONTOS = 5000
+
+
+class SensoresInvalidos(ValueError):
+    def __init__(self, linha: int, erro: str):
+        super().__init__(f"Linha {linha}: {erro}")
+        self.linha = linha
+        self.erro = erro
+
+
+# ---------- leitura do envio ----------
+
+Amostra = tuple[int, Any]  # (linha, registro)
+
+
+def _ler_csv(linhas: Iterable[bytes]) -> Iterator[Amostra]:
+    reader = csv.DictReader(codecs.iterdecode(linhas, "utf-8-sig"))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _ler_ndjson(linhas: Iterable[bytes]) -> Iterator[Amostra]:
+    for numero, linha in enumerate(codecs.iterdecode(linhas, "utf-8-sig"), start=1):
+        if not linha.strip():
+            continue
+        try:
+            yield numero, json.loads(linha)
+        except ValueError:
+            raise SensoresInvalidos(numero, "JSON inválido.")
+
+
+def ler_amostras(linhas: Iterable[bytes], formato: str) -> Iterator[tuple[int, int, dict[str, int]]]:
+    """(linha, segundo, {canal: valor}) de cada linha, validados."""
+    registros = _ler_csv(linhas) if formato == "csv" else _ler_ndjson(linhas)
+    for numero, registro in registros:
+        if not isinstance(registro, dict):
+            raise SensoresInvalidos(numero, "Cada linha deve ser um objeto.")
+        try:
+            segundo = int(registro.get("segundo"))
+        except (TypeError, ValueError):
+            raise SensoresInvalidos(numero, "Informe o segundo (inteiro) da amostra.")
+        if not 0 <= segundo < MAX_SEGUNDOS:
+            raise SensoresInvalidos(numero, f"O segundo deve estar entre 0 e {MAX_SEGUNDOS - 1}.")
+
+        valores = {}
+        for canal, (minimo, maximo) in CANAIS.items():
+            bruto = registro.get(canal)
+            if bruto in (None, ""):
+                continue
+            try:
+                valor = round(float(bruto))
+            except (TypeError, ValueError):
+                raise SensoresInvalidos(numero, f"Valor inválido para {canal}.")
+            if not minimo <= valor <= maximo:
+                raise SensoresInvalidos(numero, f"{canal} deve estar entre {minimo} e {maximo}.")
+            valores[canal] = valor
+        yield numero, segundo, valores
+
+
+# ---------- blocos ----------
+
+def codificar_bloco(valores: np.ndarray) -> bytes:
+    return zlib.compress(np.diff(valores, prepend=0).astype("<i2").tobytes(), 9)
+
+
+def decodificar_bloco(dados: bytes) -> np.ndarray:
+    deltas = np.frombuffer(zlib.decompress(dados), dtype="<i2")
+    return np.cumsum(deltas, dtype=np.int64).astype(np.int16)
+
+
+def _limites_zonas(fc_maxima: int) -> np.ndarray:
+    return np.rint(np.array(ZONAS_FC) * fc_maxima)
+
+
+def _estatisticas(canal: str, valores: np.ndarray, fc_maxima: int) -> tuple:
+    validos = valores[valores != SEM_AMOSTRA].astype(np.int64)
+    zonas = None
+    if canal == "fc":
+        # searchsorted: 0 = abaixo da zona 1, 1..5 = zonas.
+        indices = np.searchsorted(_limites_zonas(fc_maxima), validos, side="right")
+        zonas = np.bincount(indices, minlength=len(ZONAS_FC) + 1)[1:].tolist()
+    maximo = int(validos.max()) if len(validos) else 0
+    return len(validos), int(validos.sum()), maximo, zonas
+
+
+def _gravar_blocos(sessao, bloco: int, buffers: dict[str, np.ndarray], fc_maxima: int) -> None:
+    with shards.transacao(), shards.conexao().cursor() as cursor:
+        for canal, valores in buffers.items():
+            cursor.execute(
+                """
+                SELECT dados FROM blocos_sensores
+                WHERE sessao_id = %s AND canal = %s AND bloco = %s
+                FOR UPDATE
+                """,
+                [sessao.id, canal, bloco],
+            )
+            existente = cursor.fetchone()
+            if existente is not None:
+                anteriores = decodificar_bloco(bytes(existente[0]))
+                valores = np.where(valores != SEM_AMOSTRA, valores, anteriores)
+
+            amostras, soma, maximo, zonas = _estatisticas(canal, valores, fc_maxima)
+            cursor.execute(
+                """
+                INSERT INTO blocos_sensores (
+                  sessao_id, sessao_inicio_em, usuario_id, canal, bloco,
+                  dados, amostras, soma, maximo, zonas_fc
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (sessao_id, canal, bloco) DO UPDATE SET
+                  dados = EXCLUDED.dados, amostras = EXCLUDED.amostras,
+                  soma = EXCLUDED.soma, maximo = EXCLUDED.maximo,
+                  zonas_fc = EXCLUDED.zonas_fc
+                """,
+                [
+                    sessao.id, sessao.inicio_em, sessao.usuario_id, canal, bloco,
+                    codificar_bloco(valores), amostras, soma, maximo, zonas,
+                ],
+            )
+
+
+def ingerir(sessao, amostras: Iterable[tuple[int, int, dict[str, int]]],
+            fc_maxima: Optional[int] = None) -> dict[str, Any]:
+    """
+    Grava as amostras (em ordem de segundo) bloco a bloco e atualiza a
+    fc_media das métricas. Devolve o resumo da sessão. Um erro no meio
+    do envio mantém os blocos já gravados.
+    """
+    fc_maxima = fc_maxima or settings.SENSORES_FC_MAXIMA_PADRAO
+    buffers: dict[str, np.ndarray] = {}
+    bloco_atual: Optional[int] = None
+    anterior = -1
+    recebidas = 0
+
+    for numero, segundo, valores in amostras:
+        if segundo < anterior:
+            raise SensoresInvalidos(numero, "As amostras devem vir em ordem de tempo.")
+        anterior = segundo
+        bloco = segundo // BLOCO_SEG
+        if bloco != bloco_atual:
+            if buffers:
+                _gravar_blocos(sessao, bloco_atual, buffers, fc_maxima)
+            bloco_atual, buffers = bloco, {}
+        posicao = segundo - bloco * BLOCO_SEG
+        for canal, valor in valores.items():
+            if canal not in buffers:
+                buffers[canal] = np.full(BLOCO_SEG, SEM_AMOSTRA, dtype=np.int16)
+            buffers[canal][posicao] = valor
+        recebidas += 1
+
+    if buffers:
+        _gravar_blocos(sessao, bloco_atual, buffers, fc_maxima)
+
+    resumo = resumir(sessao.id)
+    if "fc" in resumo:
+        with shards.transacao(), shards.conexao().cursor() as cursor:
+            for tabela in ("metricas_corrida", "metricas_ciclismo"):
+                cursor.execute(
+                    f"""
+                    UPDATE {tabela} SET fc_media = %s
+                    WHERE sessao_id = %s AND fc_media IS DISTINCT FROM %s
+                    """,
+                    [resumo["fc"]["media"], sessao.id, resumo["fc"]["media"]],
+                )
+    return {"amostras_recebidas": recebidas, "canais": resumo}
+
+
+# ---------- leitura ----------
+
+def resumir(sessao_id: int) -> dict[str, Any]:
+    """Amostras, média, máximo e (FC) segundos por zona de cada canal."""
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT canal, amostras, soma, maximo, zonas_fc
+            FROM blocos_sensores WHERE sessao_id = %s
+            """,
+            [sessao_id],
+        )
+        linhas = cursor.fetchall()
+
+    resumo: dict[str, Any] = {}
+    for canal, amostras, soma, maximo, zonas in linhas:
+        item = resumo.setdefault(canal, {"amostras": 0, "soma": 0, "maxima": 0})
+        item["amostras"] += amostras
+        item["soma"] += soma
+        item["maxima"] = max(item["maxima"], maximo)
+        if zonas is not None:
+            item["zonas_seg"] = (
+                np.add(item.get("zonas_seg", 0), zonas).tolist()
+            )
+    for canal, item in list(resumo.items()):
+        if not item["amostras"]:
+            del resumo[canal]
+            continue
+        item["media"] = round(item.pop("soma") / item["amostras"])
+    return resumo
+
+
+def _blocos(sessao_id: int, canal: str) -> tuple[int, Iterator[tuple[np.ndarray, np.ndarray]]]:
+    """Total de amostras e um iterador de (segundos, valores) por bloco."""
+    with shards.conexao().cursor() as cursor:
+        # Só os blocos comprimidos vêm para a memória.
+        cursor.execute(
+            """
+            SELECT bloco, dados FROM blocos_sensores
+            WHERE sessao_id = %s AND canal = %s AND amostras > 0
+            ORDER BY bloco
+            """,
+            [sessao_id, canal],
+        )
+        linhas = cursor.fetchall()
+        cursor.execute(
+            "SELECT coalesce(sum(amostras), 0) FROM blocos_sensores "
+            "WHERE sessao_id = %s AND canal = %s",
+            [sessao_id, canal],
+        )
+        total = int(cursor.fetchone()[0])
+
+    def iterar():
+        for bloco, dados in linhas:
+            valores = decodificar_bloco(bytes(dados))
+            posicoes = np.flatnonzero(valores != SEM_AMOSTRA)
+            yield posicoes + bloco * BLOCO_SEG, valores[posicoes].astype(np.float64)
+
+    return total, iterar()
+
+
+def _baldes(pedacos: Iterable[tuple[np.ndarray, np.ndarray]], n: int, pontos: int):
+    """
+    Reagrupa os pedaços nos baldes do LTTB: o primeiro e o último ponto
+    sozinhos e os n - 2 do meio em pontos - 2 baldes, com as mesmas
+    fronteiras do algoritmo original (floor(i * (n - 2) / (pontos - 2)) + 1).
+    """
+    inicio = 0
+    pendentes: list[tuple[np.ndarray, np.ndarray]] = []
+    balde_pendente = None
+    for t, v in pedacos:
+        k = np.arange(inicio, inicio + len(t))
+        inicio += len(t)
+        baldes = np.clip(-(-k * (pontos - 2) // (n - 2)), 1, pontos - 2)
+        baldes[k == 0] = 0
+        baldes[k == n - 1] = pontos - 1
+        cortes = np.flatnonzero(np.diff(baldes)) + 1
+        for parte_t, parte_v, parte_b in zip(
+            np.split(t, cortes), np.split(v, cortes), np.split(baldes, cortes)
+        ):
+            if balde_pendente is not None and parte_b[0] != balde_pendente:
+                yield np.concatenate([p[0] for p in pendentes]), np.concatenate([p[1] for p in pendentes])
+                pendentes = []
+            balde_pendente = parte_b[0]
+            pendentes.append((parte_t, parte_v))
+    if pendentes:
+        yield np.concatenate([p[0] for p in pendentes]), np.concatenate([p[1] for p in pendentes])
+
+
+def lttb(pedacos: Iterable[tuple[np.ndarray, np.ndarray]], n: int, pontos: int) -> list[list]:
+    """LTTB em fluxo sobre (segundos, valores) em ordem; devolve [[t, v], ...]."""
+    if n <= pontos:
+        return [
+            [int(t), int(v)]
+            for ts, vs in pedacos for t, v in zip(ts.tolist(), vs.tolist())
+        ]
+
+    baldes = _baldes(pedacos, n, pontos)
+    t_a, v_a = next(baldes)
+    saida = [[int(t_a[0]), int(v_a[0])]]
+    a_t, a_v = float(t_a[0]), float(v_a[0])
+    atual = next(baldes)
+    for proximo in baldes:
+        c_t, c_v = float(proximo[0].mean()), float(proximo[1].mean())
+        t, v = atual
+        areas = np.abs((a_t - c_t) * (v - a_v) - (a_t - t) * (c_v - a_v))
+        i = int(np.argmax(areas))
+        a_t, a_v = float(t[i]), float(v[i])
+        saida.append([int(a_t), int(a_v)])
+        atual = proximo
+    saida.append([int(atual[0][-1]), int(atual[1][-1])])
+    return saida
+
+
+def serie(sessao_id: int, canal: str, pontos: int = PONTOS_PADRAO) -> Optional[dict[str, Any]]:
+    total, pedacos = _blocos(sessao_id, canal)
+    if not total:
+        return None
+    return {"canal": canal, "amostras": total, "pontos": lttb(pedacos, total, pontos)}
+
+
+def excluir(sessao_id: int) -> int:
+    with shards.conexao().cursor() as cursor:
+        cursor.execute("DELETE FROM blocos_sensores WHERE sessao_id = %s", [sessao_id])
+        return cursor.rowcount
@@ -11,6 +11,8 @@ from .models import (
     MetaHabito,
     MarcacaoHabito,
     ModalidadeChoices,
+    RecordePessoal,
+    MelhorEsforcoCorrida,
 )
 
 
@@ -23,6 +25,14 @@ class UsuarioSerializer(serializers.ModelSerializer):
         fields = ["id", "nome", "email", "criado_em"]
 
 
+class PerfilSerializer(serializers.ModelSerializer):
+    """Dados do próprio usuário (/auth/me/, registro e login), com as preferências."""
+
+    class Meta:
+        model = Usuario
+        fields = ["id", "nome", "email", "participa_ranking", "peso_kg", "fc_maxima", "criado_em"]
+
+
 class ExercicioSerializer(serializers.ModelSerializer):
     class Meta:
         model = Exercicio
@@ -41,9 +51,12 @@ class SessaoAtividadeSerializer(serializers.ModelSerializer):
             "inicio_em",
             "duracao_seg",
             "calorias",
+            "calorias_estimadas",
             "observacoes",
             "criado_em",
         ]
+        read_only_fields = ["calorias_estimadas"]
+
     def validate_duracao_seg(self, value):
         if value is not None and value < 0:
             raise serializers.ValidationError("A duração não pode ser negativa.")
@@ -115,6 +128,10 @@ class MetricasCiclismoSerializer(serializers.ModelSerializer):
         return sessao
 
 class SerieMusculacaoSerializer(serializers.ModelSerializer):
+    # True se a série é o recorde atual (melhor 1RM estimado) do exercício;
+    # na resposta de criação/edição indica que ela acabou de virar recorde.
+    recorde_pessoal = serializers.BooleanField(read_only=True, default=False)
+
     class Meta:
         model = SerieMusculacao
         fields = [
@@ -124,6 +141,7 @@ class SerieMusculacaoSerializer(serializers.ModelSerializer):
             "ordem_serie",
             "repeticoes",
             "carga_kg",
+            "recorde_pessoal",
         ]
     def validate_sessao(self, sessao):
 
@@ -188,6 +206,93 @@ class SerieMusculacaoSerializer(serializers.ModelSerializer):
 
         return super().create(validated_data)
     
+class SerieMusculacaoResumoSerializer(serializers.ModelSerializer):
+    """Série aninhada na sessão (leitura), com o nome do exercício."""
+
+    exercicio_nome = serializers.CharField(source="exercicio.nome", read_only=True)
+
+    class Meta:
+        model = SerieMusculacao
+        fields = [
+            "id",
+            "exercicio",
+            "exercicio_nome",
+            "ordem_serie",
+            "repeticoes",
+            "carga_kg",
+        ]
+
+
+class SessaoAtividadeDetalheSerializer(SessaoAtividadeSerializer):
+    """
+    Sessão com métricas e/ou séries aninhadas (?expand=metricas,series).
+    Espera que a view já tenha feito select_related/prefetch_related.
+    """
+
+    metricas_corrida = serializers.SerializerMethodField()
+    metricas_ciclismo = serializers.SerializerMethodField()
+    series_musculacao = SerieMusculacaoResumoSerializer(many=True, read_only=True)
+
+    class Meta(SessaoAtividadeSerializer.Meta):
+        fields = SessaoAtividadeSerializer.Meta.fields + [
+            "metricas_corrida",
+            "metricas_ciclismo",
+            "series_musculacao",
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = self.context.get("expand", set())
+
+        if "metricas" not in expand:
+            self.fields.pop("metricas_corrida")
+            self.fields.pop("metricas_ciclismo")
+        if "series" not in expand:
+            self.fields.pop("series_musculacao")
+
+    def get_metricas_corrida(self, obj):
+        metricas = getattr(obj, "metricas_corrida", None)
+        if metricas is None:
+            return None
+        return MetricasCorridaSerializer(metricas).data
+
+    def get_metricas_ciclismo(self, obj):
+        metricas = getattr(obj, "metricas_ciclismo", None)
+        if metricas is None:
+            return None
+        return MetricasCiclismoSerializer(metricas).data
+
+class RecordePessoalSerializer(serializers.ModelSerializer):
+    exercicio_nome = serializers.CharField(source="exercicio.nome", read_only=True)
+
+    class Meta:
+        model = RecordePessoal
+        fields = [
+            "exercicio",
+            "exercicio_nome",
+            "melhor_serie",
+            "carga_kg",
+            "repeticoes",
+            "rm_estimado_kg",
+            "carga_maxima_kg",
+            "atualizado_em",
+        ]
+
+class MelhorEsforcoCorridaSerializer(serializers.ModelSerializer):
+    inicio_em = serializers.DateTimeField(source="sessao.inicio_em", read_only=True)
+
+    class Meta:
+        model = MelhorEsforcoCorrida
+        fields = [
+            "distancia_alvo",
+            "sessao",
+            "inicio_em",
+            "distancia_km",
+            "ritmo_medio_seg_km",
+            "tempo_estimado_seg",
+            "atualizado_em",
+        ]
+
 # =================== Meta Hábito =======================
 class MetaHabitoSerializer(serializers.ModelSerializer):
     usuario = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -205,6 +310,7 @@ class MetaHabitoSerializer(serializers.ModelSerializer):
             "duracao_meta_min",
             "sessoes_meta",
             "ativo",
+            "marcar_automaticamente",
             "criado_em",
         ]
 
@@ -377,7 +483,7 @@ class UsuarioUpdateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Usuario
-        fields = ["nome", "email"]
+        fields = ["nome", "email", "participa_ranking", "peso_kg", "fc_maxima"]
 
     def validate_email(self, value):
         user = self.context['request'].user
@@ -391,8 +497,23 @@ class UsuarioUpdateSerializer(serializers.ModelSerializer):
         
         return email_normalizado
 
+    def validate_peso_kg(self, value):
+        if value is not None and value <= 0:
+            raise serializers.ValidationError("O peso deve ser maior que zero.")
+        return value
+
+    def validate_fc_maxima(self, value):
+        if value is not None and not 100 <= value <= 250:
+            raise serializers.ValidationError("Informe uma FC máxima entre 100 e 250 bpm.")
+        return value
+
     def update(self, instance, validated_data):
         instance.nome = validated_data.get('nome', instance.nome)
         instance.email = validated_data.get('email', instance.email)
+        instance.participa_ranking = validated_data.get(
+            'participa_ranking', instance.participa_ranking
+        )
+        instance.peso_kg = validated_data.get('peso_kg', instance.peso_kg)
+        instance.fc_maxima = validated_data.get('fc_maxima', instance.fc_maxima)
         instance.save()
         return instance    
\ No newline at end of file
@@ -0,0 +1,383 @@
+"""
+Sharding dos dados por usuário entre vários bancos Postgres.
+
+O banco `default` é o diretório: guarda `usuarios` (com o shard de cada
+um em `usuarios.shard`), o catálogo mestre de exercícios e os rankings
+globais. Os dados de cada usuário (sessões, métricas, séries, metas,
+marcações, recordes, melhores esforços e heatmaps) ficam no shard dele,
+junto com uma cópia da linha do usuário (para as FKs) e uma réplica do
+catálogo de exercícios. Todos os bancos rodam o mesmo schema
+(db/init/*.sql).
+
+- O shard de um usuário novo é escolhido por hashing consistente
+  (`AnelConsistente`) e gravado no diretório, que passa a ser a fonte da
+  verdade; isso permite mover usuários (`mover_usuario`, comando
+  `rebalancear_shards`).
+- A autenticação ativa o shard do usuário para a requisição (`ativar`).
+  O `ShardRouter` manda para ele as querysets e escritas dos modelos por
+  usuário, e o SQL cru usa `conexao()` e `transacao()`.
+- Comandos sem requisição escolhem o shard com `usando(alias)`.
+- Sem SHARD_DATABASES há um único shard (`default`) e nada muda.
+
+Os ids gerados em cada shard ficam em faixas separadas
+(`preparar_shard`), então linhas movidas entre shards mantêm o id.
+"""
+import bisect
+import hashlib
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import ProtectedError
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework import exceptions
+
+from .models import Exercicio, SerieMusculacao, Usuario
+
+DIRETORIO = "default"
+
+# Modelos que vivem só no diretório (lidos de um shard apenas quando
+# acessados a partir de um objeto do shard, ex.: sessao.usuario).
+MODELOS_DIRETORIO = {Usuario}
+# Catálogo replicado: lido do shard ativo, escrito no diretório e
+# replicado pelos sinais abaixo.
+MODELOS_CATALOGO = {Exercicio}
+
+# Tabelas por usuário, na ordem das FKs, com o filtro das linhas do
+# usuário. Novas tabelas por usuário precisam entrar aqui para serem
+# movidas junto.
+TABELAS_USUARIO = (
+    ("sessoes_atividade", "usuario_id = %s"),
+    ("metricas_corrida", "usuario_id = %s"),
+    ("metricas_ciclismo", "usuario_id = %s"),
+    ("series_musculacao", "usuario_id = %s"),
+    ("rotas_sessao", "usuario_id = %s"),
+    ("blocos_sensores", "usuario_id = %s"),
+    ("metas_habito", "usuario_id = %s"),
+    ("marcacoes_habito", "usuario_id = %s"),
+    ("recordes_pessoais", "usuario_id = %s"),
+    ("melhores_esforcos_corrida", "usuario_id = %s"),
+    ("heatmaps_anuais", "usuario_id = %s"),
+    ("eventos_outbox", "usuario_id = %s"),
+    ("exclusoes_sync", "usuario_id = %s"),
+    ("chaves_idempotencia", "usuario_id = %s"),
+)
+
+# Sequências que só avançam no diretório.
+_SEQUENCIAS_DIRETORIO = ("usuarios_id_seq", "exercicios_id_seq")
+# Tamanho da faixa de ids de cada shard (2^48 ids; o shard N começa em
+# (N + 1) * 2^48, abaixo de 2^53 para até 31 shards).
+_BITS_FAIXA_IDS = 48
+VNOS_POR_SHARD = 64
+
+_shard_atual: ContextVar[Optional[str]] = ContextVar("shard_atual", default=None)
+
+
+class ContaEmMigracao(exceptions.APIException):
+    status_code = 503
+    default_detail = "Seus dados estão sendo movidos. Tente novamente em instantes."
+    default_code = "conta_em_migracao"
+    wait = 5  # vira o cabeçalho Retry-After
+
+
+def sharding_ativo() -> bool:
+    return settings.SHARDS != [DIRETORIO]
+
+
+def alias_atual() -> str:
+    return _shard_atual.get() or DIRETORIO
+
+
+def conexao():
+    """Conexão do shard ativo (para o SQL cru dos módulos por usuário)."""
+    return connections[alias_atual()]
+
+
+def transacao():
+    """transaction.atomic() no shard ativo."""
+    return transaction.atomic(using=alias_atual())
+
+
+def alias_do_usuario(usuario: Usuario) -> str:
+    # Usuários sem shard são os anteriores ao sharding, ainda no default.
+    return usuario.shard or DIRETORIO
+
+
+def ativar(usuario: Usuario) -> None:
+    """Ativa o shard do usuário até o fim da requisição (ShardMiddleware)."""
+    _shard_atual.set(alias_do_usuario(usuario))
+
+
+@contextmanager
+def usando(alias: str):
+    token = _shard_atual.set(alias)
+    try:
+        yield
+    finally:
+        _shard_atual.reset(token)
+
+
+def iterar_no_shard(alias: str, iteravel: Iterable) -> Iterator:
+    """
+    Consome `iteravel` com `alias` ativo. Respostas em streaming são
+    iteradas depois que o middleware já encerrou a requisição.
+    """
+    with usando(alias):
+        yield from iteravel
+
+
+class ShardMiddleware:
+    """Cada requisição começa sem shard ativo; a autenticação ativa o do usuário."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _shard_atual.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            _shard_atual.reset(token)
+
+
+class ShardRouter:
+    """
+    Diretório -> default; catálogo -> leitura no shard ativo, escrita no
+    default; demais modelos do core -> shard do objeto relacionado (se for
+    de um shard) ou shard ativo.
+    """
+
+    def _shard_da_instancia(self, hints) -> Optional[str]:
+        instancia = hints.get("instance")
+        db = getattr(getattr(instancia, "_state", None), "db", None)
+        return db if db in settings.SHARDS else None
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != "core":
+            return None
+        if model in MODELOS_DIRETORIO:
+            return self._shard_da_instancia(hints) or DIRETORIO
+        return self._shard_da_instancia(hints) or alias_atual()
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != "core":
+            return None
+        if model in MODELOS_DIRETORIO or model in MODELOS_CATALOGO:
+            return DIRETORIO
+        return self._shard_da_instancia(hints) or alias_atual()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._meta.app_label == "core" and obj2._meta.app_label == "core":
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Os shards só têm o schema de db/init; as apps do Django (e o
+        # cache) ficam no diretório.
+        if db != DIRETORIO and db in settings.SHARDS:
+            return False
+        return None
+
+
+class AnelConsistente:
+    """
+    Hashing consistente com nós virtuais: ao adicionar um shard, só cerca
+    de 1/N dos usuários passa a ter outro shard de destino.
+    """
+
+    def __init__(self, aliases: Iterable[str], vnos: int = VNOS_POR_SHARD):
+        pontos = sorted(
+            (_hash(f"{alias}#{i}"), alias) for alias in aliases for i in range(vnos)
+        )
+        self._chaves = [ponto for ponto, _ in pontos]
+        self._aliases = [alias for _, alias in pontos]
+
+    def shard_para(self, usuario_id: int) -> str:
+        i = bisect.bisect(self._chaves, _hash(str(usuario_id))) % len(self._chaves)
+        return self._aliases[i]
+
+
+def _hash(valor: str) -> int:
+    return int.from_bytes(hashlib.blake2b(valor.encode(), digest_size=8).digest(), "big")
+
+
+@lru_cache(maxsize=1)
+def anel() -> AnelConsistente:
+    return AnelConsistente(settings.SHARDS)
+
+
+# --- Replicação do diretório e do catálogo ---------------------------------
+
+def _upsert(alias: str, instancia) -> None:
+    conn = connections[alias]
+    campos = instancia._meta.concrete_fields
+    colunas = [campo.column for campo in campos]
+    valores = [campo.get_db_prep_save(getattr(instancia, campo.attname), conn) for campo in campos]
+    atualizacao = ", ".join(f"{c} = EXCLUDED.{c}" for c in colunas if c != "id")
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {instancia._meta.db_table} ({', '.join(colunas)}) "
+            f"VALUES ({', '.join(['%s'] * len(colunas))}) "
+            f"ON CONFLICT (id) DO UPDATE SET {atualizacao}",
+            valores,
+        )
+
+
+@receiver(post_save, sender=Usuario)
+def _usuario_salvo(sender, instance, created, using, **kwargs):
+    if using != DIRETORIO or not sharding_ativo():
+        return
+    if created and not instance.shard:
+        instance.shard = anel().shard_para(instance.pk)
+        Usuario.objects.filter(pk=instance.pk).update(shard=instance.shard)
+    if instance.shard and instance.shard != DIRETORIO:
+        _upsert(instance.shard, instance)
+
+
+@receiver(post_delete, sender=Usuario)
+def _usuario_excluido(sender, instance, using, **kwargs):
+    # As FKs ON DELETE CASCADE apagam os dados do usuário no shard.
+    if using == DIRETORIO and instance.shard and instance.shard != DIRETORIO:
+        with connections[instance.shard].cursor() as cursor:
+            cursor.execute("DELETE FROM usuarios WHERE id = %s", [instance.pk])
+
+
+@receiver(post_save, sender=Exercicio)
+def _exercicio_salvo(sender, instance, using, **kwargs):
+    if using == DIRETORIO and sharding_ativo():
+        for alias in settings.SHARDS:
+            _upsert(alias, instance)
+
+
+@receiver(pre_delete, sender=Exercicio)
+def _exercicio_em_uso(sender, instance, using, **kwargs):
+    # O Collector só enxerga o default; as séries estão nos shards.
+    if using != DIRETORIO or not sharding_ativo():
+        return
+    for alias in settings.SHARDS:
+        series = SerieMusculacao.objects.using(alias).filter(exercicio_id=instance.pk)
+        if series.exists():
+            raise ProtectedError(
+                "Exercício com séries registradas não pode ser excluído.", set(series[:10])
+            )
+
+
+@receiver(post_delete, sender=Exercicio)
+def _exercicio_excluido(sender, instance, using, **kwargs):
+    if using == DIRETORIO and sharding_ativo():
+        for alias in settings.SHARDS:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("DELETE FROM exercicios WHERE id = %s", [instance.pk])
+
+
+def sincronizar_catalogo(alias: str) -> int:
+    """Copia o catálogo do diretório para o shard (upsert por id)."""
+    with connections[DIRETORIO].cursor() as cursor:
+        cursor.execute("SELECT id, nome, grupo_muscular, equipamento FROM exercicios")
+        linhas = cursor.fetchall()
+    with connections[alias].cursor() as cursor:
+        cursor.executemany(
+            """
+            INSERT INTO exercicios (id, nome, grupo_muscular, equipamento)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (id) DO UPDATE SET nome = EXCLUDED.nome,
+              grupo_muscular = EXCLUDED.grupo_muscular, equipamento = EXCLUDED.equipamento
+            """,
+            linhas,
+        )
+    return len(linhas)
+
+
+def preparar_shard(alias: str) -> None:
+    """
+    Põe as sequências do shard na faixa de ids dele (idempotente) e
+    sincroniza o catálogo.
+    """
+    inicio = (settings.SHARDS.index(alias) + 1) << _BITS_FAIXA_IDS
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT setval(format('%%I.%%I', schemaname, sequencename)::regclass,
+                          GREATEST(%s, COALESCE(last_value, 0)))
+            FROM pg_sequences
+            WHERE schemaname = 'public' AND NOT sequencename = ANY(%s)
+            """,
+            [inicio, list(_SEQUENCIAS_DIRETORIO)],
+        )
+    sincronizar_catalogo(alias)
+
+
+# --- Rebalanceamento --------------------------------------------------------
+
+def _copiar_tabela(leitura, escrita, tabela: str, filtro: str, usuario_id: int) -> int:
+    with leitura.cursor.copy(
+        f"COPY (SELECT * FROM {tabela} WHERE {filtro}) TO STDOUT (FORMAT BINARY)",
+        [usuario_id],
+    ) as saida, escrita.cursor.copy(f"COPY {tabela} FROM STDIN (FORMAT BINARY)") as entrada:
+        for bloco in saida:
+            entrada.write(bloco)
+    return leitura.cursor.rowcount
+
+
+def _apagar_dados(cursor, usuario_id: int, alias: str) -> None:
+    # Os dados continuam existindo no outro banco: sem lápides de sincronização.
+    cursor.execute("SET LOCAL app.sem_exclusoes_sync = on")
+    for tabela, filtro in reversed(TABELAS_USUARIO):
+        cursor.execute(f"DELETE FROM {tabela} WHERE {filtro}", [usuario_id])
+    if alias != DIRETORIO:
+        cursor.execute("DELETE FROM usuarios WHERE id = %s", [usuario_id])
+
+
+def mover_usuario(usuario: Usuario, destino: str, espera: float = 0.0) -> int:
+    """
+    Move os dados do usuário para o shard `destino` sem parar a API;
+    devolve o número de linhas copiadas.
+
+    1. Marca o usuário como em migração: leituras seguem no shard de
+       origem e escritas recebem 503 (ContaEmMigracao) até o fim.
+    2. Espera `espera` segundos para as escritas em andamento terminarem
+       e trava a linha do usuário na origem (FOR UPDATE bloqueia qualquer
+       INSERT atrasado que referencie o usuário).
+    3. Copia as tabelas com COPY binário para o destino (apagando antes
+       restos de uma tentativa interrompida) e confirma o destino.
+    4. Aponta o diretório para o destino e apaga os dados da origem.
+    """
+    origem = alias_do_usuario(usuario)
+    if origem == destino:
+        return 0
+
+    Usuario.objects.filter(pk=usuario.pk).update(shard_migrando_desde=timezone.now())
+    time.sleep(espera)
+
+    total = 0
+    with transaction.atomic(using=origem), connections[origem].cursor() as leitura:
+        leitura.execute("SELECT 1 FROM usuarios WHERE id = %s FOR UPDATE", [usuario.pk])
+        with transaction.atomic(using=destino), connections[destino].cursor() as escrita:
+            _apagar_dados(escrita, usuario.pk, destino)
+            if destino != DIRETORIO:
+                _upsert(destino, usuario)
+            for tabela, filtro in TABELAS_USUARIO:
+                total += _copiar_tabela(leitura, escrita, tabela, filtro, usuario.pk)
+
+        Usuario.objects.filter(pk=usuario.pk).update(shard=destino, shard_migrando_desde=None)
+        _apagar_dados(leitura, usuario.pk, origem)
+
+    usuario.shard, usuario.shard_migrando_desde = destino, None
+    return total
+
+
+def plano_rebalanceamento() -> Iterator[tuple[int, str, str]]:
+    """(usuario_id, origem, destino) dos usuários fora do shard indicado pelo anel."""
+    usuarios = (
+        Usuario.objects.filter(excluido_em__isnull=True).order_by("id").values_list("id", "shard")
+    )
+    for usuario_id, shard in usuarios.iterator():
+        destino = anel().shard_para(usuario_id)
+        if (shard or DIRETORIO) != destino:
+            yield usuario_id, shard or DIRETORIO, destino
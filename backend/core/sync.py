@@ -0,0 +1,230 @@
+"""
+Delta sync do app offline (GET /api/sync/?cursor=).
+
+Sessões, métricas, séries, metas e marcações têm `atualizado_em` (hora
+do relógio da escrita, mantida pelo banco) e as exclusões deixam lápides
+em `exclusoes_sync` (veja db/init/01_schema.sql). Uma página junta as
+seis tabelas e as lápides em um UNION ALL ordenado por
+(atualizado_em, tipo, id), lendo cada uma pelo índice
+(usuario_id, atualizado_em, id) a partir do cursor: o custo acompanha o
+volume de alterações, não o tamanho do histórico.
+
+O cursor é a chave da última linha entregue. Uma transação ainda aberta
+pode confirmar depois linhas com atualizado_em anterior ao de linhas já
+entregues; por isso a página só vai até o início da transação com
+escrita mais antiga em andamento (pg_stat_activity), menos uma margem.
+O que fica de fora aparece na próxima chamada.
+
+Sem cursor, a sincronização começa do zero (todas as linhas vivas, em
+páginas). Lápides mais antigas que SYNC_RETENCAO_EXCLUSOES_DIAS são
+apagadas (`manage.py limpar_exclusoes_sync`); cursores anteriores a isso
+recebem 410 e o app sincroniza do zero.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import cache
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import exceptions, serializers
+
+from . import shards
+from .serializers import (
+    MarcacaoHabitoSerializer,
+    MetaHabitoSerializer,
+    MetricasCiclismoSerializer,
+    MetricasCorridaSerializer,
+    SerieMusculacaoSerializer,
+    SessaoAtividadeSerializer,
+)
+
+TAMANHO_PAGINA = 500
+TAMANHO_MAXIMO = 2000
+# Folga entre a leitura do relógio na escrita e a atribuição do xid da
+# transação (até lá ela não aparece como escrita em andamento).
+MARGEM = timedelta(seconds=1)
+
+# (tipo, tabela, coluna do id, campos na API -> colunas). Os campos
+# seguem os serializers dos endpoints de cada recurso.
+_FONTES = (
+    ("sessao", "sessoes_atividade", "id", {
+        "id": "id", "modalidade": "modalidade", "inicio_em": "inicio_em",
+        "duracao_seg": "duracao_seg", "calorias": "calorias",
+        "calorias_estimadas": "calorias_estimadas",
+        "observacoes": "observacoes", "criado_em": "criado_em",
+    }),
+    ("metricas_corrida", "metricas_corrida", "sessao_id", {
+        "sessao": "sessao_id", "distancia_km": "distancia_km",
+        "ritmo_medio_seg_km": "ritmo_medio_seg_km", "fc_media": "fc_media",
+    }),
+    ("metricas_ciclismo", "metricas_ciclismo", "sessao_id", {
+        "sessao": "sessao_id", "distancia_km": "distancia_km",
+        "velocidade_media_kmh": "velocidade_media_kmh", "fc_media": "fc_media",
+    }),
+    ("serie", "series_musculacao", "id", {
+        "id": "id", "sessao": "sessao_id", "exercicio": "exercicio_id",
+        "ordem_serie": "ordem_serie", "repeticoes": "repeticoes", "carga_kg": "carga_kg",
+    }),
+    ("meta", "metas_habito", "id", {
+        "id": "id", "titulo": "titulo", "modalidade": "modalidade",
+        "data_inicio": "data_inicio", "data_fim": "data_fim",
+        "frequencia_semana": "frequencia_semana", "distancia_meta_km": "distancia_meta_km",
+        "duracao_meta_min": "duracao_meta_min", "sessoes_meta": "sessoes_meta",
+        "ativo": "ativo", "marcar_automaticamente": "marcar_automaticamente",
+        "criado_em": "criado_em",
+    }),
+    ("marcacao", "marcacoes_habito", "id", {
+        "id": "id", "meta": "meta_id", "data": "data", "sessao": "sessao_id",
+        "concluido": "concluido", "criado_em": "criado_em",
+    }),
+)
+_ORDEM_EXCLUSOES = len(_FONTES)
+
+# Serializer do endpoint de cada tipo: os valores saem no mesmo formato
+# do REST (decimais como string, datas e horas no fuso local).
+_SERIALIZERS = {
+    "sessao": SessaoAtividadeSerializer,
+    "metricas_corrida": MetricasCorridaSerializer,
+    "metricas_ciclismo": MetricasCiclismoSerializer,
+    "serie": SerieMusculacaoSerializer,
+    "meta": MetaHabitoSerializer,
+    "marcacao": MarcacaoHabitoSerializer,
+}
+
+
+class CursorExpirado(exceptions.APIException):
+    status_code = 410
+    default_detail = "Cursor anterior à retenção das exclusões. Sincronize do zero (sem cursor)."
+    default_code = "cursor_expirado"
+
+
+def _sql_fonte(ordem: int, tipo: str, tabela: str, coluna_id: str, campos: dict) -> str:
+    dados = ", ".join(f"'{campo}', {coluna}" for campo, coluna in campos.items())
+    return f"""
+    (SELECT atualizado_em AS em, {ordem} AS ordem, {coluna_id} AS chave,
+            '{tipo}' AS tipo, {coluna_id} AS registro_id,
+            jsonb_build_object({dados})::text AS dados
+     FROM {tabela}
+     WHERE usuario_id = %(usuario_id)s
+       AND atualizado_em >= %(desde)s::timestamptz AND atualizado_em < %(ate)s
+       AND (atualizado_em, {ordem}, {coluna_id}) > (%(desde)s::timestamptz, %(ordem)s, %(chave)s)
+     ORDER BY atualizado_em, {coluna_id}
+     LIMIT %(limite)s)
+    """
+
+
+_PAGINA_SQL = " UNION ALL ".join(
+    [_sql_fonte(ordem, *fonte) for ordem, fonte in enumerate(_FONTES)]
+    + [f"""
+    (SELECT excluido_em, {_ORDEM_EXCLUSOES}, id, tipo, registro_id, NULL
+     FROM exclusoes_sync
+     WHERE usuario_id = %(usuario_id)s
+       AND excluido_em >= %(desde)s::timestamptz AND excluido_em < %(ate)s
+       AND (excluido_em, {_ORDEM_EXCLUSOES}, id) > (%(desde)s::timestamptz, %(ordem)s, %(chave)s)
+     ORDER BY excluido_em, id
+     LIMIT %(limite)s)
+    """]
+) + " ORDER BY 1, 2, 3 LIMIT %(limite)s"
+
+# Início da transação com escrita mais antiga ainda aberta neste banco.
+_LIMITE_SQL = """
+    SELECT LEAST(clock_timestamp(), min(xact_start)) - %s
+    FROM pg_stat_activity
+    WHERE datname = current_database()
+      AND backend_xid IS NOT NULL
+      AND pid <> pg_backend_pid()
+"""
+
+
+@cache
+def _formatadores(tipo: str) -> dict[str, Callable[[Any], Any]]:
+    """Conversões dos campos cujo valor no jsonb difere da resposta do REST."""
+    campos = _SERIALIZERS[tipo]().fields
+    formatadores = {}
+    for nome, campo in campos.items():
+        if isinstance(campo, serializers.DateTimeField):
+            formatadores[nome] = lambda valor, campo=campo: campo.to_representation(parse_datetime(valor))
+        elif isinstance(campo, serializers.DecimalField):
+            formatadores[nome] = campo.to_representation
+    return formatadores
+
+
+def _formatar(tipo: str, dados: dict[str, Any]) -> dict[str, Any]:
+    for nome, formatar in _formatadores(tipo).items():
+        if dados.get(nome) is not None:
+            dados[nome] = formatar(dados[nome])
+    return dados
+
+
+def codificar_cursor(em: datetime, ordem: int, chave: int) -> str:
+    texto = f"{em.isoformat()}|{ordem}|{chave}"
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> tuple[datetime, int, int]:
+    """Levanta ValueError para cursores malformados."""
+    try:
+        texto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        em, ordem, chave = texto.split("|")
+        em = datetime.fromisoformat(em)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Cursor inválido.") from exc
+    if em.tzinfo is None:
+        raise ValueError("Cursor inválido.")
+    return em, int(ordem), int(chave)
+
+
+def alteracoes(usuario_id: int, cursor: Optional[str], limite: int = TAMANHO_PAGINA) -> dict[str, Any]:
+    """
+    Próxima página de alterações do usuário depois de `cursor` (None = do
+    zero). Devolve {"alteracoes", "cursor", "mais"}; o app repete a
+    chamada com o cursor devolvido enquanto `mais` for verdadeiro.
+    """
+    if cursor:
+        desde, ordem, chave = decodificar_cursor(cursor)
+        retencao = timedelta(days=settings.SYNC_RETENCAO_EXCLUSOES_DIAS)
+        if desde < timezone.now() - retencao:
+            raise CursorExpirado()
+    else:
+        desde, ordem, chave = "-infinity", -1, 0
+
+    with shards.conexao().cursor() as db:
+        db.execute(_LIMITE_SQL, [MARGEM])
+        ate = db.fetchone()[0]
+        db.execute(_PAGINA_SQL, {
+            "usuario_id": usuario_id, "desde": desde, "ordem": ordem,
+            "chave": chave, "ate": ate, "limite": limite + 1,
+        })
+        linhas = db.fetchall()
+
+    mais = len(linhas) > limite
+    linhas = linhas[:limite]
+    resultado = []
+    for _em, ordem_linha, _chave, tipo, registro_id, dados in linhas:
+        alteracao = {"tipo": tipo, "id": registro_id, "excluido": ordem_linha == _ORDEM_EXCLUSOES}
+        if dados is not None:
+            alteracao["dados"] = _formatar(tipo, json.loads(dados, parse_float=Decimal))
+        resultado.append(alteracao)
+
+    if mais:
+        proximo = codificar_cursor(*linhas[-1][:3])
+    elif cursor and isinstance(desde, datetime) and desde >= ate:
+        proximo = cursor
+    else:
+        # Tudo antes de `ate` foi entregue: a próxima chamada começa nele.
+        proximo = codificar_cursor(ate, -1, 0)
+    return {"alteracoes": resultado, "cursor": proximo, "mais": mais}
+
+
+def limpar_exclusoes() -> int:
+    """Apaga as lápides do shard ativo além da retenção."""
+    with shards.conexao().cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM exclusoes_sync WHERE excluido_em < now() - make_interval(days => %s)",
+            [settings.SYNC_RETENCAO_EXCLUSOES_DIAS],
+        )
+        return cursor.rowcount
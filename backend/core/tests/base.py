@@ -0,0 +1,107 @@
+"""
+Base dos testes de API: usuários com token, shard ativo e outbox.
+
+Os testes rodam dentro da transação do TestCase em todos os bancos
+(diretório e shards), que nunca é confirmada: o ClienteAPI roda os
+`on_commit` ao fim de cada requisição, como o commit real faria. O worker
+do outbox não roda sozinho: chame `drenar_outbox()` onde o teste depende
+dos dados derivados.
+"""
+import uuid
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core import outbox, shards
+from core.authentication import create_jwt_for_user
+from core.models import Usuario
+
+SENHA = "senha-de-teste"
+
+
+def criar_usuario(**campos) -> Usuario:
+    campos.setdefault("nome", "Teste")
+    campos.setdefault("email", f"{uuid.uuid4().hex}@teste.com")
+    return Usuario.objects.create(hash_senha=make_password(SENHA), **campos)
+
+
+class ClienteAPI(APIClient):
+    def request(self, **kwargs):
+        with ExitStack() as pilha:
+            for alias in settings.DATABASES:
+                pilha.enter_context(TestCase.captureOnCommitCallbacks(using=alias, execute=True))
+            return super().request(**kwargs)
+
+
+def cliente_de(usuario: Usuario) -> APIClient:
+    cliente = ClienteAPI()
+    cliente.credentials(HTTP_AUTHORIZATION="Bearer " + create_jwt_for_user(usuario))
+    return cliente
+
+
+def drenar_outbox() -> None:
+    for alias in settings.SHARDS:
+        with shards.usando(alias):
+            while True:
+                # Cada lote "confirma": roda os on_commit dos tratadores.
+                with TestCase.captureOnCommitCallbacks(using=alias, execute=True):
+                    if not outbox.processar_lote():
+                        break
+
+
+@contextmanager
+def no_shard(usuario: Usuario):
+    """Ativa o shard do usuário (para chamar os módulos fora de uma requisição)."""
+    usuario.refresh_from_db(fields=["shard"])
+    with shards.usando(shards.alias_do_usuario(usuario)):
+        yield
+
+
+def consultar(usuario: Usuario, sql: str, params=None) -> list[tuple]:
+    """SQL cru no shard do usuário (linhas do resultado, se houver)."""
+    usuario.refresh_from_db(fields=["shard"])
+    with connections[shards.alias_do_usuario(usuario)].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall() if cursor.description else []
+
+
+def dias_atras(dias: int, hora: int = 10) -> datetime:
+    """Instante local `dias` atrás, dentro das partições criadas pelo schema."""
+    dia = timezone.localdate() - timedelta(days=dias)
+    return timezone.make_aware(datetime(dia.year, dia.month, dia.day, hora))
+
+
+class APITestCase(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        # As chaves do cache usam o id do usuário, que se repete entre
+        # execuções (os bancos de teste são recriados).
+        cache.clear()
+        self.usuario = criar_usuario()
+        self.cliente = cliente_de(self.usuario)
+
+    def criar_sessao(self, modalidade: str = "corrida", inicio_em=None, cliente=None, **campos) -> dict:
+        resposta = (cliente or self.cliente).post(
+            "/api/sessoes-atividade/",
+            {"modalidade": modalidade, "inicio_em": (inicio_em or dias_atras(1)).isoformat(), **campos},
+            format="json",
+        )
+        self.assertEqual(resposta.status_code, 201, resposta.data)
+        return resposta.data
+
+    def criar_metricas_corrida(self, sessao_id: int, cliente=None, **campos) -> dict:
+        campos.setdefault("distancia_km", "5.00")
+        campos.setdefault("ritmo_medio_seg_km", 300)
+        resposta = (cliente or self.cliente).post(
+            "/api/metricas-corrida/", {"sessao": sessao_id, **campos}, format="json"
+        )
+        self.assertEqual(resposta.status_code, 201, resposta.data)
+        return resposta.data
@@ -0,0 +1,55 @@
+"""
+Runner dos testes (`python manage.py test`).
+
+Os modelos do core são unmanaged: depois que o Django cria os bancos de
+teste (e roda as migrações das apps contrib), o schema de db/init/*.sql
+é aplicado em cada um, como o container do Postgres faz na primeira
+subida. Com SHARD_DATABASES configurado, os shards de teste também são
+preparados (faixas de ids e catálogo), então a mesma suíte roda com e
+sem sharding:
+
+    python manage.py test
+    SHARD_DATABASES=teste_s0,teste_s1 python manage.py test
+"""
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+from core import shards
+
+ARQUIVOS_SCHEMA = ("01_schema.sql", "02_seed_exercicios.sql", "03_relatorios.sql")
+
+
+def diretorio_schema() -> Path:
+    padrao = Path(settings.BASE_DIR).parent / "db" / "init"
+    return Path(os.getenv("SCHEMA_SQL_DIR", padrao))
+
+
+class SchemaSQLRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Buckets de throttling próprios da execução, fora do /dev/shm real.
+        self._throttle = tempfile.NamedTemporaryFile(prefix="throttle_testes_")
+        settings.THROTTLE_SHM_PATH = self._throttle.name
+
+    def teardown_test_environment(self, **kwargs):
+        self._throttle.close()
+        super().teardown_test_environment(**kwargs)
+
+    def setup_databases(self, **kwargs):
+        configuracoes = super().setup_databases(**kwargs)
+        diretorio = diretorio_schema()
+        for conexao, _nome, _destruir in configuracoes:
+            with conexao.cursor() as cursor:
+                cursor.execute("SELECT to_regclass('usuarios') IS NOT NULL")
+                if cursor.fetchone()[0]:  # --keepdb
+                    continue
+                for arquivo in ARQUIVOS_SCHEMA:
+                    cursor.execute((diretorio / arquivo).read_text())
+        if shards.sharding_ativo():
+            for alias in settings.SHARDS:
+                shards.preparar_shard(alias)
+        return configuracoes
@@ -0,0 +1,125 @@
+import uuid
+from unittest import mock
+
+from rest_framework.test import APIClient
+
+from core.tests.base import SENHA, APITestCase, criar_usuario
+from core.throttling import AuthIPThrottle
+
+
+def ip_novo() -> str:
+    return f"10.{uuid.uuid4().int % 250}.{uuid.uuid4().int % 250}.{uuid.uuid4().int % 250}"
+
+
+class AuthTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        # IP próprio por teste: os buckets de throttling duram a execução inteira.
+        self.anonimo = APIClient(REMOTE_ADDR=ip_novo())
+
+    def test_registro_login_e_refresh(self):
+        email = f"{uuid.uuid4().hex}@teste.com"
+        registro = self.anonimo.post(
+            "/auth/register/", {"nome": "Novo", "email": email, "senha": SENHA}, format="json"
+        )
+        self.assertEqual(registro.status_code, 201, registro.data)
+        self.assertEqual(
+            self.anonimo.post("/auth/register/", {"nome": "Novo", "email": email, "senha": SENHA},
+                              format="json").status_code,
+            400,
+        )
+
+        login = self.anonimo.post("/auth/login/", {"email": email, "senha": SENHA}, format="json")
+        self.assertEqual(login.status_code, 200)
+        self.assertEqual(login.data["user"]["id"], registro.data["user"]["id"])
+        errado = self.anonimo.post("/auth/login/", {"email": email, "senha": "outra"}, format="json")
+        self.assertEqual(errado.status_code, 400)
+
+        refresh = self.anonimo.post(
+            "/auth/refresh/", {"refresh_token": login.data["refresh_token"]}, format="json"
+        )
+        self.assertEqual(refresh.status_code, 200)
+        self.anonimo.credentials(HTTP_AUTHORIZATION="Bearer " + refresh.data["access_token"])
+        self.assertEqual(self.anonimo.get("/auth/me/").data["email"], email)
+
+    def test_atualiza_o_proprio_perfil(self):
+        resposta = self.cliente.patch("/auth/me/", {"nome": "Outro nome"}, format="json")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(self.cliente.get("/auth/me/").data["nome"], "Outro nome")
+
+    def test_troca_de_senha(self):
+        resposta = self.cliente.patch(
+            "/auth/change-password/",
+            {"senha_atual": SENHA, "nova_senha": "nova-senha-123", "nova_senha_confirmacao": "nova-senha-123"},
+            format="json",
+        )
+        self.assertEqual(resposta.status_code, 200, resposta.data)
+        login = self.anonimo.post(
+            "/auth/login/", {"email": self.usuario.email, "senha": "nova-senha-123"}, format="json"
+        )
+        self.assertEqual(login.status_code, 200)
+
+
+@mock.patch.dict(
+    AuthIPThrottle.THROTTLE_RATES, {"auth_ip": "3/min", "auth_email": "2/min", "auth_conta": "4/min"}
+)
+class ThrottlingTests(APITestCase):
+    def test_x_forwarded_for_nao_renova_o_bucket_do_ip(self):
+        cliente = APIClient(REMOTE_ADDR=ip_novo())
+        codigos = [
+            cliente.post("/auth/register/", {}, format="json", HTTP_X_FORWARDED_FOR=ip_novo()).status_code
+            for _ in range(4)
+        ]
+        self.assertEqual(codigos, [400, 400, 400, 429])
+
+    def test_tentativas_de_outro_ip_nao_bloqueiam_a_vitima(self):
+        atacante = APIClient(REMOTE_ADDR=ip_novo())
+        corpo = {"email": self.usuario.email, "senha": "errada"}
+        codigos = [atacante.post("/auth/login/", corpo, format="json").status_code for _ in range(3)]
+        self.assertEqual(codigos, [400, 400, 429])
+
+        vitima = APIClient(REMOTE_ADDR=ip_novo())
+        login = vitima.post("/auth/login/", {"email": self.usuario.email, "senha": SENHA}, format="json")
+        self.assertEqual(login.status_code, 200)
+
+    def test_bucket_da_conta_vale_entre_ips(self):
+        corpo = {"email": self.usuario.email.upper(), "senha": "errada"}
+        codigos = [
+            APIClient(REMOTE_ADDR=ip_novo()).post("/auth/login/", corpo, format="json").status_code
+            for _ in range(5)
+        ]
+        self.assertEqual(codigos, [400, 400, 400, 400, 429])
+
+
+class UsuariosTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.outro = criar_usuario(nome="Outro")
+        self.url = f"/api/usuarios/{self.outro.pk}/"
+
+    def test_nao_altera_nem_exclui_outro_usuario(self):
+        for metodo in ("patch", "put"):
+            resposta = getattr(self.cliente, metodo)(
+                self.url, {"nome": "Invadido", "email": "x@teste.com", "participa_ranking": True}, format="json"
+            )
+            self.assertEqual(resposta.status_code, 405)
+        self.assertEqual(self.cliente.delete(self.url).status_code, 405)
+        self.outro.refresh_from_db()
+        self.assertEqual((self.outro.nome, self.outro.participa_ranking), ("Outro", False))
+
+    def test_preferencias_so_no_proprio_perfil(self):
+        self.assertNotIn("participa_ranking", self.cliente.get(self.url).data)
+        resposta = self.cliente.patch("/auth/me/", {"participa_ranking": True}, format="json")
+        self.assertIs(resposta.data["participa_ranking"], True)
+
+    def test_peso_so_no_proprio_perfil_e_positivo(self):
+        self.assertNotIn("peso_kg", self.cliente.get(self.url).data)
+        for peso in ("0", "-5"):
+            self.assertEqual(self.cliente.patch("/auth/me/", {"peso_kg": peso}, format="json").status_code, 400)
+        self.assertEqual(self.cliente.patch("/auth/me/", {"peso_kg": "70.5"}, format="json").data["peso_kg"], "70.50")
+
+    def test_fc_maxima_so_no_proprio_perfil_e_na_faixa(self):
+        self.assertNotIn("fc_maxima", self.cliente.get(self.url).data)
+        for fc in (99, 300):
+            self.assertEqual(self.cliente.patch("/auth/me/", {"fc_maxima": fc}, format="json").status_code, 400)
+        self.assertEqual(self.cliente.patch("/auth/me/", {"fc_maxima": 190}, format="json").data["fc_maxima"], 190)
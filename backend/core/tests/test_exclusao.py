@@ -0,0 +1,134 @@
+import unittest
+from unittest import mock
+
+from django.db import connections
+from rest_framework.test import APIClient
+
+from core import exclusao, outbox, shards
+from core.models import Usuario
+from core.tests.base import SENHA, APITestCase, consultar, dias_atras, drenar_outbox, no_shard
+
+
+def excluir_metas(usuario_id: int, eventos: list[dict]) -> None:
+    """Tratador de teste que apaga registros sincronizados."""
+    with shards.conexao().cursor() as cursor:
+        cursor.execute("DELETE FROM metas_habito WHERE usuario_id = %s", [usuario_id])
+
+
+class ExclusaoContaTests(APITestCase):
+    def test_exclusao_recusa_o_token_e_apaga_os_dados(self):
+        sessao = self.criar_sessao()
+        self.criar_metricas_corrida(sessao["id"])
+        email = self.usuario.email
+
+        self.assertEqual(self.cliente.delete("/auth/me/").status_code, 204)
+        self.assertEqual(self.cliente.get("/auth/me/").status_code, 401)
+        login = APIClient().post("/auth/login/", {"email": email, "senha": SENHA}, format="json")
+        self.assertNotEqual(login.status_code, 200)
+
+        shard = connections[shards.alias_do_usuario(self.usuario)]
+        drenar_outbox()
+        with shard.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM sessoes_atividade WHERE usuario_id = %s", [self.usuario.pk])
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute("SELECT count(*) FROM usuarios WHERE id = %s", [self.usuario.pk])
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertFalse(Usuario.objects.filter(pk=self.usuario.pk).exists())
+
+    def test_dependentes_saem_em_lotes_antes_das_sessoes(self):
+        corrida = self.criar_sessao()
+        self.criar_metricas_corrida(corrida["id"])
+        musculacao = self.criar_sessao("musculacao")
+        for ordem in (1, 2, 3):
+            self.cliente.post(
+                "/api/series-musculacao/",
+                {"sessao": musculacao["id"], "exercicio": 1, "ordem_serie": ordem,
+                 "repeticoes": 5, "carga_kg": "40"},
+                format="json",
+            )
+        self.cliente.delete("/auth/me/")
+
+        apagadas = []
+        apagar = exclusao._apagar
+
+        def registrar(cursor, tabela, *args):
+            total = apagar(cursor, tabela, *args)
+            if total:
+                apagadas.append((tabela, total))
+            return total
+
+        with mock.patch.object(exclusao, "TAMANHO_LOTE", 2), \
+                mock.patch.object(exclusao, "_apagar", registrar):
+            drenar_outbox()
+
+        self.assertTrue(all(total <= 2 for _, total in apagadas), apagadas)
+        tabelas = [tabela for tabela, _ in apagadas]
+        self.assertEqual(tabelas.count("series_musculacao"), 2)
+        self.assertEqual(tabelas[-1], "sessoes_atividade")
+        self.assertNotIn("sessoes_atividade", tabelas[:-1])
+        self.assertFalse(Usuario.objects.filter(pk=self.usuario.pk).exists())
+
+    def test_um_evento_de_exclusao_por_transacao(self):
+        with no_shard(self.usuario):
+            for _ in range(2):
+                outbox.registrar(self.usuario.pk, "exclusao_conta")
+            outbox.registrar(self.usuario.pk, "calorias")
+            with mock.patch("core.exclusao.processar_eventos") as tratador:
+                self.assertEqual(outbox.processar_lote(), 2)
+        tratador.assert_called_once_with(self.usuario.pk, [{}])
+        self.assertEqual(
+            consultar(
+                self.usuario, "SELECT tipo FROM eventos_outbox WHERE usuario_id = %s", [self.usuario.pk]
+            ),
+            [("exclusao_conta",)],
+        )
+
+    @unittest.skipUnless(shards.sharding_ativo(), "rode com SHARD_DATABASES para testar os shards")
+    def test_diretorio_so_apaga_depois_do_commit_do_shard(self):
+        self.cliente.delete("/auth/me/")
+        alias = shards.alias_do_usuario(self.usuario)
+        with shards.usando(alias), self.captureOnCommitCallbacks(using=alias) as callbacks:
+            outbox.processar_lote()
+            self.assertEqual(
+                consultar(self.usuario, "SELECT id FROM usuarios WHERE id = %s", [self.usuario.pk]), []
+            )
+            self.assertTrue(Usuario.objects.filter(pk=self.usuario.pk).exists())
+        for callback in callbacks:
+            callback()
+        self.assertFalse(Usuario.objects.filter(pk=self.usuario.pk).exists())
+
+    def test_libera_o_email_tambem_na_copia_do_shard(self):
+        email = self.usuario.email
+        self.cliente.delete("/auth/me/")
+        self.assertNotEqual(
+            consultar(self.usuario, "SELECT email FROM usuarios WHERE id = %s", [self.usuario.pk]),
+            [(email,)],
+        )
+        registro = APIClient().post(
+            "/auth/register/", {"nome": "De novo", "email": email, "senha": SENHA}, format="json"
+        )
+        self.assertEqual(registro.status_code, 201, registro.data)
+
+    def test_tratadores_seguintes_do_lote_mantem_as_lapides(self):
+        self.criar_sessao()
+        self.cliente.post(
+            "/api/metas-habito/",
+            {"titulo": "x", "modalidade": "corrida", "data_inicio": dias_atras(5).date().isoformat(),
+             "sessoes_meta": 3},
+            format="json",
+        )
+        tratadores = {**outbox.TRATADORES, "teste_exclusao_metas": "core.tests.test_exclusao.excluir_metas"}
+        with mock.patch.object(outbox, "TRATADORES", tratadores), no_shard(self.usuario):
+            # Mesmo lote: a exclusão (ainda com sessões a apagar) e depois
+            # outro tratador que apaga registros sincronizados.
+            outbox.registrar(self.usuario.pk, "exclusao_conta")
+            outbox.registrar(self.usuario.pk, "teste_exclusao_metas")
+            outbox.processar_lote()
+        self.assertEqual(
+            consultar(
+                self.usuario,
+                "SELECT count(*) FROM exclusoes_sync WHERE usuario_id = %s AND tipo = 'meta'",
+                [self.usuario.pk],
+            ),
+            [(1,)],
+        )
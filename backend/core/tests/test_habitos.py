@@ -0,0 +1,130 @@
+from datetime import date, datetime
+
+from django.utils import timezone
+
+from core.marcacoes import reconciliar_faixa
+from core.tests.base import APITestCase, consultar, dias_atras, drenar_outbox, no_shard
+
+
+class MarcacoesAutomaticasTests(APITestCase):
+    def criar_meta(self, **campos) -> dict:
+        campos = {
+            "titulo": "correr", "modalidade": "corrida", "frequencia_semana": 3,
+            "data_inicio": dias_atras(30).date().isoformat(), **campos,
+        }
+        resposta = self.cliente.post("/api/metas-habito/", campos, format="json")
+        self.assertEqual(resposta.status_code, 201, resposta.data)
+        return resposta.data
+
+    def marcacoes(self, meta: dict) -> list[tuple]:
+        dados = self.cliente.get("/api/marcacoes-habito/").data
+        return sorted((m["data"], m["sessao"]) for m in dados if m["meta"] == meta["id"])
+
+    def test_sessao_marca_so_metas_automaticas_da_modalidade(self):
+        automatica = self.criar_meta(marcar_automaticamente=True)
+        manual = self.criar_meta()
+        musculacao = self.criar_meta(modalidade="musculacao", marcar_automaticamente=True)
+
+        sessao = self.criar_sessao("corrida", dias_atras(2))
+
+        self.assertEqual(self.marcacoes(automatica), [(dias_atras(2).date().isoformat(), sessao["id"])])
+        self.assertEqual(self.marcacoes(manual), [])
+        self.assertEqual(self.marcacoes(musculacao), [])
+
+    def test_vincula_marcacao_manual_do_dia(self):
+        meta = self.criar_meta(marcar_automaticamente=True)
+        dia = dias_atras(3).date().isoformat()
+        self.cliente.post("/api/marcacoes-habito/", {"meta": meta["id"], "data": dia}, format="json")
+        sessao = self.criar_sessao("corrida", dias_atras(3))
+        self.assertEqual(self.marcacoes(meta), [(dia, sessao["id"])])
+
+    def test_reconciliacao_marca_o_historico(self):
+        sessoes = [self.criar_sessao("corrida", dias_atras(d))["id"] for d in (5, 4)]
+        meta = self.criar_meta()
+        self.cliente.patch(f"/api/metas-habito/{meta['id']}/", {"marcar_automaticamente": True}, format="json")
+
+        with no_shard(self.usuario):
+            self.assertEqual(reconciliar_faixa(self.usuario.pk, self.usuario.pk), 2)
+            self.assertEqual(reconciliar_faixa(self.usuario.pk, self.usuario.pk), 0)
+        self.assertEqual([s for _, s in self.marcacoes(meta)], sessoes)
+
+
+class HeatmapTests(APITestCase):
+    def test_conta_sessoes_e_habitos_por_dia(self):
+        ano = timezone.localdate().year - 1
+        inicio = timezone.make_aware(datetime(ano, 3, 1, 10))
+        self.criar_sessao("corrida", inicio)
+        self.criar_sessao("corrida", inicio.replace(hour=18))
+        meta = self.cliente.post(
+            "/api/metas-habito/",
+            {"titulo": "x", "modalidade": "corrida", "data_inicio": f"{ano}-01-01", "sessoes_meta": 3},
+            format="json",
+        ).data
+        self.cliente.post("/api/marcacoes-habito/", {"meta": meta["id"], "data": f"{ano}-03-01"}, format="json")
+
+        dados = self.cliente.get(f"/api/heatmap/?ano={ano}").data
+        self.assertEqual(dados["totais"], {"sessoes": 2, "habitos": 1, "dias_ativos": 1})
+        dia = next(d for d in dados["dias"] if d["data"] == date(ano, 3, 1))
+        self.assertEqual((dia["sessoes"], dia["habitos"]), (2, 1))
+        self.assertGreater(dia["nivel"], 0)
+
+        # Ano encerrado vem do cache persistido; escritas nele o invalidam.
+        self.criar_sessao("corrida", inicio.replace(month=6))
+        self.assertEqual(self.cliente.get(f"/api/heatmap/?ano={ano}").data["totais"]["sessoes"], 3)
+
+    def test_reconciliacao_invalida_o_ano_encerrado(self):
+        ano = timezone.localdate().year - 1
+        self.criar_sessao("corrida", timezone.make_aware(datetime(ano, 3, 1, 10)))
+        meta = self.cliente.post(
+            "/api/metas-habito/",
+            {"titulo": "x", "modalidade": "corrida", "data_inicio": f"{ano}-01-01", "sessoes_meta": 3},
+            format="json",
+        ).data
+        self.assertEqual(self.cliente.get(f"/api/heatmap/?ano={ano}").data["totais"]["habitos"], 0)
+
+        self.cliente.patch(f"/api/metas-habito/{meta['id']}/", {"marcar_automaticamente": True}, format="json")
+        with no_shard(self.usuario):
+            self.assertEqual(reconciliar_faixa(self.usuario.pk, self.usuario.pk), 1)
+        self.assertEqual(self.cliente.get(f"/api/heatmap/?ano={ano}").data["totais"]["habitos"], 1)
+
+    def test_marcacoes_descartam_o_ano_tambem_depois_do_commit(self):
+        ano = timezone.localdate().year - 1
+        meta = self.cliente.post(
+            "/api/metas-habito/",
+            {"titulo": "x", "modalidade": "corrida", "data_inicio": f"{ano}-01-01", "sessoes_meta": 3},
+            format="json",
+        ).data
+        self.assertEqual(self.cliente.get(f"/api/heatmap/?ano={ano}").data["totais"]["habitos"], 0)
+
+        marcacao = self.cliente.post(
+            "/api/marcacoes-habito/", {"meta": meta["id"], "data": f"{ano}-03-01"}, format="json"
+        ).data
+        self.assertEqual(self.cliente.get(f"/api/heatmap/?ano={ano}").data["totais"]["habitos"], 1)
+        self.cliente.patch(f"/api/marcacoes-habito/{marcacao['id']}/", {"data": f"{ano}-04-01"}, format="json")
+        self.cliente.delete(f"/api/marcacoes-habito/{marcacao['id']}/")
+        eventos = consultar(
+            self.usuario,
+            "SELECT (dados::jsonb -> 'anos' ->> 0)::int FROM eventos_outbox "
+            "WHERE usuario_id = %s AND tipo = 'heatmap'",
+            [self.usuario.pk],
+        )
+        self.assertEqual(eventos, [(ano,)] * 3)
+
+        # Uma leitura concorrente regravou o ano com os dados de antes do
+        # commit; o worker descarta a linha de novo.
+        consultar(
+            self.usuario,
+            """
+            INSERT INTO heatmaps_anuais (usuario_id, ano, sessoes, habitos, calculado_em)
+            SELECT %s, %s, z, z[:89] || 1::smallint || z[91:], now()
+            FROM array_fill(0::smallint, ARRAY[365]) AS z
+            """,
+            [self.usuario.pk, ano],
+        )
+        self.assertEqual(self.cliente.get(f"/api/heatmap/?ano={ano}").data["totais"]["habitos"], 1)
+        drenar_outbox()
+        self.assertEqual(self.cliente.get(f"/api/heatmap/?ano={ano}").data["totais"]["habitos"], 0)
+
+    def test_ano_invalido(self):
+        self.assertEqual(self.cliente.get("/api/heatmap/?ano=x").status_code, 400)
+        self.assertEqual(self.cliente.get("/api/heatmap/?ano=1990").status_code, 400)
@@ -0,0 +1,55 @@
+import json
+
+from core.tests.base import APITestCase, dias_atras
+
+
+class ImportacaoTests(APITestCase):
+    def importar(self, corpo: str, content_type: str = "application/x-ndjson") -> dict:
+        resposta = self.cliente.post("/api/importacao/", data=corpo, content_type=content_type)
+        self.assertEqual(resposta.status_code, 200, resposta.data)
+        return resposta.data
+
+    def test_ndjson_importa_validos_e_reporta_erros(self):
+        linhas = [
+            {"modalidade": "corrida", "inicio_em": dias_atras(3).isoformat(),
+             "metricas": {"distancia_km": "5.20", "ritmo_medio_seg_km": 300}},
+            {"modalidade": "musculacao", "inicio_em": dias_atras(2).isoformat(),
+             "series": [{"exercicio": 1, "ordem_serie": 1, "repeticoes": 10, "carga_kg": "40"}]},
+            {"modalidade": "corrida", "inicio_em": "x"},
+        ]
+        corpo = "\n".join(json.dumps(linha) for linha in linhas) + "\nnão é json\n"
+
+        resumo = self.importar(corpo)
+
+        self.assertEqual(resumo["importadas"], 2)
+        self.assertEqual([erro["linha"] for erro in resumo["erros"]], [3, 4])
+        sessoes = self.cliente.get("/api/sessoes-atividade/?expand=metricas,series").data
+        self.assertEqual(len(sessoes), 2)
+        # Dados derivados recalculados no fim da importação.
+        self.assertEqual(len(self.cliente.get("/api/recordes-pessoais/").data), 1)
+
+    def test_csv(self):
+        inicio = dias_atras(1).isoformat()
+        corpo = (
+            "modalidade,inicio_em,distancia_km,ritmo_medio_seg_km,velocidade_media_kmh,series\n"
+            f"corrida,{inicio},10,320,,\n"
+        )
+        self.assertEqual(self.importar(corpo, "text/csv")["importadas"], 1)
+        sessao = self.cliente.get("/api/sessoes-atividade/?expand=metricas").data[0]
+        self.assertEqual(sessao["metricas_corrida"]["distancia_km"], "10.00")
+
+    def test_exportacao_reimporta_o_mesmo_historico(self):
+        sessao = self.criar_sessao(inicio_em=dias_atras(2), duracao_seg=1800)
+        self.criar_metricas_corrida(sessao["id"])
+        resposta = self.cliente.get("/api/exportacao/")
+        self.assertEqual(resposta.status_code, 200)
+        registros = [json.loads(linha) for linha in b"".join(resposta.streaming_content).splitlines()]
+        self.assertEqual([r["tipo"] for r in registros], ["sessao"])
+        self.assertEqual(registros[0]["metricas"]["distancia_km"], "5.00")
+
+        self.cliente.delete(f"/api/metricas-corrida/{sessao['id']}/")
+        self.cliente.delete(f"/api/sessoes-atividade/{sessao['id']}/")
+        self.assertEqual(self.importar(json.dumps(registros[0]))["importadas"], 1)
+        reimportada = self.cliente.get("/api/sessoes-atividade/?expand=metricas").data[0]
+        self.assertEqual(reimportada["duracao_seg"], 1800)
+        self.assertEqual(reimportada["metricas_corrida"]["ritmo_medio_seg_km"], 300)
@@ -0,0 +1,54 @@
+from unittest import mock
+
+from core import outbox
+from core.tests.base import APITestCase, consultar, dias_atras, drenar_outbox, no_shard
+
+
+class OutboxTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.cliente.patch("/auth/me/", {"participa_ranking": True}, format="json")
+
+    def eventos(self) -> list[tuple]:
+        return consultar(
+            self.usuario,
+            "SELECT tipo, tentativas, falhou_em IS NOT NULL FROM eventos_outbox WHERE usuario_id = %s",
+            [self.usuario.pk],
+        )
+
+    def test_lote_processa_e_apaga_os_eventos(self):
+        sessao = self.criar_sessao()
+        self.criar_metricas_corrida(sessao["id"])
+        self.assertIn("rankings", [tipo for tipo, *_ in self.eventos()])
+
+        drenar_outbox()
+
+        self.assertEqual(self.eventos(), [])
+        semana = dias_atras(1).date().isoformat()
+        resposta = self.cliente.get(f"/api/rankings/distancia_corrida/?semana={semana}")
+        self.assertEqual(resposta.data["minha_posicao"]["posicao"], 1)
+
+    def test_falha_aplica_backoff_e_esgota_as_tentativas(self):
+        self.criar_sessao()
+        drenar_outbox()
+        self.criar_sessao()
+        tratadores = {**outbox.TRATADORES, "rankings": "core.inexistente.tratador"}
+        with mock.patch.object(outbox, "TRATADORES", tratadores), no_shard(self.usuario), \
+                self.assertLogs("core.outbox", "ERROR"):
+            outbox.processar_lote()
+            self.assertEqual(self.eventos(), [("rankings", 1, False)])
+            # Fora da janela de backoff: nada a processar.
+            self.assertEqual(outbox.processar_lote(), 0)
+
+            consultar(
+                self.usuario,
+                "UPDATE eventos_outbox SET tentativas = %s, disponivel_em = now() WHERE usuario_id = %s",
+                [outbox.MAX_TENTATIVAS - 1, self.usuario.pk],
+            )
+            outbox.processar_lote()
+            self.assertEqual(self.eventos(), [("rankings", outbox.MAX_TENTATIVAS, True)])
+            self.assertEqual(outbox.metricas()["falhos"], 1)
+
+            self.assertEqual(outbox.reenfileirar_falhos(), 1)
+        drenar_outbox()
+        self.assertEqual(self.eventos(), [])
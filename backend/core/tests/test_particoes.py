@@ -0,0 +1,61 @@
+from datetime import date, datetime
+
+from django.utils import timezone
+
+from core.particoes import arquivar_particoes, criar_particoes, listar_particoes
+from core.tests.base import APITestCase, consultar, dias_atras, drenar_outbox, no_shard
+
+
+class ParticoesTests(APITestCase):
+    def test_cria_os_trimestres_futuros_uma_vez(self):
+        ano = timezone.localdate().year + 3
+        with no_shard(self.usuario):
+            criadas, erros = criar_particoes(date(ano, 5, 10), 2)
+            self.assertEqual(erros, [])
+            self.assertEqual(criadas, [
+                f"sessoes_atividade_{ano}_t2", f"sessoes_atividade_{ano}_t3",
+                f"marcacoes_habito_{ano}_t2", f"marcacoes_habito_{ano}_t3",
+            ])
+            self.assertEqual(criar_particoes(date(ano, 5, 10), 2), ([], []))
+            particao = next(p for p in listar_particoes("sessoes_atividade") if p.nome == criadas[0])
+        self.assertEqual((particao.inicio, particao.fim), (date(ano, 4, 1), date(ano, 7, 1)))
+
+    def test_trimestre_com_linhas_na_particao_padrao_e_reportado(self):
+        ano = timezone.localdate().year + 5
+        self.criar_sessao("corrida", timezone.make_aware(datetime(ano, 2, 1, 10)))
+        with no_shard(self.usuario):
+            criadas, erros = criar_particoes(date(ano, 1, 1), 2)
+        self.assertEqual(len(erros), 1)
+        self.assertTrue(erros[0].startswith(f"sessoes_atividade {ano}-01"))
+        self.assertIn(f"sessoes_atividade_{ano}_t2", criadas)
+
+    def test_arquivar_move_o_trimestre_e_recalcula_os_esforcos(self):
+        ano = timezone.localdate().year - 1
+        antiga = self.criar_sessao("corrida", timezone.make_aware(datetime(ano, 2, 1, 10)))
+        self.criar_metricas_corrida(antiga["id"], ritmo_medio_seg_km=250)
+        recente = self.criar_sessao("corrida", dias_atras(2))
+        self.criar_metricas_corrida(recente["id"], ritmo_medio_seg_km=300)
+
+        with no_shard(self.usuario):
+            arquivadas = arquivar_particoes(date(ano, 4, 1))
+
+        self.assertEqual(
+            arquivadas, [f"arquivo.marcacoes_habito_{ano}_t1", f"arquivo.sessoes_atividade_{ano}_t1"]
+        )
+        self.assertEqual([s["id"] for s in self.cliente.get("/api/sessoes-atividade/").data], [recente["id"]])
+        self.assertEqual(
+            consultar(self.usuario, f"SELECT sessao_id FROM arquivo.metricas_corrida_{ano}_t1"),
+            [(antiga["id"],)],
+        )
+        # O recálculo fica para o worker, depois do commit do DETACH.
+        self.assertEqual(
+            consultar(
+                self.usuario,
+                "SELECT count(*) FROM eventos_outbox WHERE usuario_id = %s AND tipo = 'melhores_esforcos'",
+                [self.usuario.pk],
+            ),
+            [(1,)],
+        )
+        drenar_outbox()
+        esforcos = {e["distancia_alvo"]: e for e in self.cliente.get("/api/melhores-esforcos/").data}
+        self.assertEqual(esforcos["5k"]["sessao"], recente["id"])
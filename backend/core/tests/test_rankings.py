@@ -0,0 +1,80 @@
+from unittest import mock
+
+from django.db import connection
+
+from core import rankings
+from core.tests.base import APITestCase, cliente_de, criar_usuario, dias_atras, drenar_outbox
+
+
+class RankingsTests(APITestCase):
+    def test_posicoes_e_opt_out(self):
+        semana = dias_atras(1).date().isoformat()
+        clientes = []
+        for distancia in ("5.00", "10.00", "7.00"):
+            cliente = cliente_de(criar_usuario())
+            cliente.patch("/auth/me/", {"participa_ranking": True}, format="json")
+            sessao = self.criar_sessao(cliente=cliente)
+            self.criar_metricas_corrida(sessao["id"], cliente=cliente, distancia_km=distancia)
+            clientes.append(cliente)
+        drenar_outbox()
+
+        url = f"/api/rankings/distancia_corrida/?semana={semana}"
+        resposta = clientes[0].get(url)
+        self.assertEqual(resposta.data["participantes"], 3)
+        self.assertEqual([r["valor"] for r in resposta.data["resultados"]], [10, 7, 5])
+        self.assertEqual(resposta.data["minha_posicao"]["posicao"], 3)
+
+        clientes[1].patch("/auth/me/", {"participa_ranking": False}, format="json")
+        resposta = clientes[0].get(url)
+        self.assertEqual(resposta.data["participantes"], 2)
+        self.assertEqual(resposta.data["minha_posicao"]["posicao"], 2)
+        self.assertIsNone(self.cliente.get(url).data["minha_posicao"])
+        self.assertEqual(self.cliente.get("/api/rankings/xx/").status_code, 400)
+
+    def participante(self, distancia: str):
+        cliente = cliente_de(criar_usuario())
+        cliente.patch("/auth/me/", {"participa_ranking": True}, format="json")
+        sessao = self.criar_sessao(cliente=cliente)
+        metricas = self.criar_metricas_corrida(sessao["id"], cliente=cliente, distancia_km=distancia)
+        return cliente, metricas
+
+    def test_paginas_por_cursor_com_empates(self):
+        semana = dias_atras(1).date().isoformat()
+        for distancia in ("9.00", "8.00", "8.00", "8.00", "5.00"):
+            self.participante(distancia)
+        drenar_outbox()
+
+        url = "/api/rankings/distancia_corrida/"
+        paginas = []
+        with mock.patch.object(rankings, "TAMANHO_PAGINA", 2):
+            resposta = self.cliente.get(url, {"semana": semana})
+            while True:
+                paginas.append([(r["posicao"], r["valor"]) for r in resposta.data["resultados"]])
+                if resposta.data["proxima"] is None:
+                    break
+                resposta = self.cliente.get(url, {"semana": semana, "apos": resposta.data["proxima"]})
+        self.assertEqual(paginas, [[(1, 9), (2, 8)], [(2, 8), (2, 8)], [(5, 5)]])
+        self.assertEqual(self.cliente.get(url, {"apos": "x"}).status_code, 400)
+
+    def test_valores_sem_participantes_saem_do_histograma(self):
+        semana = dias_atras(1).date().isoformat()
+        cliente, metricas = self.participante("5.00")
+        drenar_outbox()
+        cliente.patch(f"/api/metricas-corrida/{metricas['sessao']}/", {"distancia_km": "6.00"}, format="json")
+        drenar_outbox()
+        cliente.patch("/auth/me/", {"participa_ranking": False}, format="json")
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT valor, qtd FROM rankings_contagens WHERE semana = %s", [semana])
+            self.assertEqual(cursor.fetchall(), [])
+
+    def test_reconstrucao_le_os_valores_com_o_lock(self):
+        cliente, metricas = self.participante("5.00")
+        usuario_id = cliente.get("/auth/me/").data["id"]
+        ordem = []
+        bloquear, valores = rankings._bloquear, rankings._valores
+
+        with mock.patch.object(rankings, "_bloquear", lambda *a: ordem.append("lock") or bloquear(*a)), \
+                mock.patch.object(rankings, "_valores", lambda *a: ordem.append("valores") or valores(*a)):
+            rankings.reconstruir_usuario(usuario_id)
+        self.assertEqual(ordem[:2], ["lock", "valores"])
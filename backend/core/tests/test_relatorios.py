@@ -0,0 +1,58 @@
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.test import override_settings
+
+from core import relatorios
+from core.tests.base import APITestCase, dias_atras
+
+
+class RelatoriosTests(APITestCase):
+    def atualizar(self) -> str:
+        saida = StringIO()
+        call_command("atualizar_relatorios", stdout=saida)
+        return saida.getvalue()
+
+    def test_so_emails_autorizados(self):
+        self.assertEqual(self.cliente.get("/api/relatorios/modalidades/").status_code, 403)
+        with override_settings(RELATORIOS_EMAILS={self.usuario.email.lower()}):
+            self.assertEqual(self.cliente.get("/api/relatorios/modalidades/").status_code, 200)
+            resposta = self.cliente.get("/api/relatorios/habitos/", {"mes_inicio": "2024-13"})
+            self.assertEqual(resposta.status_code, 400)
+
+    def test_visoes_so_mudam_no_refresh(self):
+        inicio = dias_atras(1)
+        sessao = self.criar_sessao("corrida", inicio, duracao_seg=1800)
+        self.criar_metricas_corrida(sessao["id"], distancia_km="8.00")
+        mes = inicio.strftime("%Y-%m")
+
+        with override_settings(RELATORIOS_EMAILS={self.usuario.email.lower()}):
+            antes = self.cliente.get("/api/relatorios/modalidades/", {"mes_inicio": mes, "mes_fim": mes}).data
+            self.assertEqual(antes["linhas"], [])
+
+            self.assertIn("modalidades:", self.atualizar())
+            depois = self.cliente.get(
+                "/api/relatorios/modalidades/", {"mes_inicio": mes, "mes_fim": mes, "modalidade": "corrida"}
+            ).data
+        self.assertIsNotNone(depois["atualizado_em"])
+        linha, = depois["linhas"]
+        self.assertEqual(
+            (linha["usuarios_ativos"], linha["sessoes"], linha["duracao_total_seg"], float(linha["distancia_total_km"])),
+            (1, 1, 1800, 8.0),
+        )
+
+    def test_refresh_simultaneo_e_recusado(self):
+        alias = next(iter(settings.SHARDS))
+        outra = connections.create_connection(alias)
+        try:
+            with outra.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_lock(%s)", [relatorios._LOCK_REFRESH])
+            self.assertIsNone(relatorios.atualizar_visoes(alias=alias))
+            self.assertIn("em andamento", self.atualizar())
+        finally:
+            with outra.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [relatorios._LOCK_REFRESH])
+            outra.close()
+        self.assertEqual(set(relatorios.atualizar_visoes(alias=alias)), set(relatorios.VISOES))
@@ -0,0 +1,103 @@
+import json
+
+from core.tests.base import APITestCase, cliente_de, criar_usuario
+
+# Um grau de latitude no raio médio da Terra (rotas.RAIO_TERRA_M).
+METROS_POR_GRAU = 111_195.0
+
+
+def rota_para_o_norte(metros: int, velocidade: float = 2.5) -> list[list[float]]:
+    """Um ponto a cada 10 m, a `velocidade` m/s, subindo 1 m a cada 100 m."""
+    return [
+        [d / METROS_POR_GRAU, 0.0, d / 100, d / velocidade]
+        for d in range(0, metros + 1, 10)
+    ]
+
+
+class RotasTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.sessao = self.criar_sessao("corrida")
+        self.url = f"/api/sessoes-atividade/{self.sessao['id']}/rota/"
+
+    def test_resumo_parciais_e_polilinha(self):
+        resposta = self.cliente.put(self.url, {"pontos": rota_para_o_norte(3000)}, format="json")
+        self.assertEqual(resposta.status_code, 200, resposta.data)
+        self.assertAlmostEqual(resposta.data["distancia_m"], 3000, delta=1)
+        self.assertEqual(resposta.data["duracao_seg"], 1200)
+        self.assertEqual(resposta.data["parciais_seg_km"], [400, 400, 400])
+        self.assertAlmostEqual(resposta.data["ganho_elevacao_m"], 30, delta=2)
+
+        lida = self.cliente.get(self.url, {"zoom": 8}).data
+        self.assertTrue(lida["polilinha"])
+        pontos = self.cliente.get(self.url, {"pontos": 1}).data["pontos"]
+        self.assertEqual(len(pontos), 301)
+
+    def test_pontos_invalidos(self):
+        for pontos in ([[0, 0], [1]], [[0, 0], [91, 0]], [[0, 0, None, 5], [0, 0.001, None, 3]]):
+            resposta = self.cliente.put(self.url, {"pontos": pontos}, format="json")
+            self.assertEqual(resposta.status_code, 400, pontos)
+
+    def test_rotas_fisicamente_impossiveis(self):
+        serra = [[0.0, 0.0, 10_000.0 * (-1) ** i] for i in range(30)]
+        teletransporte = [[0.0, 0.0, None, 0], [0.01, 0.0, None, 1]]
+        volta_ao_mundo = [[0.0, 0.0], [10.0, 0.0]]
+        for pontos in (serra, teletransporte, volta_ao_mundo):
+            resposta = self.cliente.put(self.url, {"pontos": pontos}, format="json")
+            self.assertEqual(resposta.status_code, 400, pontos[:2])
+
+    def test_so_o_dono_acessa_e_exclusao(self):
+        self.cliente.put(self.url, {"pontos": rota_para_o_norte(100)}, format="json")
+        self.assertEqual(cliente_de(criar_usuario()).get(self.url).status_code, 404)
+        self.assertEqual(self.cliente.delete(self.url).status_code, 204)
+        self.assertEqual(self.cliente.get(self.url).status_code, 404)
+
+
+class SensoresTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.sessao = self.criar_sessao("corrida")
+        self.url = f"/api/sessoes-atividade/{self.sessao['id']}/sensores/"
+
+    def enviar(self, corpo: str, formato: str = "csv"):
+        return self.cliente.generic(
+            "POST", f"{self.url}?formato={formato}", corpo.encode(), content_type="text/plain"
+        )
+
+    def test_ingestao_resumo_e_serie_reduzida(self):
+        linhas = ["segundo,fc,cadencia"] + [f"{s},{120 + s % 40},{170 if s % 2 else ''}" for s in range(2000)]
+        resposta = self.enviar("\n".join(linhas) + "\n")
+        self.assertEqual(resposta.status_code, 200, resposta.data)
+        fc = resposta.data["canais"]["fc"]
+        self.assertEqual((fc["amostras"], fc["maxima"]), (2000, 159))
+        self.assertEqual(sum(fc["zonas_seg"]), 2000)
+        self.assertEqual(resposta.data["canais"]["cadencia"]["amostras"], 1000)
+
+        serie = self.cliente.get(self.url, {"canal": "fc", "pontos": 100}).data
+        self.assertEqual(len(serie["pontos"]), 100)
+        segundos = [p[0] for p in serie["pontos"]]
+        self.assertEqual((segundos[0], segundos[-1]), (0, 1999))
+        self.assertEqual(segundos, sorted(segundos))
+
+    def test_reenvio_sobrepoe_os_segundos(self):
+        self.enviar("segundo,potencia\n0,100\n1,100\n2,100\n")
+        corpo = "\n".join(json.dumps({"segundo": s, "potencia": 300}) for s in (1, 2))
+        resposta = self.enviar(corpo, "ndjson")
+        self.assertEqual(resposta.data["canais"]["potencia"]["amostras"], 3)
+        self.assertEqual(resposta.data["canais"]["potencia"]["maxima"], 300)
+
+    def test_fc_media_das_metricas_invalida_a_analise(self):
+        self.criar_metricas_corrida(self.sessao["id"])
+
+        def fc_medias():
+            semanal = self.cliente.get("/api/analise/corrida/").data["semanal"]
+            return [semana["fc_media"] for semana in semanal]
+
+        self.assertEqual(fc_medias(), [None])
+        self.enviar("segundo,fc\n0,140\n1,160\n")
+        self.assertEqual(fc_medias(), [150.0])
+
+    def test_amostras_invalidas(self):
+        for corpo in ("segundo,fc\n1,100\n0,100\n", "segundo,fc\n1,300\n", "segundo,fc\nx,100\n"):
+            self.assertEqual(self.enviar(corpo).status_code, 400, corpo)
+        self.assertEqual(self.cliente.get(self.url).status_code, 404)
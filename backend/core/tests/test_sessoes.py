@@ -0,0 +1,146 @@
+from unittest import mock
+
+from django.core.cache import cache
+
+from core import analise
+from core.models import SessaoAtividade
+from core.tests.base import APITestCase, cliente_de, criar_usuario, dias_atras, no_shard
+from core.views import SessaoAtividadeViewSet
+
+
+class SessoesTests(APITestCase):
+    def test_cria_e_lista(self):
+        sessao = self.criar_sessao()
+        resposta = self.cliente.get("/api/sessoes-atividade/")
+        self.assertEqual([s["id"] for s in resposta.data], [sessao["id"]])
+
+    def test_nao_enxerga_sessoes_de_outro_usuario(self):
+        outro = cliente_de(criar_usuario())
+        sessao = self.criar_sessao(cliente=outro)
+        self.assertEqual(self.cliente.get("/api/sessoes-atividade/").data, [])
+        self.assertEqual(self.cliente.get(f"/api/sessoes-atividade/{sessao['id']}/").status_code, 404)
+
+    def test_expand_inclui_metricas_e_series(self):
+        corrida = self.criar_sessao("corrida", dias_atras(2))
+        self.criar_metricas_corrida(corrida["id"])
+        musculacao = self.criar_sessao("musculacao", dias_atras(1))
+        self.cliente.post(
+            "/api/series-musculacao/",
+            {"sessao": musculacao["id"], "exercicio": 1, "ordem_serie": 1, "repeticoes": 10, "carga_kg": "50"},
+            format="json",
+        )
+        dados = {
+            s["id"]: s for s in self.cliente.get("/api/sessoes-atividade/?expand=metricas,series").data
+        }
+        self.assertEqual(dados[corrida["id"]]["metricas_corrida"]["distancia_km"], "5.00")
+        self.assertEqual(len(dados[musculacao["id"]]["series_musculacao"]), 1)
+
+    def test_excluir_em_lote_separa_bloqueadas(self):
+        livre = self.criar_sessao(inicio_em=dias_atras(3))
+        bloqueada = self.criar_sessao(inicio_em=dias_atras(2))
+        self.criar_metricas_corrida(bloqueada["id"])
+        resposta = self.cliente.post(
+            "/api/sessoes-atividade/excluir-em-lote/",
+            {"ids": [livre["id"], bloqueada["id"], 999999999]},
+            format="json",
+        )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["excluidas"], [livre["id"]])
+        self.assertEqual(resposta.data["bloqueadas"], [bloqueada["id"]])
+        self.assertEqual(resposta.data["nao_encontradas"], [999999999])
+
+    def test_multi_get_preserva_ordem_e_ignora_outros_usuarios(self):
+        a = self.criar_sessao(inicio_em=dias_atras(3))
+        b = self.criar_sessao(inicio_em=dias_atras(2))
+        alheia = self.criar_sessao(cliente=cliente_de(criar_usuario()))
+        resposta = self.cliente.get(f"/api/sessoes-atividade/?ids={b['id']},{a['id']},{alheia['id']}")
+        self.assertEqual([s["id"] for s in resposta.data["resultados"]], [b["id"], a["id"]])
+        self.assertEqual(resposta.data["nao_encontrados"], [alheia["id"]])
+        self.assertEqual(self.cliente.get("/api/sessoes-atividade/?ids=a").status_code, 400)
+
+    def test_idempotency_key_repete_a_resposta(self):
+        corpo = {"modalidade": "corrida", "inicio_em": dias_atras(1).isoformat()}
+        primeira = self.cliente.post(
+            "/api/sessoes-atividade/", corpo, format="json", HTTP_IDEMPOTENCY_KEY="k1"
+        )
+        segunda = self.cliente.post(
+            "/api/sessoes-atividade/", corpo, format="json", HTTP_IDEMPOTENCY_KEY="k1"
+        )
+        self.assertEqual(primeira.status_code, 201)
+        self.assertEqual(segunda.status_code, 201)
+        self.assertEqual(segunda.json()["id"], primeira.data["id"])
+        with no_shard(self.usuario):
+            self.assertEqual(SessaoAtividade.objects.filter(usuario=self.usuario).count(), 1)
+
+        outro_corpo = {**corpo, "duracao_seg": 60}
+        resposta = self.cliente.post(
+            "/api/sessoes-atividade/", outro_corpo, format="json", HTTP_IDEMPOTENCY_KEY="k1"
+        )
+        self.assertEqual(resposta.status_code, 422)
+
+    def test_idempotency_key_invalida_o_cache_depois_do_commit(self):
+        chave = analise._chave_versao(self.usuario.pk)
+        self.cliente.get("/api/analise/corrida/")
+        versao = cache.get(chave)
+
+        # A view roda dentro da transação da chave: a análise ainda não
+        # pode ter sido invalidada quando ela termina.
+        vistas = []
+        criar_em_lote = SessaoAtividadeViewSet.criar_em_lote
+
+        def criar_e_ler(view, serializers):
+            criar_em_lote(view, serializers)
+            vistas.append(cache.get(chave))
+
+        corpo = {"modalidade": "corrida", "inicio_em": dias_atras(1).isoformat()}
+        with mock.patch.object(SessaoAtividadeViewSet, "criar_em_lote", criar_e_ler):
+            resposta = self.cliente.post(
+                "/api/sessoes-atividade/", corpo, format="json", HTTP_IDEMPOTENCY_KEY="k2"
+            )
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(vistas, [versao])
+        self.assertNotEqual(cache.get(chave), versao)
+
+
+class LoteTests(APITestCase):
+    def test_lote_resolve_referencias(self):
+        operacoes = [
+            {"recurso": "sessoes-atividade", "acao": "criar", "ref": "s1",
+             "dados": {"modalidade": "musculacao", "inicio_em": dias_atras(1).isoformat()}},
+            {"recurso": "series-musculacao", "acao": "criar", "ref": "x",
+             "dados": {"sessao": "$s1", "exercicio": 1, "ordem_serie": 1, "repeticoes": 10, "carga_kg": "50"}},
+            {"recurso": "series-musculacao", "acao": "atualizar", "id": "$x", "dados": {"repeticoes": 9}},
+        ]
+        resposta = self.cliente.post("/api/batch/", {"operacoes": operacoes}, format="json")
+        self.assertEqual(resposta.status_code, 200, resposta.data)
+        serie = self.cliente.get(f"/api/series-musculacao/{resposta.data['refs']['x']}/").data
+        self.assertEqual(serie["sessao"], resposta.data["refs"]["s1"])
+        self.assertEqual(serie["repeticoes"], 9)
+
+    def test_lote_recusa_itens_repetidos_no_mesmo_insert(self):
+        operacoes = [
+            {"recurso": "sessoes-atividade", "acao": "criar", "ref": "s1",
+             "dados": {"modalidade": "musculacao", "inicio_em": dias_atras(1).isoformat()}},
+        ] + [
+            {"recurso": "series-musculacao", "acao": "criar",
+             "dados": {"sessao": "$s1", "exercicio": 1, "ordem_serie": ordem, "repeticoes": 10, "carga_kg": "50"}}
+            for ordem in (1, 2, 1)
+        ]
+        resposta = self.cliente.post("/api/batch/", {"operacoes": operacoes}, format="json")
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.data["operacao"], 3)
+        self.assertIn("ordem_serie", resposta.data["erros"])
+        with no_shard(self.usuario):
+            self.assertFalse(SessaoAtividade.objects.filter(usuario=self.usuario).exists())
+
+    def test_lote_com_erro_nao_grava_nada(self):
+        operacoes = [
+            {"recurso": "sessoes-atividade", "acao": "criar", "ref": "s1",
+             "dados": {"modalidade": "musculacao", "inicio_em": dias_atras(1).isoformat()}},
+            {"recurso": "series-musculacao", "acao": "criar",
+             "dados": {"sessao": "$s1", "exercicio": 1, "ordem_serie": 1, "repeticoes": -1}},
+        ]
+        resposta = self.cliente.post("/api/batch/", {"operacoes": operacoes}, format="json")
+        self.assertEqual(resposta.status_code, 400)
+        with no_shard(self.usuario):
+            self.assertFalse(SessaoAtividade.objects.filter(usuario=self.usuario).exists())
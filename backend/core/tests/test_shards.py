@@ -0,0 +1,79 @@
+import unittest
+import uuid
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core import shards
+from core.models import Exercicio, Usuario
+from core.tests.base import SENHA, APITestCase, consultar, dias_atras
+
+
+def contar(alias: str, sql: str, *params) -> int:
+    with connections[alias].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()[0]
+
+
+@unittest.skipUnless(shards.sharding_ativo(), "rode com SHARD_DATABASES para testar os shards")
+class ShardsTests(APITestCase):
+    def test_registro_atribui_shard_e_replica_o_usuario(self):
+        resposta = APIClient().post(
+            "/auth/register/",
+            {"nome": "S", "email": f"{uuid.uuid4().hex}@teste.com", "senha": SENHA},
+            format="json",
+        )
+        self.assertEqual(resposta.status_code, 201, resposta.data)
+        usuario = Usuario.objects.get(pk=resposta.data["user"]["id"])
+        self.assertIn(usuario.shard, settings.SHARDS)
+        self.assertEqual(usuario.shard, shards.anel().shard_para(usuario.pk))
+        self.assertEqual(contar(usuario.shard, "SELECT count(*) FROM usuarios WHERE id = %s", usuario.pk), 1)
+
+    def test_dados_ficam_no_shard_do_usuario(self):
+        sessao = self.criar_sessao()
+        self.assertEqual(
+            consultar(self.usuario, "SELECT count(*) FROM sessoes_atividade WHERE id = %s", [sessao["id"]]),
+            [(1,)],
+        )
+        self.assertEqual(
+            contar(shards.DIRETORIO, "SELECT count(*) FROM sessoes_atividade WHERE id = %s", sessao["id"]), 0
+        )
+
+    def test_mover_usuario_preserva_ids_e_limpa_a_origem(self):
+        sessao = self.criar_sessao(inicio_em=dias_atras(2))
+        self.criar_metricas_corrida(sessao["id"])
+        origem = shards.alias_do_usuario(self.usuario)
+        destino = next(alias for alias in settings.SHARDS if alias != origem)
+
+        copiadas = shards.mover_usuario(self.usuario, destino)
+
+        self.assertGreater(copiadas, 0)
+        self.assertEqual(Usuario.objects.get(pk=self.usuario.pk).shard, destino)
+        self.assertEqual(
+            contar(origem, "SELECT count(*) FROM sessoes_atividade WHERE usuario_id = %s", self.usuario.pk), 0
+        )
+        self.assertEqual(contar(origem, "SELECT count(*) FROM usuarios WHERE id = %s", self.usuario.pk), 0)
+        resposta = self.cliente.get("/api/sessoes-atividade/?expand=metricas")
+        self.assertEqual([s["id"] for s in resposta.data], [sessao["id"]])
+        self.assertEqual(resposta.data[0]["metricas_corrida"]["distancia_km"], "5.00")
+
+    def test_escrita_durante_migracao_recebe_503(self):
+        Usuario.objects.filter(pk=self.usuario.pk).update(shard_migrando_desde=timezone.now())
+        resposta = self.cliente.post(
+            "/api/sessoes-atividade/",
+            {"modalidade": "corrida", "inicio_em": dias_atras(1).isoformat()},
+            format="json",
+        )
+        self.assertEqual(resposta.status_code, 503)
+        self.assertIn("Retry-After", resposta)
+        self.assertEqual(self.cliente.get("/api/sessoes-atividade/").status_code, 200)
+
+    def test_catalogo_replicado_em_todos_os_shards(self):
+        exercicio = Exercicio.objects.create(nome="Exercício de teste", grupo_muscular="x")
+        for alias in settings.SHARDS:
+            self.assertEqual(contar(alias, "SELECT count(*) FROM exercicios WHERE id = %s", exercicio.pk), 1)
+        exercicio.delete()
+        for alias in settings.SHARDS:
+            self.assertEqual(contar(alias, "SELECT count(*) FROM exercicios WHERE id = %s", exercicio.pk), 0)
@@ -0,0 +1,96 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.utils import timezone
+
+from core import sync
+from core.tests.base import APITestCase, dias_atras
+
+
+@mock.patch.object(sync, "MARGEM", timedelta(0))
+class SyncTests(APITestCase):
+    def sincronizar(self, cursor=None, limite=None) -> tuple[list[dict], str]:
+        alteracoes = []
+        while True:
+            parametros = {k: v for k, v in {"cursor": cursor, "limite": limite}.items() if v}
+            resposta = self.cliente.get("/api/sync/", parametros)
+            self.assertEqual(resposta.status_code, 200, resposta.data)
+            alteracoes += resposta.data["alteracoes"]
+            cursor = resposta.data["cursor"]
+            if not resposta.data["mais"]:
+                return alteracoes, cursor
+
+    def test_paginas_entregam_tudo_uma_vez(self):
+        ids = [self.criar_sessao(inicio_em=dias_atras(d))["id"] for d in range(1, 6)]
+        self.criar_metricas_corrida(ids[0])
+        alteracoes, _ = self.sincronizar(limite=2)
+        self.assertEqual(
+            sorted((a["tipo"], a["id"]) for a in alteracoes),
+            sorted([("sessao", i) for i in ids] + [("metricas_corrida", ids[0])]),
+        )
+
+    def test_cursor_traz_so_o_delta_e_as_lapides(self):
+        sessao = self.criar_sessao()
+        self.criar_metricas_corrida(sessao["id"])
+        _, cursor = self.sincronizar()
+
+        self.cliente.patch(f"/api/sessoes-atividade/{sessao['id']}/", {"duracao_seg": 60}, format="json")
+        self.cliente.delete(f"/api/metricas-corrida/{sessao['id']}/")
+        alteracoes, cursor = self.sincronizar(cursor)
+
+        self.assertEqual(
+            [(a["tipo"], a["id"], a["excluido"]) for a in alteracoes],
+            [("sessao", sessao["id"], False), ("metricas_corrida", sessao["id"], True)],
+        )
+        self.assertEqual(alteracoes[0]["dados"]["duracao_seg"], 60)
+        self.assertEqual(self.sincronizar(cursor)[0], [])
+
+    def test_cursor_invalido_ou_expirado(self):
+        self.assertEqual(self.cliente.get("/api/sync/", {"cursor": "lixo"}).status_code, 400)
+        self.assertEqual(self.cliente.get("/api/sync/", {"limite": 0}).status_code, 400)
+        antigo = sync.codificar_cursor(timezone.now() - timedelta(days=3650), 0, 0)
+        self.assertEqual(self.cliente.get("/api/sync/", {"cursor": antigo}).status_code, 410)
+
+    def test_dados_no_mesmo_formato_do_rest(self):
+        corrida = self.criar_sessao("corrida", dias_atras(3), duracao_seg=1800, calorias=300)
+        self.criar_metricas_corrida(corrida["id"], distancia_km="10.00")
+        ciclismo = self.criar_sessao("ciclismo", dias_atras(2))
+        self.cliente.post(
+            "/api/metricas-ciclismo/",
+            {"sessao": ciclismo["id"], "distancia_km": "30", "velocidade_media_kmh": "25.5"},
+            format="json",
+        )
+        musculacao = self.criar_sessao("musculacao", dias_atras(1))
+        serie = self.cliente.post(
+            "/api/series-musculacao/",
+            {"sessao": musculacao["id"], "exercicio": 1, "ordem_serie": 1, "repeticoes": 10, "carga_kg": "40"},
+            format="json",
+        ).data
+        meta = self.cliente.post(
+            "/api/metas-habito/",
+            {"titulo": "x", "modalidade": "corrida", "data_inicio": dias_atras(5).date().isoformat(),
+             "distancia_meta_km": "20"},
+            format="json",
+        ).data
+        marcacao = self.cliente.post(
+            "/api/marcacoes-habito/",
+            {"meta": meta["id"], "data": dias_atras(3).date().isoformat(), "sessao": corrida["id"]},
+            format="json",
+        ).data
+
+        urls = {
+            ("sessao", corrida["id"]): f"/api/sessoes-atividade/{corrida['id']}/",
+            ("metricas_corrida", corrida["id"]): f"/api/metricas-corrida/{corrida['id']}/",
+            ("metricas_ciclismo", ciclismo["id"]): f"/api/metricas-ciclismo/{ciclismo['id']}/",
+            ("serie", serie["id"]): f"/api/series-musculacao/{serie['id']}/",
+            ("meta", meta["id"]): f"/api/metas-habito/{meta['id']}/",
+            ("marcacao", marcacao["id"]): f"/api/marcacoes-habito/{marcacao['id']}/",
+        }
+        # Compara o JSON das respostas: decimais como número e como string
+        # seriam iguais depois de convertidos.
+        corpo = self.cliente.get("/api/sync/").json()
+        alteracoes = {(a["tipo"], a["id"]): a["dados"] for a in corpo["alteracoes"]}
+        for chave, url in urls.items():
+            rest = self.cliente.get(url).json()
+            dados = alteracoes[chave]
+            self.assertEqual(dados, {campo: rest[campo] for campo in dados}, chave)
@@ -0,0 +1,227 @@
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from core import analise
+from core.tests.base import APITestCase, cliente_de, criar_usuario, dias_atras, drenar_outbox
+
+
+class AnaliseTendenciasTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        hoje = timezone.localdate()
+        self.segunda = hoje - timedelta(days=hoje.weekday() + 21)
+        self.parametros = {
+            "data_inicio": self.segunda.isoformat(),
+            "data_fim": (self.segunda + timedelta(days=13)).isoformat(),
+        }
+
+    def no_dia(self, dias: int):
+        return timezone.make_aware(datetime.combine(self.segunda + timedelta(days=dias), time(10)))
+
+    def corrida(self, dias: int, distancia: str, ritmo: int, **campos) -> None:
+        sessao = self.criar_sessao("corrida", self.no_dia(dias))
+        self.criar_metricas_corrida(sessao["id"], distancia_km=distancia, ritmo_medio_seg_km=ritmo, **campos)
+
+    def test_corrida_por_semana_media_movel_e_tendencia(self):
+        self.corrida(0, "5.00", 300, fc_media=150)
+        self.corrida(1, "5.00", 360, fc_media=160)
+        self.corrida(7, "10.00", 300)
+
+        dados = self.cliente.get("/api/analise/corrida/", self.parametros).data
+        primeira, segunda = dados["semanal"]
+        self.assertEqual(primeira["inicio"], self.segunda.isoformat())
+        # Ritmo ponderado pela distância.
+        self.assertEqual(
+            (primeira["sessoes"], primeira["distancia_km"], primeira["ritmo_medio_seg_km"], primeira["fc_media"]),
+            (2, 10.0, 330.0, 155.0),
+        )
+        self.assertIsNone(segunda["fc_media"])
+        self.assertEqual(segunda["distancia_km_media_4s"], 10.0)
+        self.assertEqual(segunda["ritmo_medio_seg_km_4s"], 315.0)
+        self.assertEqual(dados["tendencia"], {"distancia_km_por_semana": 0.0, "ritmo_medio_seg_km_por_semana": -30.0})
+        self.assertEqual(sum(m["distancia_km"] for m in dados["mensal"]), 20.0)
+
+        # Escritas de métricas trocam a versão do cache.
+        self.corrida(8, "10.00", 300)
+        dados = self.cliente.get("/api/analise/corrida/", self.parametros).data
+        self.assertEqual(dados["semanal"][1]["distancia_km"], 20.0)
+
+    def test_velocidade_do_ciclismo_pela_distancia_e_tempo_totais(self):
+        for dias, distancia, velocidade in ((0, "30", "30"), (2, "20", "10")):
+            sessao = self.criar_sessao("ciclismo", self.no_dia(dias))
+            self.cliente.post(
+                "/api/metricas-ciclismo/",
+                {"sessao": sessao["id"], "distancia_km": distancia, "velocidade_media_kmh": velocidade},
+                format="json",
+            )
+        semana = self.cliente.get("/api/analise/ciclismo/", self.parametros).data["semanal"][0]
+        self.assertEqual((semana["distancia_km"], semana["velocidade_media_kmh"]), (50.0, 16.67))
+
+    def test_sem_dados_e_data_invalida(self):
+        dados = self.cliente.get("/api/analise/corrida/").data
+        self.assertEqual((dados["semanal"], dados["mensal"]), ([], []))
+        self.assertEqual(self.cliente.get("/api/analise/corrida/", {"data_inicio": "x"}).status_code, 400)
+
+
+class RecordesTests(APITestCase):
+    def criar_serie(self, sessao_id: int, ordem: int, carga: str, repeticoes: int = 5) -> dict:
+        resposta = self.cliente.post(
+            "/api/series-musculacao/",
+            {"sessao": sessao_id, "exercicio": 1, "ordem_serie": ordem,
+             "repeticoes": repeticoes, "carga_kg": carga},
+            format="json",
+        )
+        self.assertEqual(resposta.status_code, 201, resposta.data)
+        return resposta.data
+
+    def test_recorde_acompanha_a_melhor_serie(self):
+        sessao = self.criar_sessao("musculacao", dias_atras(2))
+        leve = self.criar_serie(sessao["id"], 1, "50.00")
+        pesada = self.criar_serie(sessao["id"], 2, "80.00")
+        self.assertTrue(pesada["recorde_pessoal"])
+
+        recorde = self.cliente.get("/api/recordes-pessoais/1/").data
+        self.assertEqual((recorde["melhor_serie"], recorde["carga_kg"]), (pesada["id"], "80.00"))
+
+        self.cliente.delete(f"/api/series-musculacao/{pesada['id']}/")
+        drenar_outbox()
+        recorde = self.cliente.get("/api/recordes-pessoais/1/").data
+        self.assertEqual((recorde["melhor_serie"], recorde["carga_kg"]), (leve["id"], "50.00"))
+
+
+class HistoricoExercicioTests(APITestCase):
+    url = "/api/exercicios/1/historico/"
+
+    def treino(self, dias: int, cargas: list[str], cliente=None) -> dict:
+        sessao = self.criar_sessao("musculacao", dias_atras(dias), cliente=cliente)
+        for ordem, carga in enumerate(cargas, 1):
+            (cliente or self.cliente).post(
+                "/api/series-musculacao/",
+                {"sessao": sessao["id"], "exercicio": 1, "ordem_serie": ordem, "repeticoes": 8, "carga_kg": carga},
+                format="json",
+            )
+        return sessao
+
+    def test_ultimas_series_do_usuario(self):
+        antigo = self.treino(5, ["40.00", "45.00"])
+        recente = self.treino(2, ["50.00"])
+        self.treino(1, ["99.00"], cliente=cliente_de(criar_usuario()))
+
+        series = self.cliente.get(self.url).data["series"]
+        self.assertEqual(
+            [(s["sessao_id"], s["carga_kg"]) for s in series],
+            [(recente["id"], 50), (antigo["id"], 40), (antigo["id"], 45)],
+        )
+        self.assertEqual(len(self.cliente.get(self.url, {"limite": 2}).data["series"]), 2)
+
+        # Mudar o início da sessão atualiza a cópia guardada nas séries.
+        self.cliente.patch(
+            f"/api/sessoes-atividade/{antigo['id']}/", {"inicio_em": dias_atras(0).isoformat()}, format="json"
+        )
+        self.assertEqual(self.cliente.get(self.url).data["series"][0]["sessao_id"], antigo["id"])
+
+    def test_limite_invalido(self):
+        for limite in ("x", 0, 101):
+            self.assertEqual(self.cliente.get(self.url, {"limite": limite}).status_code, 400)
+
+
+class MelhoresEsforcosTests(APITestCase):
+    def test_melhor_ritmo_por_distancia(self):
+        lenta = self.criar_sessao(inicio_em=dias_atras(3))
+        self.criar_metricas_corrida(lenta["id"], distancia_km="10.00", ritmo_medio_seg_km=330)
+        rapida = self.criar_sessao(inicio_em=dias_atras(2))
+        self.criar_metricas_corrida(rapida["id"], distancia_km="5.00", ritmo_medio_seg_km=280)
+
+        esforcos = {e["distancia_alvo"]: e for e in self.cliente.get("/api/melhores-esforcos/").data}
+        self.assertEqual(esforcos["5k"]["sessao"], rapida["id"])
+        self.assertEqual(esforcos["10k"]["sessao"], lenta["id"])
+
+        # Piorar o ritmo do detentor agenda o recálculo no worker.
+        self.cliente.patch(f"/api/metricas-corrida/{rapida['id']}/", {"ritmo_medio_seg_km": 400}, format="json")
+        drenar_outbox()
+        esforcos = {e["distancia_alvo"]: e for e in self.cliente.get("/api/melhores-esforcos/").data}
+        self.assertEqual(esforcos["5k"]["sessao"], lenta["id"])
+
+
+class CaloriasTests(APITestCase):
+    def calorias(self, sessao_id: int):
+        return self.cliente.get(f"/api/sessoes-atividade/{sessao_id}/").data["calorias"]
+
+    def test_estimativa_pelo_met_e_pelo_peso(self):
+        sessao = self.criar_sessao("corrida", duracao_seg=3600)
+        self.assertTrue(sessao["calorias_estimadas"])
+        sem_metricas = self.calorias(sessao["id"])
+        self.assertGreater(sem_metricas, 0)
+
+        self.criar_metricas_corrida(sessao["id"], distancia_km="12.00", ritmo_medio_seg_km=300)
+        drenar_outbox()
+        com_ritmo = self.calorias(sessao["id"])
+        self.assertGreater(com_ritmo, sem_metricas)
+
+        self.cliente.patch("/auth/me/", {"peso_kg": "140.0"}, format="json")
+        drenar_outbox()
+        self.assertAlmostEqual(self.calorias(sessao["id"]) / com_ritmo, 2, delta=0.05)
+
+    def test_valor_informado_prevalece(self):
+        sessao = self.criar_sessao("ciclismo", duracao_seg=3600, calorias=999)
+        self.assertFalse(sessao["calorias_estimadas"])
+        drenar_outbox()
+        self.assertEqual(self.calorias(sessao["id"]), 999)
+
+
+class AnaliseVolumeTests(APITestCase):
+    def test_volume_por_grupo_e_invalidacao_da_semana(self):
+        inicio = dias_atras(14)
+        sessao = self.criar_sessao("musculacao", inicio)
+        self.cliente.post(
+            "/api/series-musculacao/",
+            {"sessao": sessao["id"], "exercicio": 1, "ordem_serie": 1, "repeticoes": 10, "carga_kg": "50"},
+            format="json",
+        )
+        parametros = {"data_inicio": inicio.date().isoformat(), "data_fim": inicio.date().isoformat()}
+
+        semana = self.cliente.get("/api/analise/volume/", parametros).data["semanas"][0]
+        self.assertEqual(sum(g["volume_kg"] for g in semana["grupos"]), 500.0)
+
+        self.cliente.post(
+            "/api/series-musculacao/",
+            {"sessao": sessao["id"], "exercicio": 1, "ordem_serie": 2, "repeticoes": 10, "carga_kg": "30"},
+            format="json",
+        )
+        semana = self.cliente.get("/api/analise/volume/", parametros).data["semanas"][0]
+        self.assertEqual(sum(g["volume_kg"] for g in semana["grupos"]), 800.0)
+
+    def test_versao_descartada_nao_reaproveita_semanas_antigas(self):
+        inicio = dias_atras(14)
+        parametros = {"data_inicio": inicio.date().isoformat(), "data_fim": inicio.date().isoformat()}
+        self.assertEqual(self.cliente.get("/api/analise/volume/", parametros).data["semanas"][0]["grupos"], [])
+
+        # A importação troca a versão inteira (sem apagar as semanas antigas).
+        registro = {
+            "modalidade": "musculacao", "inicio_em": inicio.isoformat(),
+            "series": [{"exercicio": 1, "ordem_serie": 1, "repeticoes": 10, "carga_kg": "50"}],
+        }
+        self.cliente.post("/api/importacao/", data=json.dumps(registro), content_type="application/x-ndjson")
+        self.cliente.get("/api/analise/volume/", parametros)
+
+        # Sem a chave de versão (descartada pelo cache), as semanas da
+        # versão anterior não podem voltar a valer.
+        cache.delete(analise._chave_volume_versao(self.usuario.pk))
+        semana = self.cliente.get("/api/analise/volume/", parametros).data["semanas"][0]
+        self.assertEqual(sum(g["volume_kg"] for g in semana["grupos"]), 500.0)
+
+    def test_intervalo_limitado(self):
+        fim = dias_atras(0).date()
+        inicio = fim - timedelta(weeks=analise.SEMANAS_MAXIMO_VOLUME - 1)
+        resposta = self.cliente.get(
+            "/api/analise/volume/", {"data_inicio": inicio.isoformat(), "data_fim": fim.isoformat()}
+        )
+        self.assertEqual(len(resposta.data["semanas"]), analise.SEMANAS_MAXIMO_VOLUME)
+        resposta = self.cliente.get(
+            "/api/analise/volume/",
+            {"data_inicio": (inicio - timedelta(weeks=1)).isoformat(), "data_fim": fim.isoformat()},
+        )
+        self.assertEqual(resposta.status_code, 400)
@@ -0,0 +1,253 @@
+"""
+Throttling por token bucket para os endpoints de autenticação.
+
+Os buckets ficam num arquivo mapeado em memória (por padrão em /dev/shm),
+compartilhado por todos os workers do mesmo host, sem depender de Redis.
+Cada slot guarda o estado do bucket e os contadores de requisições aceitas
+e rejeitadas, que podem ser consultados com `manage.py throttle_stats`.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Iterator, Optional
+
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+_MAGIC = b"HBTBKT01"
+_HEADER = struct.Struct("<8sI")
+# digest da chave, escopo, tokens, atualizado_em, aceitas, rejeitadas
+_SLOT = struct.Struct("<16s16sddQQ")
+_EMPTY_DIGEST = b"\0" * 16
+_MAX_PROBES = 8
+
+
+def _default_path() -> str:
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "api_habitos_throttle")
+
+
+class SharedBucketStore:
+    """
+    Tabela hash de tamanho fixo com endereçamento aberto sobre um mmap.
+
+    O acesso é serializado com flock (entre processos) e um lock de thread
+    (o flock não exclui threads que compartilham o mesmo descritor).
+    Quando não há slot livre nas sondagens, o bucket atualizado há mais
+    tempo é reaproveitado.
+    """
+
+    def __init__(self, path: str, slots: int):
+        self.path = path
+        self.slots = slots
+        self.size = _HEADER.size + slots * _SLOT.size
+        self._thread_lock = threading.Lock()
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, _HEADER.size, 0)
+                valid = (
+                    len(header) == _HEADER.size
+                    and _HEADER.unpack(header) == (_MAGIC, slots)
+                    and os.fstat(fd).st_size == self.size
+                )
+                if not valid:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self.size)
+                    os.pwrite(fd, _HEADER.pack(_MAGIC, slots), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._mm = mmap.mmap(fd, self.size)
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def _offset(self, index: int) -> int:
+        return _HEADER.size + index * _SLOT.size
+
+    def _find_slot(self, digest: bytes) -> int:
+        start = int.from_bytes(digest[:8], "little") % self.slots
+        empty = None
+        oldest, oldest_ts = start, float("inf")
+
+        for i in range(min(_MAX_PROBES, self.slots)):
+            index = (start + i) % self.slots
+            slot_digest, _, _, updated, _, _ = _SLOT.unpack_from(
+                self._mm, self._offset(index)
+            )
+            if slot_digest == digest:
+                return index
+            if slot_digest == _EMPTY_DIGEST:
+                if empty is None:
+                    empty = index
+            elif updated < oldest_ts:
+                oldest, oldest_ts = index, updated
+
+        return empty if empty is not None else oldest
+
+    def consume(
+        self,
+        scope: str,
+        key: str,
+        capacity: int,
+        refill_per_sec: float,
+        now: Optional[float] = None,
+    ) -> tuple[bool, float]:
+        """
+        Tenta retirar um token do bucket (scope, key).
+        Retorna (aceita, segundos até o próximo token).
+        """
+        now = time.time() if now is None else now
+        digest = hashlib.blake2b(
+            f"{scope}:{key}".encode("utf-8"), digest_size=16
+        ).digest()
+        scope_bytes = scope.encode("utf-8")[:16]
+
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                index = self._find_slot(digest)
+                offset = self._offset(index)
+                slot_digest, _, tokens, updated, aceitas, rejeitadas = (
+                    _SLOT.unpack_from(self._mm, offset)
+                )
+
+                if slot_digest != digest:
+                    tokens, aceitas, rejeitadas = float(capacity), 0, 0
+                else:
+                    elapsed = max(0.0, now - updated)
+                    tokens = min(float(capacity), tokens + elapsed * refill_per_sec)
+
+                if tokens >= 1.0:
+                    tokens -= 1.0
+                    aceitas += 1
+                    allowed, wait = True, 0.0
+                else:
+                    rejeitadas += 1
+                    allowed, wait = False, (1.0 - tokens) / refill_per_sec
+
+                _SLOT.pack_into(
+                    self._mm, offset, digest, scope_bytes, tokens, now, aceitas, rejeitadas
+                )
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        return allowed, wait
+
+    def buckets(self) -> Iterator[dict]:
+        """Itera sobre os buckets ocupados (para inspeção/ops)."""
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            try:
+                raw = self._mm[_HEADER.size:]
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        for slot in _SLOT.iter_unpack(raw):
+            digest, scope, tokens, updated, aceitas, rejeitadas = slot
+            if digest == _EMPTY_DIGEST:
+                continue
+            yield {
+                "bucket": digest.hex(),
+                "escopo": scope.rstrip(b"\0").decode("utf-8", "replace"),
+                "tokens": tokens,
+                "atualizado_em": updated,
+                "aceitas": aceitas,
+                "rejeitadas": rejeitadas,
+            }
+
+
+_store: Optional[SharedBucketStore] = None
+_store_pid: Optional[int] = None
+
+
+def get_store() -> SharedBucketStore:
+    """
+    Abre o store uma vez por processo (o mmap não deve ser herdado
+    por workers criados via fork após o import).
+    """
+    global _store, _store_pid
+
+    pid = os.getpid()
+    if _store is None or _store_pid != pid:
+        path = getattr(settings, "THROTTLE_SHM_PATH", None) or _default_path()
+        slots = getattr(settings, "THROTTLE_SHM_SLOTS", 8192)
+        _store = SharedBucketStore(path, slots)
+        _store_pid = pid
+    return _store
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Usa a taxa "N/período" do DRF como capacidade N do bucket,
+    reabastecido continuamente a N/período tokens por segundo.
+    Não toca no banco nem no cache do Django.
+    """
+
+    _wait = 0.0
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        capacity = self.num_requests
+        allowed, self._wait = get_store().consume(
+            self.scope, self.key, capacity, capacity / self.duration
+        )
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class AuthIPThrottle(TokenBucketThrottle):
+    scope = "auth_ip"
+
+    def get_cache_key(self, request, view):
+        return self.get_ident(request)
+
+
+def _email(request) -> Optional[str]:
+    data = request.data
+    email = data.get("email") if hasattr(data, "get") else None
+    if not isinstance(email, str) or not email.strip():
+        return None
+    return email.strip().lower()
+
+
+class AuthEmailThrottle(TokenBucketThrottle):
+    """
+    Tentativas por e-mail a partir de cada IP. A chave inclui o IP para
+    que um atacante não esgote depressa o bucket da vítima; o limite da
+    conta entre IPs fica com o AuthContaThrottle, mais folgado.
+    """
+    scope = "auth_email"
+
+    def get_cache_key(self, request, view):
+        email = _email(request)
+        return None if email is None else f"{email}|{self.get_ident(request)}"
+
+
+class AuthContaThrottle(TokenBucketThrottle):
+    """
+    Tentativas por e-mail somadas entre todos os IPs: segura a força bruta
+    contra uma conta a partir de IPs rotativos. A taxa é mais folgada que a
+    do AuthEmailThrottle, porque quem esgota este bucket bloqueia também o
+    dono da conta até ele reabastecer.
+    """
+    scope = "auth_conta"
+
+    def get_cache_key(self, request, view):
+        return _email(request)
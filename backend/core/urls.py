@@ -9,6 +9,8 @@ from .views import (
     MetricasCorridaViewSet,
     MetricasCiclismoViewSet,
     SerieMusculacaoViewSet,
+    RecordePessoalViewSet,
+    MelhorEsforcoCorridaViewSet,
     MetaHabitoViewSet,
     MarcacaoHabitoViewSet,
     RegisterView,
@@ -16,6 +18,16 @@ from .views import (
     ChangePasswordView,
     MeView,
     RefreshTokenView,
+    ImportacaoHistoricoView,
+    ExportacaoHistoricoView,
+    AnaliseTendenciaView,
+    AnaliseVolumeView,
+    HeatmapView,
+    RankingSemanalView,
+    RelatorioMensalView,
+    OutboxMetricasView,
+    SyncView,
+    LoteView,
 )
 
 router = DefaultRouter()
@@ -25,6 +37,8 @@ router.register(r"sessoes-atividade", SessaoAtividadeViewSet, basename="sessao-a
 router.register(r"metricas-corrida", MetricasCorridaViewSet, basename="metricas-corrida")
 router.register(r"metricas-ciclismo", MetricasCiclismoViewSet, basename="metricas-ciclismo")
 router.register(r"series-musculacao", SerieMusculacaoViewSet, basename="series-musculacao")
+router.register(r"recordes-pessoais", RecordePessoalViewSet, basename="recorde-pessoal")
+router.register(r"melhores-esforcos", MelhorEsforcoCorridaViewSet, basename="melhor-esforco")
 router.register(r"metas-habito", MetaHabitoViewSet, basename="meta-habito")
 router.register(r"marcacoes-habito", MarcacaoHabitoViewSet, basename="marcacao-habito")
 
@@ -35,5 +49,37 @@ urlpatterns = [
     path("auth/me/", MeView.as_view(), name="auth-me"),
     path("auth/change-password/", ChangePasswordView.as_view(), name="change-password"),
     path("auth/refresh/", RefreshTokenView.as_view(), name="auth-refresh"),
+    path("api/importacao/", ImportacaoHistoricoView.as_view(), name="importacao-historico"),
+    path("api/exportacao/", ExportacaoHistoricoView.as_view(), name="exportacao-historico"),
+    path(
+        "api/analise/corrida/",
+        AnaliseTendenciaView.as_view(modalidade="corrida"),
+        name="analise-corrida",
+    ),
+    path(
+        "api/analise/ciclismo/",
+        AnaliseTendenciaView.as_view(modalidade="ciclismo"),
+        name="analise-ciclismo",
+    ),
+    path("api/analise/volume/", AnaliseVolumeView.as_view(), name="analise-volume"),
+    path("api/heatmap/", HeatmapView.as_view(), name="heatmap"),
+    path(
+        "api/relatorios/modalidades/",
+        RelatorioMensalView.as_view(relatorio="modalidades"),
+        name="relatorio-modalidades",
+    ),
+    path(
+        "api/relatorios/habitos/",
+        RelatorioMensalView.as_view(relatorio="habitos"),
+        name="relatorio-habitos",
+    ),
+    path("api/outbox/metricas/", OutboxMetricasView.as_view(), name="outbox-metricas"),
+    path("api/sync/", SyncView.as_view(), name="sync"),
+    path("api/batch/", LoteView.as_view(), name="batch"),
+    path(
+        "api/rankings/<str:categoria>/",
+        RankingSemanalView.as_view(),
+        name="ranking-semanal",
+    ),
     path("api/", include(router.urls)),
 ]
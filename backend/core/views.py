@@ -1,6 +1,11 @@
 from typing import Any, cast
 
-from django.http import JsonResponse
+from django.contrib.postgres.fields import ArrayField
+from django.db import IntegrityError
+from django.db.models import (
+    BigIntegerField, BooleanField, Exists, ExpressionWrapper, F, Func, OuterRef, Prefetch, Value,
+)
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.utils.dateparse import parse_date
 from django.utils import timezone
 from rest_framework import viewsets, filters, status, permissions
@@ -12,10 +17,40 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 
 from datetime import datetime, timedelta
+from decimal import Decimal
 import jwt
 from django.conf import settings
 
+from .analise import (
+    CONFIG_MODALIDADE,
+    SEMANAS_MAXIMO_VOLUME,
+    SEMANAS_PADRAO_VOLUME,
+    inicio_da_semana,
+    invalidar_analise,
+    invalidar_volume_semana,
+    tendencias_em_cache,
+    volume_semanal,
+)
 from .authentication import create_jwt_for_user
+from .recordes import registrar_serie, detem_recorde
+from . import esforcos
+from . import recordes
+from . import outbox
+from . import calorias
+from . import exclusao
+from . import heatmap
+from . import idempotencia
+from . import marcacoes
+from . import sync
+from .heatmap import heatmap_anual, invalidar_heatmap
+from . import rankings
+from . import relatorios
+from . import rotas
+from . import sensores
+from . import shards
+from .importacao import FORMATOS, ler_registros, importar_historico
+from .exportacao import FORMATOS as FORMATOS_EXPORTACAO, exportar_historico
+from .throttling import AuthContaThrottle, AuthEmailThrottle, AuthIPThrottle
 from .models import (
     Usuario,
     Exercicio,
@@ -25,12 +60,17 @@ from .models import (
     SerieMusculacao,
     MetaHabito,
     MarcacaoHabito,
+    RecordePessoal,
+    MelhorEsforcoCorrida,
+    ModalidadeChoices,
 )
 from .serializers import (
     UsuarioSerializer,
+    PerfilSerializer,
     ChangePasswordSerializer,
     ExercicioSerializer,
     SessaoAtividadeSerializer,
+    SessaoAtividadeDetalheSerializer,
     MetricasCorridaSerializer,
     MetricasCiclismoSerializer,
     SerieMusculacaoSerializer,
@@ -39,10 +79,19 @@ from .serializers import (
     RegisterSerializer,
     LoginSerializer,
     UsuarioUpdateSerializer,
+    RecordePessoalSerializer,
+    MelhorEsforcoCorridaSerializer,
 )
 
 REFRESH_TOKEN_LIFETIME_DAYS = 7
 
+EXPAND_SESSAO_OPCOES = {"metricas", "series"}
+LIMITE_EXCLUSAO_EM_LOTE = 1000
+LIMITE_HISTORICO_PADRAO = 10
+LIMITE_HISTORICO_MAXIMO = 100
+LIMITE_IDS_MULTI_GET = 200
+ANO_MINIMO_HEATMAP = 2000
+
 
 def create_refresh_token(user: Usuario) -> str:
     now = datetime.now()
@@ -78,13 +127,117 @@ def decode_refresh_token(refresh_token: str) -> Usuario:
         raise ValidationError("Refresh token sem usuário associado.")
 
     try:
-        user = Usuario.objects.get(pk=int(user_id))
+        user = Usuario.objects.get(pk=int(user_id), excluido_em__isnull=True)
     except Usuario.DoesNotExist:
         raise ValidationError("Usuário não encontrado para este refresh token.")
 
     return user
 
 
+def anotar_dependencias_sessao(qs):
+    """
+    Anota `tem_dependencias` com um único EXISTS combinado (métricas,
+    séries ou marcações), avaliado na mesma query que busca as sessões.
+    """
+    dependencias = (
+        Exists(MetricasCorrida.objects.filter(sessao=OuterRef("pk")))
+        | Exists(MetricasCiclismo.objects.filter(sessao=OuterRef("pk")))
+        | Exists(SerieMusculacao.objects.filter(sessao=OuterRef("pk")))
+        | Exists(MarcacaoHabito.objects.filter(sessao=OuterRef("pk")))
+    )
+    return qs.annotate(
+        tem_dependencias=ExpressionWrapper(dependencias, output_field=BooleanField())
+    )
+
+
+def excluir_sessoes(usuario: Usuario, ids: list[int]) -> int:
+    """
+    Exclui as sessões em um único DELETE, sem passar pelo Collector do
+    Django (que consultaria cada tabela dependente). Só deve receber ids
+    já verificados como sem dependências.
+    """
+    if not ids:
+        return 0
+    with shards.transacao(), shards.conexao().cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM sessoes_atividade WHERE usuario_id = %s AND id = ANY(%s) "
+            "RETURNING inicio_em",
+            [usuario.id, list(ids)],
+        )
+        inicios = [row[0] for row in cursor.fetchall()]
+        rankings.agendar(usuario, inicios)
+    invalidar_analise(usuario.id)
+    invalidar_heatmap(usuario.id, inicios)
+    return len(inicios)
+
+
+class IgualAQualquer(Func):
+    """`coluna = ANY(%s)`: a lista inteira vai como um único parâmetro (array)."""
+    template = "%(expressions)s)"
+    arg_joiner = " = ANY("
+    output_field = BooleanField()
+
+    def __init__(self, campo: str, valores: list[int]):
+        super().__init__(
+            F(campo), Value(valores, output_field=ArrayField(BigIntegerField()))
+        )
+
+
+class MultiGetMixin:
+    """
+    GET na listagem com ?ids=1,2,3 (até LIMITE_IDS_MULTI_GET): devolve só
+    esses itens do usuário, na ordem pedida, em uma query, e lista em
+    `nao_encontrados` os ids inexistentes ou de outro usuário.
+    """
+
+    def list(self, request, *args, **kwargs):
+        bruto = request.query_params.get("ids")
+        if bruto is None:
+            return super().list(request, *args, **kwargs)
+
+        try:
+            ids = list(dict.fromkeys(int(i) for i in bruto.split(",") if i.strip()))
+        except ValueError:
+            raise ValidationError({"ids": "Todos os ids devem ser números inteiros."})
+        if not ids:
+            raise ValidationError({"ids": "Informe ao menos um id."})
+        if len(ids) > LIMITE_IDS_MULTI_GET:
+            raise ValidationError(
+                {"ids": f"Informe no máximo {LIMITE_IDS_MULTI_GET} ids por requisição."}
+            )
+
+        encontrados = {
+            obj.pk: obj
+            for obj in self.get_queryset().filter(IgualAQualquer("pk", ids)).order_by()
+        }
+        serializer = self.get_serializer(
+            [encontrados[i] for i in ids if i in encontrados], many=True
+        )
+        return Response(
+            {
+                "resultados": serializer.data,
+                "nao_encontrados": [i for i in ids if i not in encontrados],
+            }
+        )
+
+
+class PodeVerRelatorios(permissions.BasePermission):
+    """Libera os relatórios só para os e-mails em settings.RELATORIOS_EMAILS."""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(
+            user and user.is_authenticated
+            and user.email.lower() in settings.RELATORIOS_EMAILS
+        )
+
+
+def _parse_mes(valor: str, campo: str):
+    try:
+        return datetime.strptime(valor, "%Y-%m").date()
+    except ValueError:
+        raise ValidationError({campo: "Mês inválido. Use o formato AAAA-MM."})
+
 
 def healthz(request):
     """
@@ -99,6 +252,8 @@ class RegisterView(APIView):
     POST /auth/register/
     """
     permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    throttle_classes = [AuthIPThrottle, AuthEmailThrottle, AuthContaThrottle]
 
     def post(self, request: Request) -> Response:
         serializer = RegisterSerializer(data=request.data)
@@ -109,7 +264,7 @@ class RegisterView(APIView):
         refresh_token = create_refresh_token(user)
 
         data = {
-            "user": UsuarioSerializer(user).data,
+            "user": PerfilSerializer(user).data,
             "access_token": access_token,
             "refresh_token": refresh_token,
         }
@@ -123,6 +278,8 @@ class LoginView(APIView):
     POST /auth/login/
     """
     permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    throttle_classes = [AuthIPThrottle, AuthEmailThrottle, AuthContaThrottle]
 
     def post(self, request: Request) -> Response:
         serializer = LoginSerializer(data=request.data)
@@ -139,7 +296,7 @@ class LoginView(APIView):
         refresh_token = create_refresh_token(user)
 
         data = {
-            "user": UsuarioSerializer(user).data,
+            "user": PerfilSerializer(user).data,
             "access_token": access_token,
             "refresh_token": refresh_token,
         }
@@ -148,6 +305,8 @@ class LoginView(APIView):
 class RefreshTokenView(APIView):
 
     permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    throttle_classes = [AuthIPThrottle]
 
     def post(self, request: Request) -> Response:
         refresh_token = request.data.get("refresh_token")
@@ -180,8 +339,12 @@ class ChangePasswordView(APIView):
             }
             return Response(response_data, status=status.HTTP_200_OK)
 
-class UsuarioViewSet(viewsets.ModelViewSet):
-    queryset = Usuario.objects.all().order_by("id")
+class UsuarioViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Consulta de usuários. Cada um altera ou exclui só a própria conta, em
+    /auth/me/ (que também atualiza rankings e calorias).
+    """
+    queryset = Usuario.objects.filter(excluido_em__isnull=True).order_by("id")
     serializer_class = UsuarioSerializer
     filter_backends = [filters.SearchFilter]
     search_fields = ["nome", "email"]
@@ -194,17 +357,112 @@ class ExercicioViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter]
     search_fields = ["nome", "grupo_muscular", "equipamento"]
 
+    @action(detail=True, methods=["get"])
+    def historico(self, request, pk=None):
+        """
+        Últimas séries do usuário neste exercício (?limite=, padrão 10).
+        Lê só o índice (usuario_id, exercicio_id, inicio_em DESC), sem
+        join com as sessões.
+        """
+        exercicio = self.get_object()
+        try:
+            limite = int(request.query_params.get("limite", LIMITE_HISTORICO_PADRAO))
+        except ValueError:
+            raise ValidationError({"limite": "Informe um número inteiro."})
+        if not 1 <= limite <= LIMITE_HISTORICO_MAXIMO:
+            raise ValidationError(
+                {"limite": f"Use um valor entre 1 e {LIMITE_HISTORICO_MAXIMO}."}
+            )
 
-class SessaoAtividadeViewSet(viewsets.ModelViewSet):
+        series = (
+            SerieMusculacao.objects
+            .filter(usuario=request.user, exercicio=exercicio)
+            .order_by("-inicio_em", "ordem_serie")
+            .values("id", "sessao_id", "inicio_em", "ordem_serie", "repeticoes", "carga_kg")
+            [:limite]
+        )
+        return Response({"exercicio": exercicio.id, "series": list(series)})
+
+
+class IdempotenteMixin:
+    """POST de criação com suporte a Idempotency-Key (core/idempotencia.py)."""
+
+    def create(self, request, *args, **kwargs):
+        return idempotencia.executar(
+            request, lambda: super(IdempotenteMixin, self).create(request, *args, **kwargs)
+        )
+
+
+class SessaoAtividadeViewSet(IdempotenteMixin, MultiGetMixin, viewsets.ModelViewSet):
+    """
+    Suporta ?expand=metricas,series em list/retrieve para devolver a sessão
+    já com métricas (select_related) e séries (prefetch_related), sem N+1,
+    e ?ids=1,2,3 na listagem (MultiGetMixin).
+    """
     serializer_class = SessaoAtividadeSerializer
     filter_backends = [filters.SearchFilter]
     search_fields = ["modalidade", "observacoes"]
 
+    def get_expand(self) -> set[str]:
+        if self.action not in {"list", "retrieve"}:
+            return set()
+
+        request = cast(Request, self.request)
+        raw = request.query_params.get("expand", "")
+        expand = {item.strip() for item in raw.split(",") if item.strip()}
+
+        invalidos = expand - EXPAND_SESSAO_OPCOES
+        if invalidos:
+            raise ValidationError(
+                {"expand": f"Opções inválidas: {', '.join(sorted(invalidos))}. "
+                           "Use metricas e/ou series."}
+            )
+        return expand
+
+    def get_serializer_class(self):
+        if self.get_expand():
+            return SessaoAtividadeDetalheSerializer
+        return SessaoAtividadeSerializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["expand"] = self.get_expand()
+        return context
+
     def perform_create(self, serializer):
-        serializer.save(usuario=self.request.user)
+        self.criar_em_lote([serializer])
+
+    def criar_em_lote(self, serializers):
+        """Grava as sessões validadas com um único INSERT (também usado pelo POST /api/batch/)."""
+        usuario = self.request.user
+        sessoes = [SessaoAtividade(**s.validated_data, usuario=usuario) for s in serializers]
+        calorias.estimar_sessoes(sessoes, usuario.peso_kg)
+        with shards.transacao():
+            sessoes = SessaoAtividade.objects.bulk_create(sessoes)
+            rankings.agendar(usuario, [sessao.inicio_em for sessao in sessoes])
+            marcacoes.marcar_sessoes(usuario.id, sessoes)
+        for serializer, sessao in zip(serializers, sessoes):
+            serializer.instance = sessao
+        invalidar_analise(usuario.id)
+        invalidar_heatmap(usuario.id, [sessao.inicio_em for sessao in sessoes])
          
     def perform_update(self, serializer):
-        serializer.save(usuario=self.request.user)
+        inicio_anterior = serializer.instance.inicio_em
+        # Métricas, séries e marcações acompanham inicio_em pela FK composta
+        # (ON UPDATE CASCADE).
+        extra = {}
+        if "calorias" in serializer.validated_data:
+            # Valor informado pelo app (ou apagado, para voltar à estimativa).
+            extra["calorias_estimadas"] = False
+        with shards.transacao():
+            sessao = serializer.save(usuario=self.request.user, **extra)
+            rankings.agendar(self.request.user, [inicio_anterior, sessao.inicio_em])
+            if sessao.calorias is None or sessao.calorias_estimadas:
+                calorias.agendar(self.request.user.id, [sessao.id])
+        invalidar_analise(self.request.user.id)
+        invalidar_heatmap(self.request.user.id, [inicio_anterior, sessao.inicio_em])
+        invalidar_volume_semana(self.request.user.id, inicio_anterior)
+        invalidar_volume_semana(self.request.user.id, sessao.inicio_em)
         
     def get_queryset(self):
         request = cast(Request, self.request)
@@ -238,6 +496,21 @@ class SessaoAtividadeViewSet(viewsets.ModelViewSet):
                 )
             qs = qs.filter(inicio_em__date__lte=data_fim)
 
+        expand = self.get_expand()
+        if "metricas" in expand:
+            qs = qs.select_related("metricas_corrida", "metricas_ciclismo")
+        if "series" in expand:
+            qs = qs.prefetch_related(
+                Prefetch(
+                    "series_musculacao",
+                    queryset=SerieMusculacao.objects.select_related("exercicio")
+                    .order_by("ordem_serie", "id"),
+                )
+            )
+
+        if self.action == "destroy":
+            qs = anotar_dependencias_sessao(qs)
+
         return qs
 
     def destroy(self, request, *args, **kwargs):
@@ -249,12 +522,7 @@ class SessaoAtividadeViewSet(viewsets.ModelViewSet):
         """
         instance = self.get_object()
 
-        tem_metricas_corrida = hasattr(instance, "metricas_corrida")
-        tem_metricas_ciclismo = hasattr(instance, "metricas_ciclismo")
-        tem_series = instance.series_musculacao.exists()
-        tem_marcacoes = instance.marcacoes.exists()
-
-        if tem_metricas_corrida or tem_metricas_ciclismo or tem_series or tem_marcacoes:
+        if instance.tem_dependencias:
             return Response(
                 {
                     "detail": (
@@ -265,16 +533,219 @@ class SessaoAtividadeViewSet(viewsets.ModelViewSet):
                 },
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        self.perform_destroy(instance)
+        excluir_sessoes(request.user, [instance.pk])
 
         return Response(
             {"detail": "Sessão excluída com sucesso."},
             status=status.HTTP_200_OK,
         )
 
-class MetricasCorridaViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=["get", "put", "delete"], url_path="rota")
+    def rota(self, request, pk=None):
+        """
+        GET    /api/sessoes-atividade/{id}/rota/?zoom=14   resumo + polilinha do zoom
+        GET    /api/sessoes-atividade/{id}/rota/?pontos=1  pontos completos
+        PUT    /api/sessoes-atividade/{id}/rota/  {"pontos": [[lat, lon, altitude_m?, segundos?], ...]}
+        DELETE /api/sessoes-atividade/{id}/rota/
+        Só sessões de corrida e ciclismo têm rota (veja core/rotas.py).
+        """
+        sessao = self.get_object()
+
+        if request.method == "PUT":
+            if sessao.modalidade not in rotas.MODALIDADES:
+                raise ValidationError({"sessao": "Só sessões de corrida e ciclismo têm rota."})
+            try:
+                pontos = rotas.ler_pontos(request.data.get("pontos"))
+            except rotas.RotaInvalida as exc:
+                raise ValidationError({"pontos": str(exc)})
+            with shards.transacao():
+                resumo = rotas.gravar(sessao, pontos)
+            return Response(resumo, status=status.HTTP_200_OK)
+
+        if request.method == "DELETE":
+            if not rotas.excluir(sessao.id):
+                raise Http404
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if request.query_params.get("pontos") in ("1", "true"):
+            pontos = rotas.pontos_da_sessao(sessao.id)
+            if pontos is None:
+                raise Http404
+            colunas = [pontos["lat"].tolist(), pontos["lon"].tolist()]
+            if pontos["altitude"] is not None or pontos["tempo"] is not None:
+                altitude = pontos["altitude"]
+                colunas.append(altitude.tolist() if altitude is not None else [None] * len(colunas[0]))
+            if pontos["tempo"] is not None:
+                colunas.append(pontos["tempo"].astype(int).tolist())
+            return Response({"pontos": [list(ponto) for ponto in zip(*colunas)]})
+
+        try:
+            zoom = int(request.query_params.get("zoom", rotas.ZOOM_PADRAO))
+        except ValueError:
+            raise ValidationError({"zoom": "Informe um número inteiro."})
+        if not 0 <= zoom <= 22:
+            raise ValidationError({"zoom": "Use um valor entre 0 e 22."})
+        rota = rotas.ler(sessao.id, zoom)
+        if rota is None:
+            raise Http404
+        return Response(rota)
+
+    @action(detail=True, methods=["get", "post", "delete"], url_path="sensores")
+    def sensores(self, request, pk=None):
+        """
+        GET    /api/sessoes-atividade/{id}/sensores/                      resumo por canal
+        GET    /api/sessoes-atividade/{id}/sensores/?canal=fc&pontos=500  série reduzida (LTTB)
+        POST   /api/sessoes-atividade/{id}/sensores/?formato=csv|ndjson   (corpo: amostras a 1 Hz)
+        DELETE /api/sessoes-atividade/{id}/sensores/
+        O corpo é lido em streaming; veja core/sensores.py para o formato.
+        """
+        sessao = self.get_object()
+
+        if request.method == "POST":
+            formato = request.query_params.get("formato")
+            if not formato:
+                formato = "csv" if request.content_type.startswith("text/csv") else "ndjson"
+            if formato not in sensores.FORMATOS:
+                raise ValidationError({"formato": "Use ndjson ou csv."})
+            stream = request.stream
+            if stream is None:
+                raise ValidationError({"detail": "Envie as amostras no corpo da requisição."})
+            try:
+                resumo = sensores.ingerir(
+                    sessao, sensores.ler_amostras(stream, formato), request.user.fc_maxima
+                )
+            except sensores.SensoresInvalidos as exc:
+                raise ValidationError({"linha": exc.linha, "detail": exc.erro})
+            except UnicodeDecodeError:
+                raise ValidationError({"detail": "O arquivo deve estar em UTF-8."})
+            # A FC das amostras vira o fc_media das métricas.
+            invalidar_analise(sessao.usuario_id)
+            return Response(resumo, status=status.HTTP_200_OK)
+
+        if request.method == "DELETE":
+            if not sensores.excluir(sessao.id):
+                raise Http404
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        canal = request.query_params.get("canal")
+        if canal is None:
+            resumo = sensores.resumir(sessao.id)
+            if not resumo:
+                raise Http404
+            return Response({"canais": resumo})
+
+        if canal not in sensores.CANAIS:
+            raise ValidationError({"canal": "Use fc, cadencia ou potencia."})
+        try:
+            pontos = int(request.query_params.get("pontos", sensores.PONTOS_PADRAO))
+        except ValueError:
+            raise ValidationError({"pontos": "Informe um número inteiro."})
+        if not sensores.MIN_PONTOS <= pontos <= sensores.MAX_PONTOS:
+            raise ValidationError(
+                {"pontos": f"Use um valor entre {sensores.MIN_PONTOS} e {sensores.MAX_PONTOS}."}
+            )
+        serie = sensores.serie(sessao.id, canal, pontos)
+        if serie is None:
+            raise Http404
+        return Response(serie)
+
+    @action(detail=False, methods=["post"], url_path="excluir-em-lote")
+    def excluir_em_lote(self, request):
+        """
+        POST /api/sessoes-atividade/excluir-em-lote/  {"ids": [1, 2, 3]}
+        Exclui as sessões sem dependências e informa as bloqueadas
+        (mesma regra do DELETE individual) e as não encontradas.
+        """
+        ids = request.data.get("ids")
+        if not isinstance(ids, list) or not ids:
+            raise ValidationError({"ids": "Informe uma lista de ids de sessão."})
+        if len(ids) > LIMITE_EXCLUSAO_EM_LOTE:
+            raise ValidationError(
+                {"ids": f"Informe no máximo {LIMITE_EXCLUSAO_EM_LOTE} ids por requisição."}
+            )
+        try:
+            ids = list(dict.fromkeys(int(i) for i in ids))
+        except (TypeError, ValueError):
+            raise ValidationError({"ids": "Todos os ids devem ser números inteiros."})
+
+        with shards.transacao():
+            # FOR UPDATE impede que métricas/séries/marcações sejam vinculadas
+            # às sessões entre a verificação e o DELETE.
+            encontradas = dict(
+                anotar_dependencias_sessao(
+                    SessaoAtividade.objects.filter(usuario=request.user, id__in=ids)
+                )
+                .select_for_update()
+                .values_list("id", "tem_dependencias")
+            )
+            livres = [i for i, bloqueada in encontradas.items() if not bloqueada]
+            excluir_sessoes(request.user, livres)
+
+        return Response(
+            {
+                "excluidas": livres,
+                "bloqueadas": [i for i, bloqueada in encontradas.items() if bloqueada],
+                "nao_encontradas": [i for i in ids if i not in encontradas],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+class MetricasCorridaViewSet(MultiGetMixin, viewsets.ModelViewSet):
     queryset = MetricasCorrida.objects.select_related("sessao").all()
     serializer_class = MetricasCorridaSerializer
+
+    def perform_create(self, serializer):
+        self.criar_em_lote([serializer])
+
+    def criar_em_lote(self, serializers):
+        """Grava as métricas validadas com um único INSERT (também usado pelo POST /api/batch/)."""
+        usuario = self.request.user
+        with shards.transacao():
+            lista = MetricasCorrida.objects.bulk_create([
+                MetricasCorrida(
+                    **s.validated_data, usuario=usuario,
+                    sessao_inicio_em=s.validated_data["sessao"].inicio_em,
+                )
+                for s in serializers
+            ])
+            for metricas in lista:
+                esforcos.registrar_metricas(usuario.id, metricas)
+            rankings.agendar(usuario, [metricas.sessao_inicio_em for metricas in lista])
+            calorias.agendar(usuario.id, [metricas.sessao_id for metricas in lista])
+        for serializer, metricas in zip(serializers, lista):
+            serializer.instance = metricas
+        invalidar_analise(usuario.id)
+
+    def perform_update(self, serializer):
+        usuario_id = self.request.user.id
+        era_melhor = esforcos.detem_melhor_esforco(serializer.instance.sessao_id)
+        inicio_anterior = serializer.instance.sessao_inicio_em
+        sessao = serializer.validated_data.get("sessao", serializer.instance.sessao)
+
+        with shards.transacao():
+            metricas = serializer.save(usuario=self.request.user, sessao_inicio_em=sessao.inicio_em)
+
+            # Se a sessão detinha um melhor esforço, o ritmo pode ter piorado:
+            # o worker relê só o histórico deste usuário.
+            if era_melhor:
+                esforcos.agendar_recalculo(usuario_id)
+            else:
+                esforcos.registrar_metricas(usuario_id, metricas)
+            rankings.agendar(self.request.user, [inicio_anterior, metricas.sessao_inicio_em])
+            calorias.agendar(usuario_id, [metricas.sessao_id])
+        invalidar_analise(usuario_id)
+
+    def perform_destroy(self, instance):
+        # sessao_id é a chave primária: o delete() a zera na instância.
+        sessao_id = instance.sessao_id
+        era_melhor = esforcos.detem_melhor_esforco(sessao_id)
+        with shards.transacao():
+            instance.delete()
+            if era_melhor:
+                esforcos.agendar_recalculo(self.request.user.id)
+            rankings.agendar(self.request.user, [instance.sessao_inicio_em])
+            calorias.agendar(self.request.user.id, [sessao_id])
+        invalidar_analise(self.request.user.id)
     
     def get_queryset(self):
         request = cast(Request, self.request)
@@ -284,9 +755,47 @@ class MetricasCorridaViewSet(viewsets.ModelViewSet):
             .filter(sessao__usuario=request.user)
         )
 
-class MetricasCiclismoViewSet(viewsets.ModelViewSet):
+class MetricasCiclismoViewSet(MultiGetMixin, viewsets.ModelViewSet):
     queryset = MetricasCiclismo.objects.select_related("sessao").all()
     serializer_class = MetricasCiclismoSerializer
+
+    def perform_create(self, serializer):
+        self.criar_em_lote([serializer])
+
+    def criar_em_lote(self, serializers):
+        """Grava as métricas validadas com um único INSERT (também usado pelo POST /api/batch/)."""
+        usuario = self.request.user
+        with shards.transacao():
+            lista = MetricasCiclismo.objects.bulk_create([
+                MetricasCiclismo(
+                    **s.validated_data, usuario=usuario,
+                    sessao_inicio_em=s.validated_data["sessao"].inicio_em,
+                )
+                for s in serializers
+            ])
+            rankings.agendar(usuario, [metricas.sessao_inicio_em for metricas in lista])
+            calorias.agendar(usuario.id, [metricas.sessao_id for metricas in lista])
+        for serializer, metricas in zip(serializers, lista):
+            serializer.instance = metricas
+        invalidar_analise(usuario.id)
+
+    def perform_update(self, serializer):
+        inicio_anterior = serializer.instance.sessao_inicio_em
+        sessao = serializer.validated_data.get("sessao", serializer.instance.sessao)
+        with shards.transacao():
+            metricas = serializer.save(usuario=self.request.user, sessao_inicio_em=sessao.inicio_em)
+            rankings.agendar(self.request.user, [inicio_anterior, metricas.sessao_inicio_em])
+            calorias.agendar(self.request.user.id, [metricas.sessao_id])
+        invalidar_analise(self.request.user.id)
+
+    def perform_destroy(self, instance):
+        # sessao_id é a chave primária: o delete() a zera na instância.
+        sessao_id = instance.sessao_id
+        with shards.transacao():
+            instance.delete()
+            rankings.agendar(self.request.user, [instance.sessao_inicio_em])
+            calorias.agendar(self.request.user.id, [sessao_id])
+        invalidar_analise(self.request.user.id)
     
     def get_queryset(self):
             request = cast(Request, self.request)
@@ -296,7 +805,7 @@ class MetricasCiclismoViewSet(viewsets.ModelViewSet):
                 .filter(sessao__usuario=request.user)
             )
 
-class SerieMusculacaoViewSet(viewsets.ModelViewSet):
+class SerieMusculacaoViewSet(IdempotenteMixin, MultiGetMixin, viewsets.ModelViewSet):
     serializer_class = SerieMusculacaoSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter]
@@ -308,7 +817,12 @@ class SerieMusculacaoViewSet(viewsets.ModelViewSet):
         qs = (
             SerieMusculacao.objects
             .select_related("sessao", "exercicio")
-            .filter(sessao__usuario=request.user)
+            .filter(usuario=request.user)
+            .annotate(
+                recorde_pessoal=Exists(
+                    RecordePessoal.objects.filter(melhor_serie=OuterRef("pk"))
+                )
+            )
             .order_by("sessao_id", "ordem_serie", "id")
         )
 
@@ -322,12 +836,66 @@ class SerieMusculacaoViewSet(viewsets.ModelViewSet):
 
         return qs
 
+    def perform_create(self, serializer):
+        self.criar_em_lote([serializer])
+
+    def criar_em_lote(self, serializers):
+        """Grava as séries validadas com um único INSERT (também usado pelo POST /api/batch/)."""
+        usuario = self.request.user
+        with shards.transacao():
+            series = SerieMusculacao.objects.bulk_create([
+                SerieMusculacao(
+                    **s.validated_data, usuario=usuario,
+                    inicio_em=s.validated_data["sessao"].inicio_em,
+                )
+                for s in serializers
+            ])
+            # Na ordem do lote: cada série é comparada com as anteriores.
+            for serie in series:
+                serie.recorde_pessoal = registrar_serie(usuario.id, serie)
+            calorias.agendar(usuario.id, [serie.sessao_id for serie in series])
+        for serializer, serie in zip(serializers, series):
+            serializer.instance = serie
+        for inicio in {serie.inicio_em for serie in series}:
+            invalidar_volume_semana(usuario.id, inicio)
+
+    def perform_update(self, serializer):
+        usuario_id = self.request.user.id
+        anterior = serializer.instance
+        exercicio_anterior = anterior.exercicio_id
+        inicio_anterior = anterior.inicio_em
+        anterior_sessao_id = anterior.sessao_id
+        era_recorde = detem_recorde(
+            usuario_id, exercicio_anterior, anterior.pk, anterior.carga_kg
+        )
+
+        sessao = serializer.validated_data.get("sessao", anterior.sessao)
+        with shards.transacao():
+            serie = serializer.save(inicio_em=sessao.inicio_em)
+
+            # Se a série era o recorde (ou mudou de exercício), o valor antigo
+            # pode ter caído: o worker recalcula só o exercício anterior.
+            if era_recorde:
+                recordes.agendar_recalculo(usuario_id, exercicio_anterior)
+            serie.recorde_pessoal = registrar_serie(usuario_id, serie)
+            calorias.agendar(usuario_id, [anterior_sessao_id, serie.sessao_id])
+        invalidar_volume_semana(usuario_id, inicio_anterior)
+        invalidar_volume_semana(usuario_id, serie.inicio_em)
+
     def destroy(self, request, *args, **kwargs):
 
         instance = self.get_object()
         sessao = instance.sessao
+        era_recorde = detem_recorde(
+            request.user.id, instance.exercicio_id, instance.pk, instance.carga_kg
+        )
 
-        response = super().destroy(request, *args, **kwargs)
+        with shards.transacao():
+            response = super().destroy(request, *args, **kwargs)
+            if era_recorde:
+                recordes.agendar_recalculo(request.user.id, instance.exercicio_id)
+            calorias.agendar(request.user.id, [sessao.id])
+        invalidar_volume_semana(request.user.id, sessao.inicio_em)
 
         series = (
             SerieMusculacao.objects
@@ -342,6 +910,53 @@ class SerieMusculacaoViewSet(viewsets.ModelViewSet):
 
         return response
 
+class RecordePessoalViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Recordes pessoais do usuário logado (melhor série e 1RM estimado).
+    Filtro suportado: exercicio_id
+    """
+    serializer_class = RecordePessoalSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_field = "exercicio"
+
+    def get_queryset(self):
+        request = cast(Request, self.request)
+        qs = (
+            RecordePessoal.objects
+            .select_related("exercicio")
+            .filter(usuario=request.user)
+            .order_by("exercicio__nome")
+        )
+
+        exercicio_id = request.query_params.get("exercicio_id")
+        if exercicio_id:
+            qs = qs.filter(exercicio_id=exercicio_id)
+
+        return qs
+
+class MelhorEsforcoCorridaViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Melhores esforços de corrida do usuário logado (5k, 10k, 21k, 42k).
+    GET /api/melhores-esforcos/distribuicao/ devolve os percentis de ritmo
+    por faixa de distância.
+    """
+    serializer_class = MelhorEsforcoCorridaSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_field = "distancia_alvo"
+
+    def get_queryset(self):
+        request = cast(Request, self.request)
+        return (
+            MelhorEsforcoCorrida.objects
+            .select_related("sessao")
+            .filter(usuario=request.user)
+            .order_by("tempo_estimado_seg")
+        )
+
+    @action(detail=False, methods=["get"])
+    def distribuicao(self, request):
+        return Response(esforcos.distribuicao_ritmo(request.user.id), status=status.HTTP_200_OK)
+
 class MetaHabitoViewSet(viewsets.ModelViewSet):
     serializer_class = MetaHabitoSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -403,14 +1018,47 @@ class MetaHabitoViewSet(viewsets.ModelViewSet):
         return Response({"detail": message}, status=status.HTTP_200_OK)
 
 
-class MarcacaoHabitoViewSet(viewsets.ModelViewSet):
+class MarcacaoHabitoViewSet(IdempotenteMixin, viewsets.ModelViewSet):
     serializer_class = MarcacaoHabitoSerializer
 
+    @staticmethod
+    def _inicio_sessao(serializer):
+        instance = serializer.instance
+        sessao = serializer.validated_data.get(
+            "sessao", instance.sessao if instance is not None else None
+        )
+        return sessao.inicio_em if sessao is not None else None
+
     def perform_create(self, serializer):
-        serializer.save(usuario=self.request.user)
+        self.criar_em_lote([serializer])
+
+    def criar_em_lote(self, serializers):
+        """Grava as marcações validadas com um único INSERT (também usado pelo POST /api/batch/)."""
+        with shards.transacao():
+            lista = MarcacaoHabito.objects.bulk_create([
+                MarcacaoHabito(
+                    **s.validated_data, usuario=self.request.user,
+                    sessao_inicio_em=self._inicio_sessao(s),
+                )
+                for s in serializers
+            ])
+            heatmap.agendar(self.request.user.id, [marcacao.data for marcacao in lista])
+        for serializer, marcacao in zip(serializers, lista):
+            serializer.instance = marcacao
 
     def perform_update(self, serializer):
-        serializer.save(usuario=self.request.user)
+        data_anterior = serializer.instance.data
+        with shards.transacao():
+            marcacao = serializer.save(
+                usuario=self.request.user, sessao_inicio_em=self._inicio_sessao(serializer)
+            )
+            heatmap.agendar(self.request.user.id, [data_anterior, marcacao.data])
+
+    def perform_destroy(self, instance):
+        with shards.transacao():
+            data = instance.data
+            instance.delete()
+            heatmap.agendar(self.request.user.id, [data])
 
     def get_queryset(self):
         """
@@ -457,6 +1105,467 @@ class MarcacaoHabitoViewSet(viewsets.ModelViewSet):
         return qs
 
 
+class AnaliseTendenciaView(APIView):
+    """
+    Tendências semanais/mensais de corrida ou ciclismo.
+    GET /api/analise/corrida/  e  GET /api/analise/ciclismo/
+    Filtros opcionais: data_inicio, data_fim (AAAA-MM-DD)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    modalidade = None
+
+    def get(self, request: Request) -> Response:
+        assert self.modalidade in CONFIG_MODALIDADE
+
+        datas = {}
+        for campo in ("data_inicio", "data_fim"):
+            valor = request.query_params.get(campo)
+            datas[campo] = parse_date(valor) if valor else None
+            if valor and not datas[campo]:
+                raise ValidationError({campo: "Data inválida. Use o formato AAAA-MM-DD."})
+
+        resultado = tendencias_em_cache(request.user.id, self.modalidade, **datas)
+        return Response(resultado, status=status.HTTP_200_OK)
+
+
+class AnaliseVolumeView(APIView):
+    """
+    Volume semanal de musculação por grupo muscular e equipamento.
+    GET /api/analise/volume/?data_inicio=AAAA-MM-DD&data_fim=AAAA-MM-DD
+    Sem datas, devolve as últimas 12 semanas; o intervalo vai até 104.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request: Request) -> Response:
+        hoje = timezone.localdate()
+        datas = {
+            "data_inicio": hoje - timedelta(weeks=SEMANAS_PADRAO_VOLUME - 1),
+            "data_fim": hoje,
+        }
+        for campo in datas:
+            valor = request.query_params.get(campo)
+            if valor:
+                datas[campo] = parse_date(valor)
+                if not datas[campo]:
+                    raise ValidationError({campo: "Data inválida. Use o formato AAAA-MM-DD."})
+
+        if datas["data_fim"] < datas["data_inicio"]:
+            raise ValidationError(
+                {"data_fim": "A data final não pode ser anterior à data de início."}
+            )
+        dias = (inicio_da_semana(datas["data_fim"]) - inicio_da_semana(datas["data_inicio"])).days
+        if dias // 7 + 1 > SEMANAS_MAXIMO_VOLUME:
+            raise ValidationError(
+                {"data_fim": f"Informe um intervalo de até {SEMANAS_MAXIMO_VOLUME} semanas."}
+            )
+
+        semanas = volume_semanal(request.user.id, datas["data_inicio"], datas["data_fim"])
+        return Response({"semanas": semanas}, status=status.HTTP_200_OK)
+
+
+class HeatmapView(APIView):
+    """
+    Mapa de calor diário de sessões e hábitos concluídos em um ano.
+    GET /api/heatmap/?ano=AAAA (padrão: ano corrente)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request: Request) -> Response:
+        atual = timezone.localdate().year
+        ano_str = request.query_params.get("ano")
+        if ano_str is None:
+            ano = atual
+        else:
+            try:
+                ano = int(ano_str)
+            except ValueError:
+                raise ValidationError({"ano": "Ano inválido. Use o formato AAAA."})
+            if not ANO_MINIMO_HEATMAP <= ano <= atual:
+                raise ValidationError(
+                    {"ano": f"Informe um ano entre {ANO_MINIMO_HEATMAP} e {atual}."}
+                )
+
+        return Response(heatmap_anual(request.user.id, ano), status=status.HTTP_200_OK)
+
+
+class RankingSemanalView(APIView):
+    """
+    Ranking semanal dos usuários que optaram por participar.
+    GET /api/rankings/<categoria>/?semana=AAAA-MM-DD&apos=<proxima>
+    categoria: distancia_corrida, distancia_ciclismo ou sessoes.
+    Sem semana, usa a semana corrente (a data pode ser qualquer dia dela).
+    Sem apos, começa do topo; cada resposta traz em `proxima` o valor de
+    apos da página seguinte (null na última).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request: Request, categoria: str) -> Response:
+        if categoria not in rankings.CATEGORIAS:
+            raise ValidationError(
+                {"categoria": f"Use uma de: {', '.join(rankings.CATEGORIAS)}."}
+            )
+
+        semana = rankings.semana_atual()
+        semana_str = request.query_params.get("semana")
+        if semana_str:
+            dia = parse_date(semana_str)
+            if not dia:
+                raise ValidationError({"semana": "Data inválida. Use o formato AAAA-MM-DD."})
+            semana = inicio_da_semana(dia)
+
+        apos = None
+        apos_str = request.query_params.get("apos")
+        if apos_str:
+            try:
+                valor, usuario_id = apos_str.split(",")
+                apos = (Decimal(valor), int(usuario_id))
+            except (ValueError, ArithmeticError):
+                raise ValidationError({"apos": "Use o valor de `proxima` da página anterior."})
+
+        tamanho = rankings.TAMANHO_PAGINA
+        resultados = rankings.pagina(semana, categoria, apos, tamanho)
+        proxima = None
+        if len(resultados) == tamanho:
+            ultimo = resultados[-1]
+            proxima = f"{ultimo['valor']},{ultimo['usuario']}"
+
+        minha_posicao = None
+        if request.user.participa_ranking:
+            minha_posicao = rankings.posicao(request.user.id, semana, categoria)
+
+        return Response(
+            {
+                "categoria": categoria,
+                "semana": semana,
+                "participantes": rankings.total_participantes(semana, categoria),
+                "resultados": resultados,
+                "proxima": proxima,
+                "minha_posicao": minha_posicao,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class RelatorioMensalView(APIView):
+    """
+    Relatórios mensais de ops/admin, lidos só das visões materializadas.
+    GET /api/relatorios/modalidades/  (usuários ativos, sessões, distância)
+    GET /api/relatorios/habitos/      (taxa de conclusão de hábitos)
+    Filtros: mes_inicio, mes_fim (AAAA-MM) e modalidade.
+    """
+    permission_classes = [PodeVerRelatorios]
+    relatorio = ""
+
+    def get(self, request: Request) -> Response:
+        filtros = {}
+        for campo in ("mes_inicio", "mes_fim"):
+            valor = request.query_params.get(campo)
+            if valor:
+                filtros[campo] = _parse_mes(valor, campo)
+
+        modalidade = request.query_params.get("modalidade")
+        if modalidade and modalidade not in ModalidadeChoices.values:
+            raise ValidationError({"modalidade": "Modalidade inválida."})
+
+        dados = relatorios.consultar(
+            self.relatorio,
+            filtros.get("mes_inicio"),
+            filtros.get("mes_fim"),
+            modalidade,
+        )
+        return Response(dados, status=status.HTTP_200_OK)
+
+
+class OutboxMetricasView(APIView):
+    """
+    Fila do outbox por shard (ops/admin): tarefas pendentes, prontas,
+    atraso da mais antiga em segundos e esgotadas.
+    GET /api/outbox/metricas/
+    """
+    permission_classes = [PodeVerRelatorios]
+
+    def get(self, request: Request) -> Response:
+        dados = {}
+        for alias in settings.SHARDS:
+            with shards.usando(alias):
+                dados[alias] = outbox.metricas()
+        return Response(dados, status=status.HTTP_200_OK)
+
+
+class SyncView(APIView):
+    """
+    Delta sync do app offline: tudo que foi criado, alterado ou excluído
+    desde o cursor (sessões, métricas, séries, metas e marcações), em
+    ordem e em páginas. Sem cursor, começa do zero.
+    GET /api/sync/?cursor=&limite=
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request: Request) -> Response:
+        try:
+            limite = int(request.query_params.get("limite", sync.TAMANHO_PAGINA))
+        except ValueError:
+            raise ValidationError({"limite": "Informe um número inteiro."})
+        if not 1 <= limite <= sync.TAMANHO_MAXIMO:
+            raise ValidationError({"limite": f"Use um valor entre 1 e {sync.TAMANHO_MAXIMO}."})
+
+        try:
+            pagina = sync.alteracoes(request.user.id, request.query_params.get("cursor"), limite)
+        except ValueError:
+            raise ValidationError({"cursor": "Cursor inválido."})
+        return Response(pagina, status=status.HTTP_200_OK)
+
+
+# POST /api/batch/: viewset que valida e grava cada recurso e os campos que
+# aceitam ids temporários ("$ref") de itens criados antes no mesmo lote.
+RECURSOS_LOTE = {
+    "sessoes-atividade": (SessaoAtividadeViewSet, ()),
+    "metricas-corrida": (MetricasCorridaViewSet, ("sessao",)),
+    "metricas-ciclismo": (MetricasCiclismoViewSet, ("sessao",)),
+    "series-musculacao": (SerieMusculacaoViewSet, ("sessao",)),
+    "metas-habito": (MetaHabitoViewSet, ()),
+    "marcacoes-habito": (MarcacaoHabitoViewSet, ("meta", "sessao")),
+}
+ACOES_LOTE = {"criar": "create", "atualizar": "partial_update", "excluir": "destroy"}
+# Campos únicos por recurso, com o campo e a mensagem do erro. Os
+# serializers só comparam com o que já está no banco: criações do mesmo
+# INSERT não se enxergam.
+UNICOS_LOTE = {
+    "series-musculacao": (
+        ("sessao", "ordem_serie"), "ordem_serie",
+        "Já existe uma série com essa ordem nessa sessão.",
+    ),
+    "marcacoes-habito": (
+        ("meta", "data"), "data", "Já existe uma marcação para essa meta nesse dia.",
+    ),
+    "metricas-corrida": (("sessao",), "sessao", "Essa sessão já tem métricas."),
+    "metricas-ciclismo": (("sessao",), "sessao", "Essa sessão já tem métricas."),
+}
+LIMITE_OPERACOES_LOTE = 200
+
+
+class ErroOperacao(Exception):
+    def __init__(self, indice: int, erros):
+        self.indice, self.erros = indice, erros
+
+
+class LoteView(APIView):
+    """
+    Várias escritas em uma requisição e uma transação (ex.: a sessão de um
+    treino, as métricas ou séries e a marcação do hábito).
+    POST /api/batch/
+    {"operacoes": [
+      {"recurso": "sessoes-atividade", "acao": "criar", "ref": "s1", "dados": {...}},
+      {"recurso": "series-musculacao", "acao": "criar", "dados": {"sessao": "$s1", ...}},
+      {"recurso": "marcacoes-habito", "acao": "atualizar", "id": 42, "dados": {"sessao": "$s1"}},
+      {"recurso": "metas-habito", "acao": "excluir", "id": 7}
+    ]}
+    As operações rodam na ordem, pelos serializers e regras do endpoint de
+    cada recurso. `ref` nomeia o item criado; "$ref" o referencia no `id`
+    e nos campos de vínculo das operações seguintes. Criações seguidas do
+    mesmo recurso viram um único INSERT. Qualquer erro desfaz o lote
+    inteiro e devolve 400 com o índice da operação. Aceita Idempotency-Key.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request: Request) -> Response:
+        return idempotencia.executar(request, lambda: self._processar(request))
+
+    def _processar(self, request: Request) -> Response:
+        operacoes = request.data.get("operacoes") if isinstance(request.data, dict) else None
+        if not isinstance(operacoes, list) or not operacoes:
+            raise ValidationError({"operacoes": "Informe uma lista de operações."})
+        if len(operacoes) > LIMITE_OPERACOES_LOTE:
+            raise ValidationError(
+                {"operacoes": f"Informe no máximo {LIMITE_OPERACOES_LOTE} operações por lote."}
+            )
+        refs: dict[str, Any] = {}
+        resultados: list[Any] = [None] * len(operacoes)
+        try:
+            self._validar_formato(operacoes)
+            with shards.transacao():
+                for grupo in self._grupos(operacoes):
+                    self._executar(request, grupo, refs, resultados)
+        except ErroOperacao as exc:
+            return Response(
+                {"operacao": exc.indice, "erros": exc.erros}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({"refs": refs, "resultados": resultados}, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def _validar_formato(operacoes: list) -> None:
+        refs = set()
+        for indice, op in enumerate(operacoes):
+            erros = {}
+            if not isinstance(op, dict):
+                raise ErroOperacao(indice, {"non_field_errors": "Informe um objeto."})
+            if op.get("recurso") not in RECURSOS_LOTE:
+                erros["recurso"] = f"Use um de: {', '.join(RECURSOS_LOTE)}."
+            if op.get("acao") not in ACOES_LOTE:
+                erros["acao"] = f"Use um de: {', '.join(ACOES_LOTE)}."
+            elif op["acao"] != "criar" and op.get("id") is None:
+                erros["id"] = "Informe o id (ou \"$ref\") do item."
+            if not isinstance(op.get("dados", {}), dict):
+                erros["dados"] = "Informe um objeto."
+            ref = op.get("ref")
+            if ref is not None:
+                if op.get("acao") != "criar" or not isinstance(ref, str) or not ref:
+                    erros["ref"] = "Use ref (texto) só em operações de criação."
+                elif ref in refs:
+                    erros["ref"] = f"Ref repetida: {ref}."
+                refs.add(ref)
+            if erros:
+                raise ErroOperacao(indice, erros)
+
+    @staticmethod
+    def _grupos(operacoes: list):
+        """Criações seguidas do mesmo recurso formam um grupo; o resto vai sozinho."""
+        grupo: list[tuple[int, dict]] = []
+        for indice, op in enumerate(operacoes):
+            if grupo and not (
+                op["acao"] == "criar" and grupo[0][1]["acao"] == "criar"
+                and op["recurso"] == grupo[0][1]["recurso"]
+            ):
+                yield grupo
+                grupo = []
+            grupo.append((indice, op))
+        yield grupo
+
+    @staticmethod
+    def _resolver(indice: int, valor, refs: dict):
+        if isinstance(valor, str) and valor.startswith("$"):
+            if valor[1:] not in refs:
+                raise ErroOperacao(indice, {"ref": f"Referência desconhecida: {valor}."})
+            return refs[valor[1:]]
+        return valor
+
+    def _executar(self, request, grupo, refs, resultados) -> None:
+        primeiro = grupo[0][1]
+        classe, campos_ref = RECURSOS_LOTE[primeiro["recurso"]]
+        acao = ACOES_LOTE[primeiro["acao"]]
+
+        def dados_de(indice, op):
+            dados = dict(op.get("dados", {}))
+            for campo in campos_ref:
+                if campo in dados:
+                    dados[campo] = self._resolver(indice, dados[campo], refs)
+            return dados
+
+        pk = None
+        if acao != "create":
+            pk = self._resolver(grupo[0][0], primeiro["id"], refs)
+        view = classe(
+            request=request, format_kwarg=None, action=acao, args=(),
+            kwargs={} if pk is None else {"pk": pk},
+        )
+
+        indice = grupo[0][0]
+        try:
+            if acao == "create":
+                campos_unicos, campo_erro, mensagem = UNICOS_LOTE.get(
+                    primeiro["recurso"], ((), None, None)
+                )
+                vistos = set()
+                serializers = []
+                for indice, op in grupo:
+                    serializer = view.get_serializer(data=dados_de(indice, op))
+                    if not serializer.is_valid():
+                        raise ErroOperacao(indice, serializer.errors)
+                    if campos_unicos:
+                        chave = tuple(serializer.validated_data.get(campo) for campo in campos_unicos)
+                        if chave in vistos:
+                            raise ErroOperacao(indice, {campo_erro: [mensagem]})
+                        vistos.add(chave)
+                    serializers.append(serializer)
+                indice = grupo[0][0]
+                if hasattr(view, "criar_em_lote"):
+                    view.criar_em_lote(serializers)
+                else:
+                    for serializer in serializers:
+                        view.perform_create(serializer)
+                for (indice, op), serializer in zip(grupo, serializers):
+                    if op.get("ref"):
+                        refs[op["ref"]] = serializer.instance.pk
+                    resultados[indice] = {"id": serializer.instance.pk, "dados": serializer.data}
+
+            elif acao == "partial_update":
+                serializer = view.get_serializer(
+                    view.get_object(), data=dados_de(indice, primeiro), partial=True
+                )
+                if not serializer.is_valid():
+                    raise ErroOperacao(indice, serializer.errors)
+                view.perform_update(serializer)
+                resultados[indice] = {"id": serializer.instance.pk, "dados": serializer.data}
+
+            else:
+                resposta = view.destroy(request, pk=pk)
+                if resposta.status_code >= 400:
+                    raise ErroOperacao(indice, resposta.data)
+                resultados[indice] = {"id": pk, "dados": resposta.data}
+        except Http404:
+            raise ErroOperacao(indice, {"id": "Item não encontrado."})
+        except ValidationError as exc:
+            raise ErroOperacao(indice, exc.detail)
+        except IntegrityError:
+            raise ErroOperacao(indice, {"detail": "Dados em conflito com restrições do banco."})
+
+
+class ImportacaoHistoricoView(APIView):
+    """
+    Importação em lote do histórico do usuário logado.
+    POST /api/importacao/?formato=ndjson|csv  (corpo: o arquivo)
+    O corpo é lido em streaming; veja core/importacao.py para o formato.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request: Request) -> Response:
+        formato = request.query_params.get("formato")
+        if not formato:
+            formato = "csv" if request.content_type.startswith("text/csv") else "ndjson"
+        if formato not in FORMATOS:
+            raise ValidationError({"formato": "Use ndjson ou csv."})
+
+        stream = request.stream
+        if stream is None:
+            raise ValidationError({"detail": "Envie o arquivo no corpo da requisição."})
+
+        try:
+            resumo = importar_historico(request.user.id, ler_registros(stream, formato))
+        except UnicodeDecodeError:
+            raise ValidationError({"detail": "O arquivo deve estar em UTF-8."})
+
+        return Response(resumo, status=status.HTTP_200_OK)
+
+
+class ExportacaoHistoricoView(APIView):
+    """
+    Exporta todo o histórico do usuário logado em streaming.
+    GET /api/exportacao/?formato=ndjson|csv&gzip=1
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request: Request) -> StreamingHttpResponse:
+        formato = request.query_params.get("formato", "ndjson")
+        if formato not in FORMATOS_EXPORTACAO:
+            raise ValidationError({"formato": "Use ndjson ou csv."})
+        compactar = request.query_params.get("gzip") in {"1", "true"}
+
+        content_type = "text/csv" if formato == "csv" else "application/x-ndjson"
+        nome_arquivo = f"historico.{formato}"
+        if compactar:
+            content_type = "application/gzip"
+            nome_arquivo += ".gz"
+
+        response = StreamingHttpResponse(
+            shards.iterar_no_shard(
+                shards.alias_atual(), exportar_historico(request.user.id, formato, compactar)
+            ),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = f'attachment; filename="{nome_arquivo}"'
+        return response
+
+
 class MeView(APIView):
     """
     Retorna os dados do usuário autenticado.
@@ -466,7 +1575,7 @@ class MeView(APIView):
 
     def get(self, request: Request) -> Response:
         user = request.user  # vem do JWTAuthentication
-        serializer = UsuarioSerializer(user)
+        serializer = PerfilSerializer(user)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     def patch(self, request: Request) -> Response:
@@ -480,14 +1589,23 @@ class MeView(APIView):
         )
         
         serializer.is_valid(raise_exception=True)
+        participava = user.participa_ranking
+        peso_anterior = user.peso_kg
         updated_user = serializer.save()
+
+        if updated_user.peso_kg != peso_anterior:
+            calorias.agendar(updated_user.id)
+
+        if updated_user.participa_ranking != participava:
+            if updated_user.participa_ranking:
+                rankings.reconstruir_usuario(updated_user.id)
+            else:
+                rankings.remover_usuario(updated_user.id)
         
-        read_serializer = UsuarioSerializer(updated_user)
+        read_serializer = PerfilSerializer(updated_user)
         return Response(read_serializer.data, status=status.HTTP_200_OK)
 
     def delete(self, request: Request) -> Response:
-        user = request.user
-        
-        user.delete()
-
+        # Só marca a conta: os dados são apagados em lotes pelo worker.
+        exclusao.solicitar(request.user)
         return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -3,7 +3,17 @@ CREATE TABLE usuarios (
   nome VARCHAR(120) NOT NULL,
   email VARCHAR(254) UNIQUE NOT NULL,
   hash_senha TEXT NOT NULL,
-  criado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+  participa_ranking BOOLEAN NOT NULL DEFAULT false,
+  -- Usado na estimativa de calorias (core/calorias.py).
+  peso_kg NUMERIC(5,2) CHECK (peso_kg > 0),
+  -- Limites das zonas de FC dos sensores (core/sensores.py).
+  fc_maxima SMALLINT CHECK (fc_maxima BETWEEN 100 AND 250),
+  criado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+  -- Shard dos dados do usuário (só no banco diretório; veja core/shards.py).
+  shard VARCHAR(63),
+  shard_migrando_desde TIMESTAMPTZ,
+  -- Exclusão pedida; os dados são apagados em lotes pelo worker do outbox.
+  excluido_em TIMESTAMPTZ
 );
 
 CREATE TABLE exercicios (
@@ -13,46 +23,130 @@ CREATE TABLE exercicios (
   equipamento VARCHAR(60)
 );
 
+-- sessoes_atividade e marcacoes_habito são particionadas por trimestre
+-- (veja criar_particao_trimestral no fim do arquivo e o comando
+-- `manage.py gerenciar_particoes`). A chave primária inclui a coluna de
+-- particionamento, então as FKs para sessões são compostas
+-- (sessao_id, sessao_inicio_em) com ON UPDATE CASCADE.
 CREATE TABLE sessoes_atividade (
-  id BIGSERIAL PRIMARY KEY,
+  id BIGSERIAL NOT NULL,
   usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
   modalidade VARCHAR(20) NOT NULL,
   inicio_em TIMESTAMPTZ NOT NULL,
   duracao_seg INTEGER CHECK (duracao_seg >= 0),
   calorias INTEGER CHECK (calorias >= 0),
+  -- calorias calculadas pelo servidor (core/calorias.py), não informadas
+  -- pelo app; só essas são recalculadas.
+  calorias_estimadas BOOLEAN NOT NULL DEFAULT false,
   observacoes TEXT,
   criado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
-  CONSTRAINT ck_sessoes_modalidade CHECK (modalidade IN ('corrida','ciclismo','musculacao'))
-);
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+  CONSTRAINT ck_sessoes_modalidade CHECK (modalidade IN ('corrida','ciclismo','musculacao')),
+  PRIMARY KEY (id, inicio_em)
+) PARTITION BY RANGE (inicio_em);
+
+-- Recebe o que não cair em nenhum trimestre criado (ex.: históricos antigos).
+CREATE TABLE sessoes_atividade_padrao PARTITION OF sessoes_atividade DEFAULT;
 
 CREATE INDEX idx_sessoes_usuario_tempo ON sessoes_atividade(usuario_id, inicio_em DESC);
 CREATE INDEX idx_sessoes_modalidade ON sessoes_atividade(modalidade);
 
 CREATE TABLE metricas_corrida (
-  sessao_id BIGINT PRIMARY KEY REFERENCES sessoes_atividade(id) ON DELETE CASCADE,
+  sessao_id BIGINT PRIMARY KEY,
+  sessao_inicio_em TIMESTAMPTZ NOT NULL,
+  -- Cópia de sessoes_atividade.usuario_id (sincronização sem join).
+  usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
   distancia_km NUMERIC(7,2) CHECK (distancia_km >= 0),
   ritmo_medio_seg_km INTEGER CHECK (ritmo_medio_seg_km >= 0),
-  fc_media SMALLINT
+  fc_media SMALLINT,
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+  FOREIGN KEY (sessao_id, sessao_inicio_em) REFERENCES sessoes_atividade(id, inicio_em)
+    ON UPDATE CASCADE ON DELETE CASCADE
 );
 
 CREATE TABLE metricas_ciclismo (
-  sessao_id BIGINT PRIMARY KEY REFERENCES sessoes_atividade(id) ON DELETE CASCADE,
+  sessao_id BIGINT PRIMARY KEY,
+  sessao_inicio_em TIMESTAMPTZ NOT NULL,
+  -- Cópia de sessoes_atividade.usuario_id (sincronização sem join).
+  usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
   distancia_km NUMERIC(7,2) CHECK (distancia_km >= 0),
   velocidade_media_kmh NUMERIC(5,2) CHECK (velocidade_media_kmh >= 0),
-  fc_media SMALLINT
+  fc_media SMALLINT,
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+  FOREIGN KEY (sessao_id, sessao_inicio_em) REFERENCES sessoes_atividade(id, inicio_em)
+    ON UPDATE CASCADE ON DELETE CASCADE
 );
 
 CREATE TABLE series_musculacao (
   id BIGSERIAL PRIMARY KEY,
-  sessao_id BIGINT NOT NULL REFERENCES sessoes_atividade(id) ON DELETE CASCADE,
+  sessao_id BIGINT NOT NULL,
+  -- Cópias de sessoes_atividade.usuario_id/inicio_em, para buscar o
+  -- histórico de um exercício sem join. inicio_em faz parte da FK e
+  -- acompanha a sessão via ON UPDATE CASCADE.
+  usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+  inicio_em TIMESTAMPTZ NOT NULL,
   exercicio_id BIGINT NOT NULL REFERENCES exercicios(id),
   ordem_serie INTEGER NOT NULL CHECK (ordem_serie >= 1),
   repeticoes INTEGER CHECK (repeticoes >= 0),
-  carga_kg NUMERIC(6,2) CHECK (carga_kg >= 0)
+  carga_kg NUMERIC(6,2) CHECK (carga_kg >= 0),
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+  FOREIGN KEY (sessao_id, inicio_em) REFERENCES sessoes_atividade(id, inicio_em)
+    ON UPDATE CASCADE ON DELETE CASCADE
 );
 
-CREATE INDEX idx_series_sessao ON series_musculacao(sessao_id);
+-- Cobre as colunas usadas nas agregações de volume (index-only scan).
+CREATE INDEX idx_series_sessao ON series_musculacao(sessao_id)
+  INCLUDE (exercicio_id, repeticoes, carga_kg);
 CREATE INDEX idx_series_exercicio ON series_musculacao(exercicio_id);
+CREATE INDEX idx_series_usuario_exercicio
+  ON series_musculacao(usuario_id, exercicio_id, inicio_em DESC)
+  INCLUDE (id, sessao_id, ordem_serie, repeticoes, carga_kg);
+
+-- Rota GPS da sessão (core/rotas.py): pontos num blob de int32 com
+-- delta + zlib, resumo derivado e polilinhas simplificadas por zoom.
+-- Sai junto com a sessão (ON DELETE CASCADE).
+CREATE TABLE rotas_sessao (
+  sessao_id BIGINT PRIMARY KEY,
+  sessao_inicio_em TIMESTAMPTZ NOT NULL,
+  usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+  dados BYTEA NOT NULL,
+  -- {"<zoom>": "<encoded polyline>"}
+  polilinhas JSONB NOT NULL,
+  pontos INTEGER NOT NULL,
+  distancia_m NUMERIC(9,1) NOT NULL,
+  ganho_elevacao_m NUMERIC(7,1),
+  perda_elevacao_m NUMERIC(7,1),
+  duracao_seg INTEGER,
+  parciais_seg_km JSONB,
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+  FOREIGN KEY (sessao_id, sessao_inicio_em) REFERENCES sessoes_atividade(id, inicio_em)
+    ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+-- O blob já vem comprimido: o TOAST só o guarda fora da linha.
+ALTER TABLE rotas_sessao ALTER COLUMN dados SET STORAGE EXTERNAL;
+
+-- Séries de sensores a 1 Hz em blocos de uma hora por canal (core/sensores.py).
+CREATE TABLE blocos_sensores (
+  sessao_id BIGINT NOT NULL,
+  sessao_inicio_em TIMESTAMPTZ NOT NULL,
+  usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+  canal VARCHAR(10) NOT NULL,
+  bloco INTEGER NOT NULL,
+  -- int16 por segundo (-1 = sem leitura), em delta + zlib.
+  dados BYTEA NOT NULL,
+  amostras INTEGER NOT NULL,
+  soma BIGINT NOT NULL,
+  maximo SMALLINT NOT NULL,
+  -- Segundos nas zonas 1 a 5 (só fc), pela FC máxima do envio.
+  zonas_fc INTEGER[],
+  PRIMARY KEY (sessao_id, canal, bloco),
+  FOREIGN KEY (sessao_id, sessao_inicio_em) REFERENCES sessoes_atividade(id, inicio_em)
+    ON UPDATE CASCADE ON DELETE CASCADE,
+  CONSTRAINT ck_blocos_sensores_canal CHECK (canal IN ('fc','cadencia','potencia'))
+);
+
+ALTER TABLE blocos_sensores ALTER COLUMN dados SET STORAGE EXTERNAL;
 
 CREATE TABLE metas_habito (
   id BIGSERIAL PRIMARY KEY,
@@ -66,7 +160,10 @@ CREATE TABLE metas_habito (
   duracao_meta_min INTEGER,
   sessoes_meta INTEGER,
   ativo BOOLEAN NOT NULL DEFAULT true,
+  -- Sessões da modalidade marcam o dia sozinhas (core/marcacoes.py).
+  marcar_automaticamente BOOLEAN NOT NULL DEFAULT false,
   criado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
   CONSTRAINT ck_metas_modalidade CHECK (modalidade IN ('corrida','ciclismo','musculacao')),
   CONSTRAINT ck_metas_alvo CHECK (
     frequencia_semana IS NOT NULL
@@ -76,13 +173,273 @@ CREATE TABLE metas_habito (
   )
 );
 
+CREATE INDEX idx_metas_automaticas ON metas_habito(usuario_id, modalidade)
+  WHERE ativo AND marcar_automaticamente;
+
 CREATE TABLE marcacoes_habito (
-  id BIGSERIAL PRIMARY KEY,
+  id BIGSERIAL NOT NULL,
   meta_id BIGINT NOT NULL REFERENCES metas_habito(id) ON DELETE CASCADE,
   usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
   data DATE NOT NULL,
-  sessao_id BIGINT REFERENCES sessoes_atividade(id) ON DELETE SET NULL,
+  sessao_id BIGINT,
+  sessao_inicio_em TIMESTAMPTZ,
   concluido BOOLEAN NOT NULL DEFAULT true,
   criado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
-  UNIQUE (meta_id, data)
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+  PRIMARY KEY (id, data),
+  UNIQUE (meta_id, data),
+  FOREIGN KEY (sessao_id, sessao_inicio_em) REFERENCES sessoes_atividade(id, inicio_em)
+    ON UPDATE CASCADE ON DELETE SET NULL
+) PARTITION BY RANGE (data);
+
+CREATE TABLE marcacoes_habito_padrao PARTITION OF marcacoes_habito DEFAULT;
+
+CREATE INDEX idx_marcacoes_usuario_data ON marcacoes_habito(usuario_id, data);
+
+CREATE TABLE recordes_pessoais (
+  id BIGSERIAL PRIMARY KEY,
+  usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+  exercicio_id BIGINT NOT NULL REFERENCES exercicios(id) ON DELETE CASCADE,
+  melhor_serie_id BIGINT REFERENCES series_musculacao(id) ON DELETE SET NULL,
+  carga_kg NUMERIC(6,2) NOT NULL,
+  repeticoes INTEGER NOT NULL,
+  rm_estimado_kg NUMERIC(7,2) NOT NULL,
+  carga_maxima_kg NUMERIC(6,2) NOT NULL,
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+  UNIQUE (usuario_id, exercicio_id)
 );
+
+CREATE INDEX idx_recordes_melhor_serie ON recordes_pessoais(melhor_serie_id);
+
+CREATE TABLE melhores_esforcos_corrida (
+  id BIGSERIAL PRIMARY KEY,
+  usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+  distancia_alvo VARCHAR(10) NOT NULL,
+  sessao_id BIGINT NOT NULL,
+  sessao_inicio_em TIMESTAMPTZ NOT NULL,
+  distancia_km NUMERIC(7,2) NOT NULL,
+  ritmo_medio_seg_km INTEGER NOT NULL,
+  tempo_estimado_seg INTEGER NOT NULL,
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+  UNIQUE (usuario_id, distancia_alvo),
+  FOREIGN KEY (sessao_id, sessao_inicio_em) REFERENCES sessoes_atividade(id, inicio_em)
+    ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+CREATE INDEX idx_melhores_esforcos_sessao ON melhores_esforcos_corrida(sessao_id);
+
+-- Mapa de calor de anos encerrados: contagens diárias (uma posição por dia
+-- do ano) de sessões e de hábitos concluídos. Anos em curso não são gravados.
+CREATE TABLE heatmaps_anuais (
+  usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+  ano SMALLINT NOT NULL,
+  sessoes SMALLINT[] NOT NULL,
+  habitos SMALLINT[] NOT NULL,
+  calculado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (usuario_id, ano)
+);
+
+-- Rankings semanais (opt-in): valor de cada participante por semana e
+-- categoria, e o histograma de valores usado para calcular a posição.
+CREATE TABLE rankings_semanais (
+  semana DATE NOT NULL,
+  categoria VARCHAR(20) NOT NULL,
+  usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+  valor NUMERIC(9,2) NOT NULL,
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (semana, categoria, usuario_id)
+);
+
+CREATE INDEX idx_rankings_ordem ON rankings_semanais(semana, categoria, valor DESC, usuario_id);
+CREATE INDEX idx_rankings_usuario ON rankings_semanais(usuario_id);
+
+CREATE TABLE rankings_contagens (
+  semana DATE NOT NULL,
+  categoria VARCHAR(20) NOT NULL,
+  valor NUMERIC(9,2) NOT NULL,
+  qtd INTEGER NOT NULL,
+  PRIMARY KEY (semana, categoria, valor)
+);
+
+-- Outbox transacional (core/outbox.py): tarefas de dados derivados gravadas
+-- na mesma transação da escrita que as origina e executadas pelo worker
+-- (`manage.py processar_outbox`). Linhas processadas são apagadas, então
+-- a tabela fica pequena; o autovacuum roda com mais frequência.
+CREATE TABLE eventos_outbox (
+  id BIGSERIAL PRIMARY KEY,
+  usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+  tipo VARCHAR(40) NOT NULL,
+  dados JSONB NOT NULL DEFAULT '{}',
+  criado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+  disponivel_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+  tentativas SMALLINT NOT NULL DEFAULT 0,
+  ultimo_erro TEXT,
+  -- Preenchido quando as tentativas se esgotam (fica para inspeção).
+  falhou_em TIMESTAMPTZ
+) WITH (autovacuum_vacuum_scale_factor = 0.01);
+
+CREATE INDEX idx_outbox_pendentes ON eventos_outbox(id) WHERE falhou_em IS NULL;
+
+-- ---------- SINCRONIZAÇÃO ----------
+
+-- Delta sync (core/sync.py, GET /api/sync/): cada tabela sincronizada tem
+-- atualizado_em (hora do relógio da escrita, mantida por trigger) e as
+-- exclusões viram lápides em exclusoes_sync. Com `SET LOCAL
+-- app.sem_exclusoes_sync = on` a transação não gera lápides (exclusão de
+-- conta, arquivamento e mudança de shard).
+CREATE TABLE exclusoes_sync (
+  id BIGSERIAL PRIMARY KEY,
+  usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+  tipo VARCHAR(30) NOT NULL,
+  registro_id BIGINT NOT NULL,
+  excluido_em TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX idx_exclusoes_sync_usuario ON exclusoes_sync(usuario_id, excluido_em, id);
+CREATE INDEX idx_exclusoes_sync_data ON exclusoes_sync(excluido_em);
+
+CREATE FUNCTION marcar_atualizado_em() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.atualizado_em := clock_timestamp();
+  RETURN NEW;
+END $$;
+
+-- Trigger por comando: uma inserção em lote por DELETE. As lápides de
+-- usuários já excluídos (CASCADE de usuarios) são descartadas.
+CREATE FUNCTION registrar_exclusoes_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF current_setting('app.sem_exclusoes_sync', true) = 'on' THEN
+    RETURN NULL;
+  END IF;
+  EXECUTE format(
+    'INSERT INTO exclusoes_sync (usuario_id, tipo, registro_id)
+     SELECT a.usuario_id, %L, a.%I FROM excluidas a
+     WHERE EXISTS (SELECT 1 FROM usuarios u WHERE u.id = a.usuario_id)',
+    TG_ARGV[0], TG_ARGV[1]);
+  RETURN NULL;
+END $$;
+
+CREATE INDEX idx_sessoes_atividade_sync ON sessoes_atividade(usuario_id, atualizado_em, id);
+CREATE INDEX idx_metricas_corrida_sync ON metricas_corrida(usuario_id, atualizado_em, sessao_id);
+CREATE INDEX idx_metricas_ciclismo_sync ON metricas_ciclismo(usuario_id, atualizado_em, sessao_id);
+CREATE INDEX idx_series_musculacao_sync ON series_musculacao(usuario_id, atualizado_em, id);
+CREATE INDEX idx_metas_habito_sync ON metas_habito(usuario_id, atualizado_em, id);
+CREATE INDEX idx_marcacoes_habito_sync ON marcacoes_habito(usuario_id, atualizado_em, id);
+
+CREATE TRIGGER sessoes_atividade_atualizado_em BEFORE UPDATE ON sessoes_atividade
+  FOR EACH ROW EXECUTE FUNCTION marcar_atualizado_em();
+CREATE TRIGGER metricas_corrida_atualizado_em BEFORE UPDATE ON metricas_corrida
+  FOR EACH ROW EXECUTE FUNCTION marcar_atualizado_em();
+CREATE TRIGGER metricas_ciclismo_atualizado_em BEFORE UPDATE ON metricas_ciclismo
+  FOR EACH ROW EXECUTE FUNCTION marcar_atualizado_em();
+CREATE TRIGGER series_musculacao_atualizado_em BEFORE UPDATE ON series_musculacao
+  FOR EACH ROW EXECUTE FUNCTION marcar_atualizado_em();
+CREATE TRIGGER metas_habito_atualizado_em BEFORE UPDATE ON metas_habito
+  FOR EACH ROW EXECUTE FUNCTION marcar_atualizado_em();
+CREATE TRIGGER marcacoes_habito_atualizado_em BEFORE UPDATE ON marcacoes_habito
+  FOR EACH ROW EXECUTE FUNCTION marcar_atualizado_em();
+
+CREATE TRIGGER sessoes_atividade_exclusoes_sync AFTER DELETE ON sessoes_atividade
+  REFERENCING OLD TABLE AS excluidas
+  FOR EACH STATEMENT EXECUTE FUNCTION registrar_exclusoes_sync('sessao', 'id');
+CREATE TRIGGER metricas_corrida_exclusoes_sync AFTER DELETE ON metricas_corrida
+  REFERENCING OLD TABLE AS excluidas
+  FOR EACH STATEMENT EXECUTE FUNCTION registrar_exclusoes_sync('metricas_corrida', 'sessao_id');
+CREATE TRIGGER metricas_ciclismo_exclusoes_sync AFTER DELETE ON metricas_ciclismo
+  REFERENCING OLD TABLE AS excluidas
+  FOR EACH STATEMENT EXECUTE FUNCTION registrar_exclusoes_sync('metricas_ciclismo', 'sessao_id');
+CREATE TRIGGER series_musculacao_exclusoes_sync AFTER DELETE ON series_musculacao
+  REFERENCING OLD TABLE AS excluidas
+  FOR EACH STATEMENT EXECUTE FUNCTION registrar_exclusoes_sync('serie', 'id');
+CREATE TRIGGER metas_habito_exclusoes_sync AFTER DELETE ON metas_habito
+  REFERENCING OLD TABLE AS excluidas
+  FOR EACH STATEMENT EXECUTE FUNCTION registrar_exclusoes_sync('meta', 'id');
+CREATE TRIGGER marcacoes_habito_exclusoes_sync AFTER DELETE ON marcacoes_habito
+  REFERENCING OLD TABLE AS excluidas
+  FOR EACH STATEMENT EXECUTE FUNCTION registrar_exclusoes_sync('marcacao', 'id');
+
+-- ---------- IDEMPOTÊNCIA ----------
+
+-- Respostas dos POST com Idempotency-Key (core/idempotencia.py). Chave e
+-- requisição ficam como digest de 16 bytes; `manage.py limpar_idempotencia`
+-- apaga as vencidas.
+CREATE TABLE chaves_idempotencia (
+  usuario_id BIGINT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+  chave BYTEA NOT NULL,
+  requisicao BYTEA NOT NULL,
+  -- Nulos só enquanto a primeira requisição não termina.
+  status SMALLINT,
+  resposta BYTEA,
+  expira_em TIMESTAMPTZ NOT NULL,
+  PRIMARY KEY (usuario_id, chave)
+) WITH (autovacuum_vacuum_scale_factor = 0.02);
+
+CREATE INDEX idx_chaves_idempotencia_expira ON chaves_idempotencia(expira_em);
+
+-- ---------- CACHE ----------
+
+-- Cache do Django (CACHES em app/settings.py), compartilhado pela API e
+-- pelo worker do outbox; mesmo formato do `manage.py createcachetable`.
+-- UNLOGGED: o conteúdo é descartável e não precisa passar pelo WAL.
+CREATE UNLOGGED TABLE IF NOT EXISTS cache_api (
+  cache_key VARCHAR(255) PRIMARY KEY,
+  value TEXT NOT NULL,
+  expires TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_api_expires ON cache_api(expires);
+
+-- ---------- PARTIÇÕES ----------
+
+-- Cria (se ainda não existir) a partição do trimestre que contém `dia`.
+-- A tabela é criada solta, com um CHECK equivalente aos limites, e depois
+-- anexada: o ATTACH usa o CHECK para pular a validação e trava a tabela
+-- pai só com SHARE UPDATE EXCLUSIVE, sem bloquear leituras e escritas.
+-- Limites de colunas timestamptz são em UTC.
+CREATE FUNCTION criar_particao_trimestral(tabela TEXT, dia DATE) RETURNS TEXT
+LANGUAGE plpgsql AS $$
+DECLARE
+  inicio DATE := date_trunc('quarter', dia)::date;
+  fim DATE := (date_trunc('quarter', dia) + interval '3 months')::date;
+  nome TEXT := format('%s_%s_t%s', tabela, extract(year FROM inicio), extract(quarter FROM inicio));
+  coluna TEXT;
+  tipo TEXT;
+  de TEXT;
+  ate TEXT;
+BEGIN
+  IF to_regclass(nome) IS NOT NULL THEN
+    RETURN NULL;
+  END IF;
+
+  SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+    INTO coluna, tipo
+  FROM pg_partitioned_table p
+  JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+  WHERE p.partrelid = tabela::regclass;
+
+  IF tipo = 'date' THEN
+    de := quote_literal(inicio);
+    ate := quote_literal(fim);
+  ELSE
+    de := quote_literal(inicio::text || ' 00:00:00+00');
+    ate := quote_literal(fim::text || ' 00:00:00+00');
+  END IF;
+
+  EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', nome, tabela);
+  EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I CHECK (%I >= %s AND %I < %s)',
+                 nome, nome || '_limites', coluna, de, coluna, ate);
+  EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%s) TO (%s)',
+                 tabela, nome, de, ate);
+  EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', nome, nome || '_limites');
+  RETURN nome;
+END;
+$$;
+
+-- Trimestres do ano anterior até o próximo ano; o comando
+-- gerenciar_particoes mantém os seguintes.
+SELECT criar_particao_trimestral(t.tabela, d::date)
+FROM (VALUES ('sessoes_atividade'), ('marcacoes_habito')) AS t(tabela)
+CROSS JOIN generate_series(
+  date_trunc('year', current_date) - interval '1 year',
+  date_trunc('year', current_date) + interval '1 year' + interval '9 months',
+  interval '3 months'
+) AS d;
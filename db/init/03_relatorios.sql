@@ -0,0 +1,75 @@
+-- Visões materializadas dos relatórios mensais (ops/admin).
+-- São atualizadas com REFRESH MATERIALIZED VIEW CONCURRENTLY pelo comando
+-- `python manage.py atualizar_relatorios`, que não bloqueia escritas nas
+-- tabelas base; por isso cada visão tem um índice único.
+-- Os meses das sessões são calculados em UTC.
+
+-- Usuários ativos, sessões, duração e distância por mês e modalidade.
+CREATE MATERIALIZED VIEW mv_resumo_mensal_modalidade AS
+SELECT date_trunc('month', s.inicio_em AT TIME ZONE 'UTC')::date AS mes,
+       s.modalidade,
+       count(DISTINCT s.usuario_id) AS usuarios_ativos,
+       count(*) AS sessoes,
+       COALESCE(sum(s.duracao_seg), 0)::bigint AS duracao_total_seg,
+       COALESCE(sum(COALESCE(mc.distancia_km, mci.distancia_km)), 0)::numeric(14,2)
+         AS distancia_total_km
+FROM sessoes_atividade s
+LEFT JOIN metricas_corrida mc ON mc.sessao_id = s.id
+LEFT JOIN metricas_ciclismo mci ON mci.sessao_id = s.id
+GROUP BY 1, 2;
+
+CREATE UNIQUE INDEX ux_mv_resumo_mensal_modalidade
+  ON mv_resumo_mensal_modalidade(mes, modalidade);
+
+-- Conclusão de hábitos por mês e modalidade da meta. Para metas com
+-- frequência semanal, as marcações esperadas são proporcionais aos dias
+-- em que a meta esteve ativa no mês; a taxa limita cada meta a 100%.
+CREATE MATERIALIZED VIEW mv_habitos_mensal AS
+WITH meses AS (
+  SELECT m.id AS meta_id,
+         m.modalidade,
+         m.frequencia_semana,
+         mes::date AS mes,
+         (LEAST(COALESCE(m.data_fim, current_date),
+                (mes + interval '1 month' - interval '1 day')::date)
+          - GREATEST(m.data_inicio, mes::date) + 1) AS dias_ativos
+  FROM metas_habito m
+  CROSS JOIN LATERAL generate_series(
+    date_trunc('month', m.data_inicio),
+    date_trunc('month', COALESCE(m.data_fim, current_date)),
+    interval '1 month'
+  ) AS mes
+),
+marcacoes AS (
+  SELECT meta_id,
+         date_trunc('month', data)::date AS mes,
+         count(*) FILTER (WHERE concluido) AS concluidas
+  FROM marcacoes_habito
+  GROUP BY 1, 2
+),
+por_meta AS (
+  SELECT me.mes, me.modalidade,
+         COALESCE(mc.concluidas, 0) AS concluidas,
+         me.frequencia_semana * me.dias_ativos / 7.0 AS esperadas
+  FROM meses me
+  LEFT JOIN marcacoes mc ON mc.meta_id = me.meta_id AND mc.mes = me.mes
+  WHERE me.dias_ativos > 0
+)
+SELECT mes,
+       modalidade,
+       count(*) AS metas_ativas,
+       sum(concluidas)::bigint AS marcacoes_concluidas,
+       round(COALESCE(sum(esperadas), 0), 1) AS marcacoes_esperadas,
+       round(100 * sum(LEAST(concluidas, esperadas)) / NULLIF(sum(esperadas), 0), 1)
+         AS taxa_conclusao_pct
+FROM por_meta
+GROUP BY 1, 2;
+
+CREATE UNIQUE INDEX ux_mv_habitos_mensal ON mv_habitos_mensal(mes, modalidade);
+
+-- Última atualização de cada visão (escrita pelo comando de refresh).
+CREATE TABLE relatorios_atualizacoes (
+  visao VARCHAR(63) PRIMARY KEY,
+  atualizado_em TIMESTAMPTZ NOT NULL,
+  duracao_ms INTEGER NOT NULL
+);
@@ -0,0 +1,14 @@
+#!/bin/bash
+# Cria os bancos dos shards (SHARD_DATABASES, separados por vírgula) com o
+# mesmo schema do banco principal. Depois de subir a aplicação, rode
+# `python manage.py preparar_shards` para separar as faixas de ids e
+# sincronizar o catálogo de exercícios.
+set -euo pipefail
+
+for nome in ${SHARD_DATABASES//,/ }; do
+  psql -v ON_ERROR_STOP=1 -U "$POSTGRES_USER" -d "$POSTGRES_DB" \
+    -c "CREATE DATABASE \"$nome\""
+  for arquivo in /docker-entrypoint-initdb.d/0[1-3]_*.sql; do
+    psql -v ON_ERROR_STOP=1 -U "$POSTGRES_USER" -d "$nome" -f "$arquivo"
+  done
+done